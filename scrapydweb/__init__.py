@@ -13,6 +13,7 @@ from logparser import __version__ as LOGPARSER_VERSION
 from .__version__ import __url__, __version__
 from .common import handle_metadata
 from .models import Metadata, db
+from .utils.settings import ScrapydWebConfig
 from .vars import PYTHON_VERSION, SQLALCHEMY_BINDS, SQLALCHEMY_DATABASE_URI
 # from .utils.scheduler import scheduler
 
@@ -61,6 +62,8 @@ def internal_server_error(error):
 
 def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
+    # Keep a version number of app.config for the Settings of MyView, see utils/settings.py
+    app.config = ScrapydWebConfig(app.config.root_path, app.config)
     app.config.from_mapping(
         SECRET_KEY='dev',
     )
@@ -162,10 +165,17 @@ def handle_route(app):
     register_view(MetadataView, 'metadata', [('metadata', None)])
 
     # Overview
-    from .views.overview.jobs import JobsView, JobsXhrView
+    from .views.overview.jobs import JobsView, JobsEventsView, JobsXhrView
     register_view(JobsView, 'jobs', [('jobs', None)])
+    register_view(JobsEventsView, 'jobs.events', [('jobs/events', None)])
     register_view(JobsXhrView, 'jobs.xhr', [('jobs/xhr/<action>/<int:id>', None)])
 
+    from .views.overview.cluster import ClusterView
+    register_view(ClusterView, 'cluster', [
+        ('cluster/<opt>', None),
+        ('cluster', dict(opt=None))
+    ])
+
     from .views.overview.servers import ServersView
     register_view(ServersView, 'servers', [
         ('servers/<opt>/<project>/<version_job>/<spider>', None),
@@ -218,8 +228,10 @@ def handle_route(app):
     app.register_blueprint(bp_schedule_history)
 
     # Files
-    from .views.files.log import LogView
+    from .views.files.log import LogView, LogEventsView, LogPollView
     register_view(LogView, 'log', [('log/<opt>/<project>/<spider>/<job>', None)])
+    register_view(LogEventsView, 'log.events', [('log/events/<project>/<spider>/<job>', dict(opt='stats'))])
+    register_view(LogPollView, 'log.poll', [('log/poll', None)])
 
     from .views.files.logs import LogsView
     register_view(LogsView, 'logs', [
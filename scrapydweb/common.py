@@ -1,7 +1,9 @@
 # coding: utf-8
+import atexit
 import json
 import os
 import re
+import threading
 import time
 import traceback
 
@@ -13,6 +15,7 @@ from requests.auth import _basic_auth_str
 
 from .__version__ import __version__
 from .models import Metadata, db
+from .vars import DATABASE_PATH
 
 
 session = requests.Session()
@@ -78,19 +81,105 @@ def get_response_from_view(url, auth=None, data=None, as_json=False):
         return text
 
 
-def handle_metadata(key=None, value=None):
-    with db.app.app_context():
-        metadata = Metadata.query.filter_by(version=__version__).first()
+# The metadata of the current version would be loaded once and reloaded only if metadata.db has been modified
+# by another process, e.g. 'scrapydweb --switch_scheduler_state' or another instance sharing the DATA_PATH.
+# Scheduler threads share the cache as they run in the same process.
+metadata_cache = {}
+# Modifications not committed yet, see handle_metadata(write_behind=True) and flush_metadata()
+metadata_pending = {}
+# Increments of the counters not committed yet, see increase_metadata()
+metadata_increments = {}
+metadata_lock = threading.RLock()
+METADATA_DATABASE_PATH = os.path.join(DATABASE_PATH, 'metadata.db')
+METADATA_FLUSH_INTERVAL = 60
+
+
+def get_metadata_stamp():
+    try:
+        stat = os.stat(METADATA_DATABASE_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def handle_metadata(key=None, value=None, write_behind=False):
+    """Get a copy of the metadata if key is None, else modify it.
+
+    The modification is applied to the cache at once. With write_behind set to True, it would be committed
+    along with other pending ones in the next flush_metadata(), which is triggered by the first write
+    METADATA_FLUSH_INTERVAL seconds after the last flush, or at exit.
+    """
+    with metadata_lock, db.app.app_context():
         if key is None:
-            # '_sa_instance_state': <sqlalchemy.orm.state.InstanceState object at 0x0000000005194080>,
-            return dict((k, v) for (k, v) in metadata.__dict__.items() if not k.startswith('_')) if metadata else {}
+            stamp = get_metadata_stamp()
+            if (metadata_cache.get('app') is not db.app or 'data' not in metadata_cache
+                    or metadata_cache.get('stamp') != stamp):
+                metadata = Metadata.query.filter_by(version=__version__).first()
+                if not metadata:
+                    return {}
+                # '_sa_instance_state': <sqlalchemy.orm.state.InstanceState object at 0x0000000005194080>,
+                data = dict((k, v) for (k, v) in metadata.__dict__.items() if not k.startswith('_'))
+                data.update(metadata_pending)
+                for k, v in metadata_increments.items():
+                    data[k] = (data.get(k) or 0) + v
+                metadata_cache.update(app=db.app, data=data, stamp=stamp)
+            return dict(metadata_cache['data'])
         else:
-            try:
-                setattr(metadata, key, value)
-                db.session.commit()
-            except:
-                print(traceback.format_exc())
-                db.session.rollback()
+            if metadata_cache.get('app') is db.app and 'data' in metadata_cache:
+                metadata_cache['data'][key] = value
+            metadata_pending[key] = value
+            if not write_behind or time.time() - metadata_cache.get('flushed_at', 0) > METADATA_FLUSH_INTERVAL:
+                flush_metadata()
+
+
+def increase_metadata(key, step=1):
+    # For counters like pageview, which are modified in every request and written behind.
+    # The increments are committed as 'SET key = key + n' so that those of other processes are kept,
+    # e.g. the gunicorn workers, see WSGI_SERVER.
+    with metadata_lock:
+        value = (handle_metadata().get(key) or 0) + step
+        if metadata_cache.get('app') is db.app and 'data' in metadata_cache:
+            metadata_cache['data'][key] = value
+        metadata_increments[key] = metadata_increments.get(key, 0) + step
+        if time.time() - metadata_cache.get('flushed_at', 0) > METADATA_FLUSH_INTERVAL:
+            flush_metadata()
+        return value
+
+
+def flush_metadata():
+    with metadata_lock, db.app.app_context():
+        metadata_cache['flushed_at'] = time.time()
+        if not metadata_pending and not metadata_increments:
+            return
+        increased = bool(metadata_increments)
+        query = Metadata.query.filter_by(version=__version__)
+        try:
+            if metadata_increments:
+                query.update(dict((getattr(Metadata, k), getattr(Metadata, k) + v)
+                                  for (k, v) in metadata_increments.items()), synchronize_session=False)
+            metadata = query.first()
+            for k, v in metadata_pending.items():
+                setattr(metadata, k, v)
+            db.session.commit()
+        except:
+            print(traceback.format_exc())
+            db.session.rollback()
+        finally:
+            metadata_pending.clear()
+            metadata_increments.clear()
+        if metadata_cache.get('app') is db.app:
+            if increased:  # Reload the counters along with the increments of other processes
+                metadata_cache.pop('data', None)
+            else:  # No need to reload the metadata modified by the current process
+                metadata_cache['stamp'] = get_metadata_stamp()
+
+
+def flush_metadata_at_exit():
+    if (metadata_pending or metadata_increments) and getattr(db, 'app', None) is not None:
+        flush_metadata()
+
+
+atexit.register(flush_metadata_at_exit)
 
 
 def handle_slash(string):
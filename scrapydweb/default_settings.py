@@ -44,6 +44,21 @@ CERTIFICATE_FILEPATH = ''
 # e.g. '/home/username/cert.key'
 PRIVATEKEY_FILEPATH = ''
 
+# The WSGI server to run ScrapydWeb, the default is 'werkzeug', the development server of Flask,
+# which serves all requests in a single process.
+# Set it to 'waitress' (pip install waitress) to use a multithreaded production server,
+# or 'gunicorn' (pip install gunicorn, not available on Windows) to serve with multiple worker processes
+# so that all CPU cores could be used. Note that HTTPS mode is not supported by waitress.
+# The LogParser and poll subprocesses and the scheduler for timer tasks always run in the main process.
+# With gunicorn, the counters like pageview are committed as increments, the cached total of jobs
+# is invalidated via a stamp file, and the state of the email notice is saved in the database,
+# whereas the caches of the parsed logs and the Scrapyd responses are kept by each worker process.
+WSGI_SERVER = 'werkzeug'
+# The number of worker processes of gunicorn, the default is 0, which means the number of CPU cores.
+WSGI_WORKERS = 0
+# The number of threads of each gunicorn worker, or of the waitress server, the default is 8.
+WSGI_THREADS = 8
+
 
 ############################## Scrapy #########################################
 # ScrapydWeb is able to locate projects in the SCRAPY_PROJECTS_DIR,
@@ -51,6 +66,11 @@ PRIVATEKEY_FILEPATH = ''
 # e.g. 'C:/Users/username/myprojects/' or '/home/username/myprojects/'
 SCRAPY_PROJECTS_DIR = ''
 
+# In multinode deployment, the egg is built only once and then uploaded to the remaining selected nodes
+# in a single request from the browser, with at most DEPLOY_CONCURRENCY uploads at a time.
+# The default is 10.
+DEPLOY_CONCURRENCY = 10
+
 
 ############################## Scrapyd ########################################
 # Make sure that [Scrapyd](https://github.com/scrapy/scrapyd) has been installed
@@ -102,11 +122,16 @@ SCRAPYD_LOG_EXTENSIONS = ['.log', '.log.gz', '.txt']
 # Visit https://github.com/my8100/logparser for more info.
 ENABLE_LOGPARSER = True
 
-# Whether to backup the stats json files locally after you visit the Stats page of a job
-# so that it is still accessible even if the original logfile has been deleted.
+# Whether to backup the stats of a job in the database (data/database/stats.db) after you visit
+# its Stats page, so that it is still accessible even if the original logfile has been deleted.
 # The default is True, set it to False to disable this behaviour.
 BACKUP_STATS_JSON_FILE = True
 
+# The backup stats and the series of crawl rates of jobs (see the 'trend' API)
+# which have not been updated for the last N days would be deleted.
+# The default is 30, set it to 0 to keep all the backup stats.
+BACKUP_STATS_RETENTION_DAYS = 30
+
 
 ############################## Timer Tasks ####################################
 # Run ScrapydWeb with argument '-sw' or '--switch_scheduler_state', or click the ENABLED|DISABLED button
@@ -118,6 +143,18 @@ BACKUP_STATS_JSON_FILE = True
 # Set it to 0 to disable this behaviour.
 JOBS_SNAPSHOT_INTERVAL = 300
 
+# The snapshot of the Jobs page is created for N Scrapyd servers concurrently,
+# and the request for each Scrapyd server would time out after JOBS_SNAPSHOT_TIMEOUT seconds.
+# Note that a Scrapyd server would be skipped for the next 1, 3, 7 ... (up to 16) rounds after consecutive failures.
+# The default is 10 and 60 respectively.
+JOBS_SNAPSHOT_CONCURRENCY = 10
+JOBS_SNAPSHOT_TIMEOUT = 60
+
+# A timer task is executed on up to N selected nodes concurrently,
+# and would be retried on a failed node twice, 3 and 6 seconds later respectively.
+# The default is 10.
+TIMER_TASK_CONCURRENCY = 10
+
 
 ############################## Run Spider #####################################
 # The default is False, set it to True to automatically
@@ -166,6 +203,31 @@ JOBS_FINISHED_JOBS_LIMIT = 0
 # The default is 300, set it to 0 to disable auto-reloading.
 JOBS_RELOAD_INTERVAL = 300
 
+# The parsed Jobs page of each Scrapyd server is cached for N seconds and shared by the Jobs page,
+# the snapshot of the Jobs page and the poll subprocess, it would be cleared once any job is
+# started or stopped via ScrapydWeb. The default is 5, set it to 0 to disable caching.
+JOBS_CACHE_TTL = 5
+
+# The Jobs page and the Stats page of running jobs would subscribe to the updates pushed by ScrapydWeb
+# via server-sent events every N seconds, so that the Jobs page would only be reloaded once the state
+# of any job changes, and the Stats page would be updated in place.
+# All the pages opened for the same node (or job) in the same process share the same poll of the Scrapyd server.
+# Note that the polls are not shared across processes, i.e. each gunicorn worker polls on its own.
+# The default is 10, set it to 0 to disable pushing and fall back to JOBS_RELOAD_INTERVAL.
+PUSH_INTERVAL = 10
+# Each page subscribing to the updates holds a thread of the WSGI server for up to 5 minutes,
+# so at most N pages would be served by each process at a time, the others fall back to JOBS_RELOAD_INTERVAL.
+# The limit is counted per process: N pages in total with 'werkzeug' or 'waitress' (e.g. the fifth page
+# with the default value would be reloaded instead), or N pages for each worker with 'gunicorn'.
+# Keep it below WSGI_THREADS (with waitress or gunicorn) so that there are threads left for the other requests.
+# The default is 4, set it to 0 to disable the limit.
+PUSH_MAX_STREAMS = 4
+
+# The Log page would only load the last N bytes of the logfile, and earlier content
+# can be loaded via the 'Load more' button. The default is 1048576 (1 MiB),
+# set it to 0 to load the whole logfile, which may exhaust the memory if the logfile is huge.
+LOG_TAIL_BYTES = 1048576
+
 # The load status of the current Scrapyd server is checked every N seconds,
 # which is displayed in the top right corner of the page.
 # The default is 10, set it to 0 to disable auto-refreshing.
@@ -248,6 +310,19 @@ POLL_ROUND_INTERVAL = 300
 # Sleep N seconds between each request to the Scrapyd server while polling, the default is 10.
 POLL_REQUEST_INTERVAL = 10
 
+# Poll up to N Scrapyd servers at the same time, the default is 1,
+# which means polling the Scrapyd servers one by one and sleeping POLL_REQUEST_INTERVAL seconds between requests.
+# Set it to an integer larger than 1 to enable concurrent polling, in which case POLL_REQUEST_INTERVAL is ignored
+# and the requests are throttled by POLL_CONCURRENCY_PER_NODE and POLL_RATE_LIMIT instead.
+POLL_CONCURRENCY = 1
+
+# Send at most N requests for each Scrapyd server at the same time in concurrent polling, the default is 1.
+POLL_CONCURRENCY_PER_NODE = 1
+
+# Send at most N requests per second in total in concurrent polling, the default is 10.
+# Set it to 0 to disable the rate limiting.
+POLL_RATE_LIMIT = 10
+
 ########## basic triggers ##########
 # Trigger email notice every N seconds for each running job.
 # The default is 0, set it to a positive integer to enable this trigger.
@@ -1,13 +1,21 @@
 # coding: utf-8
 from datetime import datetime
+import glob
+import io
+import json
+import logging
+import os
 from pprint import pformat
+import re
 import time
 
 from flask_sqlalchemy import SQLAlchemy
 
-from .vars import STATE_RUNNING
+from .vars import LEGAL_NAME_PATTERN, STATE_RUNNING, STATS_PATH
 
 
+logger = logging.getLogger(__name__)
+
 db = SQLAlchemy(session_options=dict(autocommit=False, autoflush=True))
 
 
@@ -38,44 +46,186 @@ class Metadata(db.Model):
         return pformat(vars(self))
 
 
-def create_jobs_table(server):
-    class Job(db.Model):
-        __tablename__ = server
-        __bind_key__ = 'jobs'
-        # https://stackoverflow.com/questions/10059345/sqlalchemy-unique-across-multiple-columns
-        # https://stackoverflow.com/questions/43975349/why-uniqueconstraint-doesnt-work-in-flask-sqlalchemy
-        __table_args__ = (db.UniqueConstraint('project', 'spider', 'job'), )
-
-        id = db.Column(db.Integer, primary_key=True)
-        project = db.Column(db.String(255), unique=False, nullable=False)  # Pending
-        spider = db.Column(db.String(255), unique=False, nullable=False)  # Pending
-        job = db.Column(db.String(255), unique=False, nullable=False)  # Pending
-        status = db.Column(db.String(1), unique=False, nullable=False, index=True)  # Pending 0, Running 1, Finished 2
-        deleted = db.Column(db.String(1), unique=False, nullable=False, default='0', index=True)
-        create_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now)
-        update_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now)
-
-        pages = db.Column(db.Integer, unique=False, nullable=True)
-        items = db.Column(db.Integer, unique=False, nullable=True)
-        pid = db.Column(db.Integer, unique=False, nullable=True)  # Running
-        start = db.Column(db.DateTime, unique=False, nullable=True, index=True)
-        runtime = db.Column(db.String(20), unique=False, nullable=True)
-        finish = db.Column(db.DateTime, unique=False, nullable=True, index=True)  # Finished
-        href_log = db.Column(db.String(1000), unique=False, nullable=True)
-        href_items = db.Column(db.String(1000), unique=False, nullable=True)
-
-        def __repr__(self):
-            return "<Job #%s in table %s, %s/%s/%s start: %s>" % (
-                self.id, self.__tablename__, self.project, self.spider, self.job, self.start)
-
-    return Job
-    # sqlalchemy/ext/declarative/clsregistry.py:128: SAWarning: This declarative base already contains a class
-    # with the same class name and module name as scrapydweb.models.Job,
-    # and will be replaced in the string-lookup table.
-    # https://stackoverflow.com/questions/27773489/dynamically-create-a-python-subclass-in-a-function
-    # return type('Job_%s' % server, (Job, ), dict(__tablename__=server,  __bind_key__='jobs'))
-
-# print(dir([create_table(s) for s in 'abc'][0]))
+# The jobs of all Scrapyd servers are saved in one table, partitioned by the server column,
+# which used to be saved in a separate table for each Scrapyd server, see migrate_jobs_tables() below.
+class Job(db.Model):
+    __tablename__ = 'job'
+    __bind_key__ = 'jobs'
+    # https://stackoverflow.com/questions/10059345/sqlalchemy-unique-across-multiple-columns
+    # https://stackoverflow.com/questions/43975349/why-uniqueconstraint-doesnt-work-in-flask-sqlalchemy
+    # The unique constraint also acts as the composite index of (server, project, spider, job)
+    __table_args__ = (db.UniqueConstraint('server', 'project', 'spider', 'job'),
+                      db.Index('ix_job_server_status_finish', 'server', 'status', 'finish'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    server = db.Column(db.String(255), unique=False, nullable=False)  # '127.0.0.1:6800'
+    project = db.Column(db.String(255), unique=False, nullable=False)  # Pending
+    spider = db.Column(db.String(255), unique=False, nullable=False)  # Pending
+    job = db.Column(db.String(255), unique=False, nullable=False)  # Pending
+    status = db.Column(db.String(1), unique=False, nullable=False, index=True)  # Pending 0, Running 1, Finished 2
+    deleted = db.Column(db.String(1), unique=False, nullable=False, default='0', index=True)
+    create_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now)
+    update_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now)
+
+    pages = db.Column(db.Integer, unique=False, nullable=True)
+    items = db.Column(db.Integer, unique=False, nullable=True)
+    pid = db.Column(db.Integer, unique=False, nullable=True)  # Running
+    start = db.Column(db.DateTime, unique=False, nullable=True, index=True)
+    runtime = db.Column(db.String(20), unique=False, nullable=True)
+    finish = db.Column(db.DateTime, unique=False, nullable=True, index=True)  # Finished
+    href_log = db.Column(db.String(1000), unique=False, nullable=True)
+    href_items = db.Column(db.String(1000), unique=False, nullable=True)
+
+    def __repr__(self):
+        return "<Job #%s of %s, %s/%s/%s start: %s>" % (
+            self.id, self.server, self.project, self.spider, self.job, self.start)
+
+
+# The state of the email notice of each job evaluated for the poll subprocess, see email_notice() in log.py,
+# which is saved in the database so that the triggers would not be fired again by another gunicorn worker.
+class JobNotice(db.Model):
+    __tablename__ = 'job_notice'
+    __bind_key__ = 'jobs'
+    __table_args__ = (db.UniqueConstraint('server', 'project', 'spider', 'job'), )
+
+    id = db.Column(db.Integer, primary_key=True)
+    server = db.Column(db.String(255), unique=False, nullable=False)  # '127.0.0.1:6800'
+    project = db.Column(db.String(255), unique=False, nullable=False)
+    spider = db.Column(db.String(255), unique=False, nullable=False)
+    job = db.Column(db.String(255), unique=False, nullable=False)
+    job_stats = db.Column(db.String(255), unique=False, nullable=False)  # Json list of the counts when last sent
+    triggered = db.Column(db.String(255), unique=False, nullable=False)  # Json list of EMAIL_TRIGGER_KEYS
+    has_been_stopped = db.Column(db.Boolean, unique=False, nullable=False, default=False)
+    last_send_timestamp = db.Column(db.Float, unique=False, nullable=False, default=time.time)
+    finished = db.Column(db.Boolean, unique=False, nullable=False, default=False)
+    update_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now, index=True)
+
+    def __repr__(self):
+        return "<JobNotice #%s of %s, %s/%s/%s updated at %s>" % (
+            self.id, self.server, self.project, self.spider, self.job, self.update_time)
+
+
+def migrate_jobs_tables(servers):
+    """Move the jobs in the per-server tables created by earlier versions into the table job."""
+    engine = db.get_engine(bind='jobs')
+    table_names = engine.table_names()
+    columns = [c.name for c in Job.__table__.columns if c.name not in ['id', 'server']]
+    migrated = {}
+    for server in servers:
+        table_name = re.sub(r'[^A-Za-z0-9_]', '_', server)  # See create_table() in jobs.py of earlier versions
+        if table_name not in table_names or table_name == Job.__tablename__:
+            continue
+        table = db.Table(table_name, db.MetaData(), autoload=True, autoload_with=engine)
+        # Skip the jobs already in the table job, e.g. left by an interrupted migration
+        job = Job.__table__
+        existing = db.exists().where(db.and_(job.c.server == server, job.c.project == table.c.project,
+                                             job.c.spider == table.c.spider, job.c.job == table.c.job))
+        select = db.select([db.literal(server)] + [table.c[c] for c in columns]).where(~existing)
+        with engine.begin() as conn:  # In a transaction so that the old table is dropped only if all rows are copied
+            conn.execute(job.insert().from_select(['server'] + columns, select))
+            table.drop(conn)
+        migrated[server] = table_name
+    return migrated
+
+
+# The stats of jobs backed up when visiting the Stats page, see BACKUP_STATS_JSON_FILE,
+# which used to be saved as a json file for each job in data/stats, see migrate_backup_stats() below.
+class Stats(db.Model):
+    __tablename__ = 'stats'
+    __bind_key__ = 'stats'
+    # The unique constraint also acts as the composite index of (server, project, spider, job)
+    __table_args__ = (db.UniqueConstraint('server', 'project', 'spider', 'job'), )
+
+    id = db.Column(db.Integer, primary_key=True)
+    server = db.Column(db.String(255), unique=False, nullable=False)  # '127.0.0.1:6800'
+    project = db.Column(db.String(255), unique=False, nullable=False)
+    spider = db.Column(db.String(255), unique=False, nullable=False)
+    job = db.Column(db.String(255), unique=False, nullable=False)  # Without extension
+    last_update_timestamp = db.Column(db.Float, unique=False, nullable=False)  # Of the stats
+    digest = db.Column(db.String(32), unique=False, nullable=True)  # Of the stats without last_update_timestamp
+    update_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now, index=True)
+    stats = db.Column(db.Text, unique=False, nullable=False)  # Compact json
+
+    def __repr__(self):
+        return "<Stats #%s of %s, %s/%s/%s updated at %s>" % (
+            self.id, self.server, self.project, self.spider, self.job, self.update_time)
+
+
+# The crawled pages and scraped items of a job over time, see utils/timeseries.py
+class JobSeries(db.Model):
+    __tablename__ = 'job_series'
+    __bind_key__ = 'stats'
+    __table_args__ = (db.UniqueConstraint('server', 'project', 'spider', 'job'),
+                      db.Index('ix_job_series_server_project_spider_start', 'server', 'project', 'spider', 'start'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    server = db.Column(db.String(255), unique=False, nullable=False)  # '127.0.0.1:6800'
+    project = db.Column(db.String(255), unique=False, nullable=False)
+    spider = db.Column(db.String(255), unique=False, nullable=False)
+    job = db.Column(db.String(255), unique=False, nullable=False)  # Without extension
+    start = db.Column(db.DateTime, unique=False, nullable=False)  # The time of the first log
+    latest_log_timestamp = db.Column(db.Integer, unique=False, nullable=False)
+    finished = db.Column(db.Boolean, unique=False, nullable=False, default=False)
+    update_time = db.Column(db.DateTime, unique=False, nullable=False, default=datetime.now, index=True)
+
+    duration = db.Column(db.Integer, unique=False, nullable=False)  # Seconds between the first and the last data
+    pages = db.Column(db.Integer, unique=False, nullable=False)
+    items = db.Column(db.Integer, unique=False, nullable=False)
+    interval = db.Column(db.Integer, unique=False, nullable=False)  # Seconds per point, doubled when downsampled
+    pages_series = db.Column(db.LargeBinary, unique=False, nullable=False)  # Array of cumulative counts
+    items_series = db.Column(db.LargeBinary, unique=False, nullable=False)
+
+    def __repr__(self):
+        return "<JobSeries #%s of %s, %s/%s/%s start: %s>" % (
+            self.id, self.server, self.project, self.spider, self.job, self.start)
+
+
+def migrate_backup_stats(servers):
+    """Move the stats json files in data/stats/<node>/<project>/<spider>/ into the table stats."""
+    migrated = {}
+    for server in servers:
+        # See mkdir_spider_path() in log.py of earlier versions
+        node_path = os.path.join(STATS_PATH, re.sub(LEGAL_NAME_PATTERN, '-', re.sub(r'[.:]', '_', server)))
+        if not os.path.isdir(node_path):
+            continue
+        existing = set(db.session.query(Stats.project, Stats.spider, Stats.job).filter_by(server=server))
+        records = []
+        # The files imported now or before, the others are kept for checking
+        imported_paths = []
+        for path in glob.glob(os.path.join(node_path, '*', '*', '*.json')):
+            spider_path, filename = os.path.split(path)
+            project_path, spider = os.path.split(spider_path)
+            project = os.path.basename(project_path)
+            job = filename[:-len('.json')]
+            if (project, spider, job) in existing:
+                imported_paths.append(path)
+                continue
+            try:
+                with io.open(path, 'r', encoding='utf-8') as f:
+                    stats = json.loads(f.read())
+            except Exception as err:
+                logger.warning("Skip the backup stats json file %s: %s", path, err)
+                continue
+            if not isinstance(stats, dict):
+                logger.warning("Skip the backup stats json file %s: %s", path, "not a json object")
+                continue
+            imported_paths.append(path)
+            records.append(dict(server=server, project=project, spider=spider, job=job,
+                                last_update_timestamp=stats.get('last_update_timestamp') or 0,
+                                update_time=datetime.fromtimestamp(os.path.getmtime(path)),
+                                stats=json.dumps(stats, ensure_ascii=False, separators=(',', ':'))))
+        db.session.bulk_insert_mappings(Stats, records)
+        db.session.commit()
+        for path in imported_paths:
+            os.remove(path)
+        for path in sorted(glob.glob(os.path.join(node_path, '*', '*')), reverse=True) + glob.glob(
+                os.path.join(node_path, '*')) + [node_path]:
+            try:
+                os.rmdir(path)  # Only if empty
+            except OSError:
+                pass
+        migrated[server] = len(records)
+    return migrated
 
 
 # http://flask-sqlalchemy.pocoo.org/2.3/models/    One-to-Many Relationships
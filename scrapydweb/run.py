@@ -13,6 +13,7 @@ from scrapydweb.__version__ import __description__, __version__
 from scrapydweb.common import authenticate, find_scrapydweb_settings_py, handle_metadata, handle_slash
 from scrapydweb.vars import SCHEDULER_STATE_DICT, STATE_PAUSED, STATE_RUNNING
 from scrapydweb.utils.check_app_config import check_app_config
+from scrapydweb.utils.server import run_server
 
 
 logger = logging.getLogger(__name__)
@@ -112,10 +113,11 @@ def main():
     print("{star}Visit ScrapydWeb at {protocol}://127.0.0.1:{port} "
           "or {protocol}://IP-OF-THE-CURRENT-HOST:{port}{star}\n".format(
            star=STAR, protocol=protocol, port=app.config['SCRAPYDWEB_PORT']))
-    logger.info("For running Flask in production, check out http://flask.pocoo.org/docs/1.0/deploying/")
+    if app.config.get('WSGI_SERVER', 'werkzeug') == 'werkzeug':
+        logger.info("For running in production, set up the WSGI_SERVER option in %s",
+                    handle_slash(app.config['SCRAPYDWEB_SETTINGS_PY_PATH']))
     apscheduler_logger.setLevel(logging.DEBUG)
-    app.run(host=app.config['SCRAPYDWEB_BIND'], port=app.config['SCRAPYDWEB_PORT'],
-            ssl_context=context, use_reloader=False)
+    run_server(app, ssl_context=context)
 
 
 def load_custom_settings(config):
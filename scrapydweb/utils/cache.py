@@ -0,0 +1,65 @@
+# coding: utf-8
+import threading
+import time
+
+
+class SingleFlightCache(object):
+    # Cache the result of func() for ttl seconds by key, concurrent callers of the same key
+    # would wait for the one in flight and share its result instead of calling func() again.
+    def __init__(self):
+        self.data = {}  # {key: (timestamp, value)}
+        self.generations = {}  # Bumped by invalidate() to discard the result of the call in flight
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        # Locks held by other threads at fork would never be released in the child process
+        self.__init__()
+
+    def get(self, key, func, ttl):
+        if ttl <= 0:
+            return func()
+        value = self.get_fresh(key, ttl)
+        if value is not None:
+            return value
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        with key_lock:
+            value = self.get_fresh(key, ttl)  # Set by the caller we were waiting for
+            if value is not None:
+                return value
+            generation = self.generations.get(key, 0)
+            value = func()
+            if generation == self.generations.get(key, 0):
+                self.data[key] = (time.time(), value)
+            return value
+
+    def get_fresh(self, key, ttl):
+        (timestamp, value) = self.data.get(key, (0, None))
+        if time.time() - timestamp < ttl:
+            return value
+        return None
+
+    def purge(self, max_age):
+        # Remove the results older than max_age seconds, along with the locks not held by any caller
+        now = time.time()
+        with self.lock:
+            for key, (timestamp, value) in list(self.data.items()):
+                if now - timestamp > max_age:
+                    self.data.pop(key, None)
+            for key, key_lock in list(self.locks.items()):
+                if key not in self.data and key_lock.acquire(False):
+                    self.locks.pop(key)
+                    self.generations.pop(key, None)
+                    key_lock.release()
+
+    def invalidate(self, key=None):
+        with self.lock:
+            keys = list(self.data.keys()) + list(self.generations.keys()) if key is None else [key]
+            for k in set(keys):
+                self.generations[k] = self.generations.get(k, 0) + 1
+                self.data.pop(k, None)
+
+
+# {scrapyd_server: (status_code, text, jobs)} of the Jobs page of Scrapyd
+jobs_cache = SingleFlightCache()
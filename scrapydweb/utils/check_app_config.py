@@ -1,21 +1,27 @@
 # coding: utf-8
+from importlib import import_module
 import logging
 from multiprocessing.dummy import Pool as ThreadPool
 import os
+import platform
 import re
+import time
 
 from ..common import handle_metadata, handle_slash, json_dumps, session
+from ..models import Job, Stats, migrate_backup_stats, migrate_jobs_tables
 from ..utils.scheduler import scheduler
 from ..vars import (ALLOWED_SCRAPYD_LOG_EXTENSIONS, EMAIL_TRIGGER_KEYS,
                     SCHEDULER_STATE_DICT, STATE_PAUSED, STATE_RUNNING,
-                    SCHEDULE_ADDITIONAL, UA_DICT)
+                    SCHEDULE_ADDITIONAL, UA_DICT, WSGI_SERVERS)
 from .send_email import send_email
 from .sub_process import init_logparser, init_poll
 
 
 logger = logging.getLogger(__name__)
 
-jobs_table_dict = {}
+# {node: dict(duration, failures, consecutive_failures, skip_rounds, ...)}, shown in the Settings page
+jobs_snapshot_stats = {}
+JOBS_SNAPSHOT_MAX_SKIP_ROUNDS = 16
 REPLACE_URL_NODE_PATTERN = re.compile(r'(:\d+/)\d+/')
 EMAIL_PATTERN = re.compile(r'^[^@]+@[^@]+\.[^@]+$')
 HASH = '#' * 100
@@ -87,6 +93,24 @@ def check_app_config(config):
             assert os.path.isfile(config[k]), "%s not found: %s" % (k, config[k])
         logger.info("Running in HTTPS mode: %s, %s", config['CERTIFICATE_FILEPATH'], config['PRIVATEKEY_FILEPATH'])
 
+    check_assert('WSGI_SERVER', 'werkzeug', str)
+    WSGI_SERVER = config.get('WSGI_SERVER', 'werkzeug')
+    assert WSGI_SERVER in WSGI_SERVERS, \
+        "WSGI_SERVER should be one of %s. Current value: '%s'" % (WSGI_SERVERS, WSGI_SERVER)
+    check_assert('WSGI_WORKERS', 0, int)
+    check_assert('WSGI_THREADS', 8, int, allow_zero=False)
+    if WSGI_SERVER != 'werkzeug':
+        if WSGI_SERVER == 'gunicorn':
+            assert platform.system() != 'Windows', "gunicorn is not available on Windows, try WSGI_SERVER = 'waitress'"
+        else:
+            assert not config.get('ENABLE_HTTPS', False), \
+                "HTTPS mode is not supported by waitress, try WSGI_SERVER = 'gunicorn' or set ENABLE_HTTPS to False"
+        try:
+            import_module(WSGI_SERVER)
+        except ImportError:
+            assert False, "Run 'pip install %s' to use WSGI_SERVER = '%s'" % (WSGI_SERVER, WSGI_SERVER)
+        logger.info("Running with WSGI_SERVER: %s", WSGI_SERVER)
+
     _protocol = 'https' if config.get('ENABLE_HTTPS', False) else 'http'
     _bind = config.get('SCRAPYDWEB_BIND', '0.0.0.0')
     _bind = '127.0.0.1' if _bind == '0.0.0.0' else _bind
@@ -100,9 +124,14 @@ def check_app_config(config):
     if SCRAPY_PROJECTS_DIR:
         assert os.path.isdir(SCRAPY_PROJECTS_DIR), "SCRAPY_PROJECTS_DIR not found: %s" % SCRAPY_PROJECTS_DIR
         logger.info("Setting up SCRAPY_PROJECTS_DIR: %s", handle_slash(SCRAPY_PROJECTS_DIR))
+    check_assert('DEPLOY_CONCURRENCY', 10, int, allow_zero=False)
 
     # Scrapyd
     check_scrapyd_servers(config)
+    for server, table_name in migrate_jobs_tables(config['SCRAPYD_SERVERS']).items():
+        logger.warning("Migrated the jobs of %s from table %s to table %s", server, table_name, Job.__tablename__)
+    for server, count in migrate_backup_stats(config['SCRAPYD_SERVERS']).items():
+        logger.warning("Migrated %s backup stats json files of %s to table %s", count, server, Stats.__tablename__)
 
     check_assert('SCRAPYD_LOGS_DIR', '', str)
     check_assert('LOCAL_SCRAPYD_SERVER', '', str)
@@ -148,6 +177,7 @@ def check_app_config(config):
              "on the current ScrapydWeb host.\nNote that you can run the LogParser service separately "
              "via command 'logparser' as you like. ")
     check_assert('BACKUP_STATS_JSON_FILE', True, bool)
+    check_assert('BACKUP_STATS_RETENTION_DAYS', 30, int)
 
     # Run Spider
     check_assert('SCHEDULE_EXPAND_SETTINGS_ARGUMENTS', False, bool)
@@ -179,6 +209,14 @@ def check_app_config(config):
     check_assert('SHOW_JOBS_JOB_COLUMN', False, bool)
     check_assert('JOBS_FINISHED_JOBS_LIMIT', 0, int)
     check_assert('JOBS_RELOAD_INTERVAL', 300, int)
+    check_assert('JOBS_CACHE_TTL', 5, int)
+    check_assert('PUSH_INTERVAL', 10, int)
+    check_assert('PUSH_MAX_STREAMS', 4, int)
+    if (config.get('WSGI_SERVER', 'werkzeug') != 'werkzeug' and config.get('PUSH_INTERVAL', 10) > 0
+       and not 0 < config.get('PUSH_MAX_STREAMS', 4) < config.get('WSGI_THREADS', 8)):
+        logger.warning("Set PUSH_MAX_STREAMS below WSGI_THREADS (%s), otherwise the pages subscribing to the updates "
+                       "could hold all the threads of the WSGI server", config.get('WSGI_THREADS', 8))
+    check_assert('LOG_TAIL_BYTES', 1048576, int)
     check_assert('DAEMONSTATUS_REFRESH_INTERVAL', 10, int)
 
     # Email Notice
@@ -223,6 +261,9 @@ def check_app_config(config):
 
         check_assert('POLL_ROUND_INTERVAL', 300, int, allow_zero=False)
         check_assert('POLL_REQUEST_INTERVAL', 10, int, allow_zero=False)
+        check_assert('POLL_CONCURRENCY', 1, int, allow_zero=False)
+        check_assert('POLL_CONCURRENCY_PER_NODE', 1, int, allow_zero=False)
+        check_assert('POLL_RATE_LIMIT', 10, int)
 
         check_assert('ON_JOB_RUNNING_INTERVAL', 0, int)
         check_assert('ON_JOB_FINISHED', False, bool)
@@ -249,6 +290,9 @@ def check_app_config(config):
     logger.info("Scheduler for timer tasks: %s", SCHEDULER_STATE_DICT[scheduler.state])
 
     check_assert('JOBS_SNAPSHOT_INTERVAL', 300, int)
+    check_assert('JOBS_SNAPSHOT_CONCURRENCY', 10, int, allow_zero=False)
+    check_assert('JOBS_SNAPSHOT_TIMEOUT', 60, int, allow_zero=False)
+    check_assert('TIMER_TASK_CONCURRENCY', 10, int, allow_zero=False)
     JOBS_SNAPSHOT_INTERVAL = config.get('JOBS_SNAPSHOT_INTERVAL', 300)
     if JOBS_SNAPSHOT_INTERVAL:
         # TODO: with app.app_context(): url = url_for('jobs', node=1)
@@ -260,7 +304,9 @@ def check_app_config(config):
             # 'http(s)://127.0.0.1:5000' + '/1/jobs/'
             url_jobs=config['URL_SCRAPYDWEB'] + handle_metadata().get('url_jobs', '/1/jobs/'),
             auth=(username, password) if username and password else None,
-            nodes=list(range(1, len(config['SCRAPYD_SERVERS']) + 1))
+            nodes=list(range(1, len(config['SCRAPYD_SERVERS']) + 1)),
+            concurrency=config.get('JOBS_SNAPSHOT_CONCURRENCY', 10),
+            timeout=config.get('JOBS_SNAPSHOT_TIMEOUT', 60)
         )
         logger.info(scheduler.add_job(id='jobs_snapshot', replace_existing=True,
                                       func=create_jobs_snapshot, args=None, kwargs=kwargs,
@@ -271,16 +317,42 @@ def check_app_config(config):
     init_subprocess(config)
 
 
-def create_jobs_snapshot(url_jobs, auth, nodes):
-    for node in nodes:
-        url_jobs = re.sub(REPLACE_URL_NODE_PATTERN, r'\g<1>%s/' % node, url_jobs, count=1)
+def create_jobs_snapshot(url_jobs, auth, nodes, concurrency=10, timeout=60):
+    # Nodes are handled concurrently so that a hung Scrapyd server would not delay the others
+    pool = ThreadPool(max(1, min(concurrency, len(nodes))))
+    pool.map(lambda node: create_jobs_snapshot_of_node(url_jobs, auth, node, timeout), nodes)
+    pool.close()
+    pool.join()
+
+
+def create_jobs_snapshot_of_node(url_jobs, auth, node, timeout):
+    stats = jobs_snapshot_stats.setdefault(node, dict(duration=0, failures=0, consecutive_failures=0,
+                                                      skip_rounds=0, last_error='', last_success=None))
+    # Back off a failing node by skipping the next 1, 3, 7 ... rounds
+    if stats['skip_rounds'] > 0:
+        stats['skip_rounds'] -= 1
+        return
+    url_jobs = re.sub(REPLACE_URL_NODE_PATTERN, r'\g<1>%s/' % node, url_jobs, count=1)
+    start_time = time.time()
+    try:
+        r = session.post(url_jobs, auth=auth, timeout=timeout)
+        assert r.status_code == 200, "Request got status_code: %s" % r.status_code
+        # The Jobs page would return the HTML of fail.html if the Scrapyd server is not available
         try:
-            r = session.post(url_jobs, auth=auth, timeout=60)
-            assert r.status_code == 200, "Request got status_code: %s" % r.status_code
-        except Exception as err:
-            print("Fail to create jobs snapshot: %s\n%s" % (url_jobs, err))
-        # else:
-        #     print(url_jobs, r.status_code)
+            r.json()
+        except ValueError:
+            raise AssertionError("Fail to request the Jobs page of the Scrapyd server")
+    except Exception as err:
+        print("Fail to create jobs snapshot: %s\n%s" % (url_jobs, err))
+        stats['failures'] += 1
+        stats['consecutive_failures'] += 1
+        stats['skip_rounds'] = min(2 ** (stats['consecutive_failures'] - 1) - 1, JOBS_SNAPSHOT_MAX_SKIP_ROUNDS)
+        stats['last_error'] = str(err)
+    else:
+        stats['consecutive_failures'] = 0
+        stats['last_success'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    finally:
+        stats['duration'] = round(time.time() - start_time, 3)
 
 
 def check_scrapyd_servers(config):
@@ -1,10 +1,13 @@
 # coding: utf-8
+import hashlib
 import json
 import logging
+from multiprocessing.dummy import Pool as ThreadPool
 import os
 import platform
 import re
 import sys
+import threading
 import time
 import traceback
 
@@ -39,6 +42,25 @@ JOB_PATTERN = re.compile(r"""
                             </tr>
                           """, re.X)
 JOB_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'runtime', 'finish', 'log', 'items']
+FINISHED_SECTION_PATTERN = re.compile(r">Finished</th>\s*</tr>")
+
+
+class RateLimiter(object):
+    # Allow at most N requests per second across all threads, 0 to disable
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.time()
+            seconds = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if seconds > 0:
+            time.sleep(seconds)
 
 
 class Poll(object):
@@ -47,7 +69,8 @@ class Poll(object):
     def __init__(self, url_scrapydweb, username, password,
                  scrapyd_servers, scrapyd_servers_auths,
                  poll_round_interval, poll_request_interval,
-                 main_pid, verbose, exit_timeout=0):
+                 main_pid, verbose, exit_timeout=0,
+                 poll_concurrency=1, poll_concurrency_per_node=1, poll_rate_limit=10):
         self.url_scrapydweb = url_scrapydweb
         self.auth = (username, password) if username and password else None
 
@@ -63,9 +86,17 @@ class Poll(object):
 
         self.poll_round_interval = poll_round_interval
         self.poll_request_interval = poll_request_interval
+        # Concurrent polling if poll_concurrency > 1, in which case poll_request_interval is ignored
+        self.poll_concurrency = max(1, poll_concurrency)
+        self.poll_concurrency_per_node = max(1, poll_concurrency_per_node)
+        self.rate_limiter = RateLimiter(poll_rate_limit)
 
         self.ignore_finished_bool_list = [True] * len(self.scrapyd_servers)
         self.finished_jobs_dict = {}
+        # For incremental fetch_jobs(): {node: (fingerprint, finished_jobs_set)}
+        self.finished_fingerprint_dict = {}
+        # {node: False} if listjobs.json of the Scrapyd server requires the project parameter
+        self.listjobs_json_dict = {}
 
         self.main_pid = main_pid
         self.poll_pid = os.getpid()
@@ -77,7 +108,9 @@ class Poll(object):
         self.exit_timeout = exit_timeout
 
         self.init_time = time.time()
-        self.url_stats = self.url_scrapydweb + '/{node}/log/{opt}/{project}/{spider}/{job}/?job_finished={job_finished}'
+        self.url_poll = self.url_scrapydweb + '/{node}/log/poll/'
+        self.url_api_jobs = self.url_scrapydweb + '/{node}/api/jobs/'
+        self.batch_size = 10
 
     def check_exit(self):
         exit_condition_1 = pid_exists is not None and not pid_exists(self.main_pid)
@@ -98,18 +131,74 @@ class Poll(object):
             return True
 
     def fetch_jobs(self, node, url, auth):
+        # listjobs.json without the project parameter is supported since Scrapyd v1.3.0
+        if self.listjobs_json_dict.get(node, True):
+            result = self.fetch_jobs_by_listjobs_json(node, re.sub(r'/jobs$', '/listjobs.json', url), auth)
+            if result is not None:
+                return result
+            self.listjobs_json_dict[node] = False
+            self.logger.info("[node %s] listjobs.json requires project, fall back to the Jobs page", node)
+
         running_jobs = []
-        finished_jobs_set = set()
         self.logger.debug("[node %s] fetch_jobs: %s", node, url)
         r = self.make_request(url, auth=auth, post=False)
+        if r is None:
+            self.listjobs_json_dict.pop(node, None)  # Check again in case that Scrapyd gets upgraded
+            # Fall back to the Jobs page cached by ScrapydWeb, see JOBS_CACHE_TTL in default_settings.py
+            result = self.fetch_jobs_by_api(node)
+            if result is not None:
+                return result
         # Should not invoke update_finished_jobs() if fail to fetch jobs
         assert r is not None, "[node %s] fetch_jobs failed: %s" % (node, url)
 
         self.logger.debug("[node %s] fetch_jobs got (%s) %s bytes", node, r.status_code, len(r.content))
         # Temp support for Scrapyd v1.3.0 (not released)
         text = re.sub(r'<thead>.*?</thead>', '', r.text, flags=re.S)
-        jobs = [dict(zip(JOB_KEYS, job)) for job in re.findall(JOB_PATTERN, text)]
-        for job in jobs:
+        # Only the rows of pending and running jobs keep changing, e.g. Runtime, so the finished ones
+        # would be parsed again only if their fingerprint changes.
+        m = re.search(FINISHED_SECTION_PATTERN, text)
+        if m:
+            text_unfinished, text_finished = text[:m.end()], text[m.end():]
+            fingerprint = hashlib.md5(text_finished.encode('utf-8')).hexdigest()
+        else:
+            text_unfinished, text_finished = text, ''
+            fingerprint = None
+        (fingerprint_previous, finished_jobs_set) = self.finished_fingerprint_dict.get(node, (None, None))
+        if fingerprint and fingerprint == fingerprint_previous:
+            self.logger.debug("[node %s] finished jobs unchanged: %s", node, fingerprint)
+            finished_jobs_set = set(finished_jobs_set)
+        else:
+            finished_jobs_set = set()
+            for job in [dict(zip(JOB_KEYS, job)) for job in re.findall(JOB_PATTERN, text_finished)]:
+                finished_jobs_set.add((job['project'], job['spider'], job['job']))
+            if fingerprint:
+                self.finished_fingerprint_dict[node] = (fingerprint, set(finished_jobs_set))
+
+        for job in [dict(zip(JOB_KEYS, job)) for job in re.findall(JOB_PATTERN, text_unfinished)]:
+            job_tuple = (job['project'], job['spider'], job['job'])
+            if job['pid']:
+                running_jobs.append(job_tuple)
+            elif job['finish']:
+                finished_jobs_set.add(job_tuple)
+        self.logger.info("[node %s] got running_jobs: %s", node, len(running_jobs))
+        self.logger.info("[node %s] got finished_jobs_set: %s", node, len(finished_jobs_set))
+        return running_jobs, finished_jobs_set
+
+    def fetch_jobs_by_api(self, node):
+        url = self.url_api_jobs.format(node=node)
+        self.logger.debug("[node %s] fetch_jobs: %s", node, url)
+        r = self.make_request(url, auth=self.auth, post=False)
+        if r is None:
+            return None
+        try:
+            js = r.json()
+        except ValueError:
+            return None
+        # ScrapydWeb is fine but the Scrapyd server is not
+        assert js.get('status') == 'ok', "[node %s] fetch_jobs failed: %s" % (node, js.get('message', url))
+        running_jobs = []
+        finished_jobs_set = set()
+        for job in js['jobs']:
             job_tuple = (job['project'], job['spider'], job['job'])
             if job['pid']:
                 running_jobs.append(job_tuple)
@@ -119,30 +208,49 @@ class Poll(object):
         self.logger.info("[node %s] got finished_jobs_set: %s", node, len(finished_jobs_set))
         return running_jobs, finished_jobs_set
 
-    def fetch_stats(self, node, job_tuple, finished_jobs):
-        (project, spider, job) = job_tuple
-        job_finished = 'True' if job_tuple in finished_jobs else ''
-        kwargs = dict(
-            node=node,
-            opt='stats',
-            project=project,
-            spider=spider,
-            job=job,
-            job_finished=job_finished
-        )
-        # http://127.0.0.1:5000/log/stats/proxy/test/55f1f388a7ae11e8b9b114dda9e91c2f/
-        url = self.url_stats.format(**kwargs)
-        self.logger.debug("[node %s] fetch_stats: %s", node, url)
-        # Make POST request to trigger email notice, see log.py
-        r = self.make_request(url, auth=self.auth, post=True)
+    def fetch_jobs_by_listjobs_json(self, node, url, auth):
+        self.logger.debug("[node %s] fetch_jobs: %s", node, url)
+        r = self.make_request(url, auth=auth, post=False)
+        assert r is not None, "[node %s] fetch_jobs failed: %s" % (node, url)
+        self.logger.debug("[node %s] fetch_jobs got (%s) %s bytes", node, r.status_code, len(r.content))
+        try:
+            js = r.json()
+            assert js['status'] == 'ok'
+            running_jobs = [(job['project'], job['spider'], job['id']) for job in js['running']]
+            finished_jobs_set = set([(job['project'], job['spider'], job['id']) for job in js['finished']])
+        except (AssertionError, KeyError, TypeError, ValueError):
+            return None
+        self.listjobs_json_dict[node] = True
+        self.logger.info("[node %s] got running_jobs: %s", node, len(running_jobs))
+        self.logger.info("[node %s] got finished_jobs_set: %s", node, len(finished_jobs_set))
+        return running_jobs, finished_jobs_set
+
+    def fetch_stats(self, node, job_tuples, finished_jobs):
+        # Evaluate stats and email triggers of a batch of jobs in one POST request, see LogPollView in log.py
+        jobs = [list(job_tuple) + ['True' if job_tuple in finished_jobs else ''] for job_tuple in job_tuples]
+        url = self.url_poll.format(node=node)
+        self.logger.debug("[node %s] fetch_stats of %s jobs: %s", node, len(jobs), url)
+        r = self.make_request(url, auth=self.auth, post=True, data=dict(jobs=json.dumps(jobs)),
+                              timeout=self.timeout * len(jobs))
         if r is None:
             self.logger.error("[node %s %s] fetch_stats failed: %s", node, self.scrapyd_servers[node-1], url)
-            if job_finished:
-                self.finished_jobs_dict[node].remove(job_tuple)
-                self.logger.warning("[node %s] retry in next round: %s", node, url)
+            failed_jobs = job_tuples
         else:
             self.logger.debug("[node %s] fetch_stats got (%s) %s bytes from %s",
                               node, r.status_code, len(r.content), url)
+            try:
+                results = r.json()['results']
+            except (KeyError, TypeError, ValueError) as err:
+                self.logger.error("[node %s] fetch_stats got invalid response: %s", node, err)
+                results = []
+            ok_jobs = set([(i['project'], i['spider'], i['job']) for i in results if i['status'] == 'ok'])
+            failed_jobs = [job_tuple for job_tuple in job_tuples if job_tuple not in ok_jobs]
+            if failed_jobs:
+                self.logger.error("[node %s] fetch_stats failed for jobs: %s", node, failed_jobs)
+        for job_tuple in failed_jobs:
+            if job_tuple in finished_jobs:
+                self.finished_jobs_dict[node].discard(job_tuple)
+                self.logger.warning("[node %s] retry in next round: %s", node, job_tuple)
 
     def main(self):
         while True:
@@ -164,12 +272,13 @@ class Poll(object):
             except Exception:
                 self.logger.error(traceback.format_exc())
 
-    def make_request(self, url, auth, post=False):
+    def make_request(self, url, auth, post=False, data=None, timeout=None):
+        timeout = timeout or self.timeout
         try:
             if post:
-                r = self.session.post(url, auth=auth, timeout=self.timeout)
+                r = self.session.post(url, auth=auth, data=data, timeout=timeout)
             else:
-                r = self.session.get(url, auth=auth, timeout=self.timeout)
+                r = self.session.get(url, auth=auth, timeout=timeout)
             r.encoding = 'utf-8'
             assert r.status_code == 200, "got status_code %s" % r.status_code
         except Exception as err:
@@ -179,28 +288,63 @@ class Poll(object):
             return r
 
     def run(self):
-        for node, (scrapyd_server, auth) in enumerate(zip(self.scrapyd_servers, self.scrapyd_servers_auths), 1):
-            # Update Jobs history
-            # url_jobs = self.url_scrapydweb + '/%s/jobs/' % node
-            # self.make_request(url_jobs, auth=self.auth, post=True)
-
-            url_jobs = 'http://%s/jobs' % scrapyd_server
-            # json.loads(json.dumps({'auth':(1,2)})) => {'auth': [1, 2]}
-            auth = tuple(auth) if auth else None  # TypeError: 'list' object is not callable
-            try:
-                running_jobs, finished_jobs_set = self.fetch_jobs(node, url_jobs, auth)
-                finished_jobs = self.update_finished_jobs(node, finished_jobs_set)
-                for job_tuple in running_jobs + finished_jobs:
-                    self.fetch_stats(node, job_tuple, finished_jobs)
+        nodes = list(range(1, len(self.scrapyd_servers) + 1))
+        if self.poll_concurrency > 1 and len(nodes) > 1:
+            pool = ThreadPool(min(self.poll_concurrency, len(nodes)))
+            pool.map(self.poll_node, nodes)
+            pool.close()
+            pool.join()
+        else:
+            for node in nodes:
+                self.poll_node(node)
+
+    def poll_node(self, node):
+        scrapyd_server = self.scrapyd_servers[node-1]
+        auth = self.scrapyd_servers_auths[node-1]
+        # Update Jobs history
+        # url_jobs = self.url_scrapydweb + '/%s/jobs/' % node
+        # self.make_request(url_jobs, auth=self.auth, post=True)
+
+        url_jobs = 'http://%s/jobs' % scrapyd_server
+        # json.loads(json.dumps({'auth':(1,2)})) => {'auth': [1, 2]}
+        auth = tuple(auth) if auth else None  # TypeError: 'list' object is not callable
+        try:
+            if self.poll_concurrency > 1:
+                self.rate_limiter.wait()
+            running_jobs, finished_jobs_set = self.fetch_jobs(node, url_jobs, auth)
+            finished_jobs = self.update_finished_jobs(node, finished_jobs_set)
+            job_tuples = running_jobs + finished_jobs
+            batches = [job_tuples[i:i+self.batch_size] for i in range(0, len(job_tuples), self.batch_size)]
+            if self.poll_concurrency > 1:
+                self.fetch_stats_concurrently(node, batches, finished_jobs)
+            else:
+                for batch in batches:
+                    self.fetch_stats(node, batch, finished_jobs)
                     self.logger.debug("Sleep %s seconds", self.poll_request_interval)
                     time.sleep(self.poll_request_interval)
-            except KeyboardInterrupt:
-                raise
-            except AssertionError as err:
-                self.logger.error(err)
+        except KeyboardInterrupt:
+            raise
+        except AssertionError as err:
+            self.logger.error(err)
+        except Exception:
+            self.logger.error(traceback.format_exc())
+
+    def fetch_stats_concurrently(self, node, batches, finished_jobs):
+        def fetch(batch):
+            self.rate_limiter.wait()
+            try:
+                self.fetch_stats(node, batch, finished_jobs)
             except Exception:
                 self.logger.error(traceback.format_exc())
 
+        if not batches:
+            return
+        # Limit the number of requests in flight for each node
+        pool = ThreadPool(min(self.poll_concurrency_per_node, len(batches)))
+        pool.map(fetch, batches)
+        pool.close()
+        pool.join()
+
     def update_finished_jobs(self, node, finished_jobs_set):
         finished_jobs_set_previous = self.finished_jobs_dict.setdefault(node, set())
         self.logger.info("[node %s] previous finished_jobs_set: %s", node, len(finished_jobs_set_previous))
@@ -230,7 +374,8 @@ def main(args):
     keys = ('url_scrapydweb', 'username', 'password',
             'scrapyd_servers', 'scrapyd_servers_auths',
             'poll_round_interval', 'poll_request_interval',
-            'main_pid', 'verbose', 'exit_timeout')
+            'main_pid', 'verbose', 'exit_timeout',
+            'poll_concurrency', 'poll_concurrency_per_node', 'poll_rate_limit')
     kwargs = dict(zip(keys, args))
     kwargs['scrapyd_servers'] = json.loads(kwargs['scrapyd_servers'])
     kwargs['scrapyd_servers_auths'] = json.loads(kwargs['scrapyd_servers_auths'])
@@ -239,6 +384,9 @@ def main(args):
     kwargs['main_pid'] = int(kwargs['main_pid'])
     kwargs['verbose'] = kwargs['verbose'] == 'True'
     kwargs['exit_timeout'] = int(kwargs.setdefault('exit_timeout', 0))  # For test only
+    kwargs['poll_concurrency'] = int(kwargs.setdefault('poll_concurrency', 1))
+    kwargs['poll_concurrency_per_node'] = int(kwargs.setdefault('poll_concurrency_per_node', 1))
+    kwargs['poll_rate_limit'] = int(kwargs.setdefault('poll_rate_limit', 10))
 
     poll = Poll(**kwargs)
     poll.main()
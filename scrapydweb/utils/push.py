@@ -0,0 +1,102 @@
+# coding: utf-8
+# Server-sent events for the Jobs and Stats pages, see PUSH_INTERVAL.
+# The poll of each event stream goes through a SingleFlightCache with ttl=PUSH_INTERVAL,
+# so that all the pages opened for the same node (or job) cost only one poll of the Scrapyd server
+# per process (each gunicorn worker polls on its own), and only the deltas since the previous poll
+# would be sent to the browser.
+# Since each stream holds a thread of the WSGI server, at most PUSH_MAX_STREAMS streams are served
+# by each process at a time, and the other pages are told to fall back to JOBS_RELOAD_INTERVAL.
+import json
+import threading
+import time
+
+from flask import Response, stream_with_context
+
+from .cache import SingleFlightCache
+
+
+# A stream would be closed after N seconds to release the thread, and EventSource would reconnect
+PUSH_STREAM_DURATION = 300
+
+# {('jobs', scrapyd_server) or ('stats', job_key, realtime): the data polled for the event stream}
+events_cache = SingleFlightCache()
+# The data not polled for N seconds, i.e. without any subscribers, would be removed from events_cache
+EVENTS_CACHE_MAX_AGE = PUSH_STREAM_DURATION
+events_cache_purged = dict(timestamp=time.time())
+
+# The number of the event streams being served by this process
+streams = dict(count=0)
+streams_lock = threading.Lock()
+
+
+def poll_events(key, func, interval):
+    """Return the result of func() cached for interval seconds, see events_cache."""
+    now = time.time()
+    if now - events_cache_purged['timestamp'] > EVENTS_CACHE_MAX_AGE:
+        events_cache_purged['timestamp'] = now
+        events_cache.purge(EVENTS_CACHE_MAX_AGE)
+    return events_cache.get(key, func, ttl=interval)
+
+
+def diff(previous, current):
+    """Return dict(updated, removed) of the dict current compared with the dict previous."""
+    updated = dict((k, v) for (k, v) in current.items() if k not in previous or previous[k] != v)
+    removed = [k for k in previous if k not in current]
+    return dict(updated=updated, removed=removed)
+
+
+def format_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, ensure_ascii=False, sort_keys=True))
+
+
+def generate_events(event, poll, interval, until=None, duration=PUSH_STREAM_DURATION):
+    """Yield an event with the whole data returned by poll() first, and then the deltas every interval seconds.
+
+    :param poll: return a dict, or None if failed
+    :param until: stop once until(data) returns True
+    """
+    # Tell EventSource to reconnect after the interval
+    yield 'retry: %s\n\n' % (interval * 1000)
+    previous = {}
+    deadline = time.time() + duration
+    while True:
+        current = poll()
+        if current is None:
+            yield format_event('failure', dict(when=time.time()))
+        else:
+            delta = diff(previous, current)
+            if delta['updated'] or delta['removed']:
+                yield format_event(event, delta)
+            else:
+                yield ': keepalive\n\n'  # A comment line, to detect the closed connection
+            previous = current
+            if until and until(current):
+                yield format_event('done', dict(when=time.time()))
+                return
+        if time.time() + interval > deadline:
+            return
+        time.sleep(interval)
+
+
+def limit_streams(generator, max_streams):
+    """Yield from generator if there are less than max_streams streams being served, otherwise yield a 'busy'
+    event, so that the page would stop reconnecting and fall back to reloading."""
+    with streams_lock:
+        busy = max_streams > 0 and streams['count'] >= max_streams
+        if not busy:
+            streams['count'] += 1
+    if busy:
+        yield format_event('busy', dict(when=time.time(), max_streams=max_streams))
+        return
+    try:
+        for chunk in generator:
+            yield chunk
+    finally:
+        with streams_lock:
+            streams['count'] -= 1
+
+
+def make_event_stream(generator, max_streams=0):
+    # The request context is kept for the generator, see LogEventsView
+    return Response(stream_with_context(limit_streams(generator, max_streams)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
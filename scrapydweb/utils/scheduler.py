@@ -1,16 +1,22 @@
 # coding: utf-8
 import atexit
+import io
 import logging
+import os
 from pprint import pformat
+import time
 
-from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_REMOVED
+from apscheduler.events import (EVENT_ALL_JOBS_REMOVED, EVENT_JOB_ADDED, EVENT_JOB_MAX_INSTANCES,
+                                EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED)
 from apscheduler.executors.pool import ThreadPoolExecutor  # , ProcessPoolExecutor
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
 
 from ..common import handle_metadata
-from ..vars import APSCHEDULER_DATABASE_URI, TIMER_TASKS_HISTORY_LOG
+from ..vars import APSCHEDULER_DATABASE_URI, DATABASE_PATH, TIMER_TASKS_HISTORY_LOG
+from .cache import SingleFlightCache
 
 
 apscheduler_logger = logging.getLogger('apscheduler')
@@ -86,11 +92,66 @@ def my_listener(event):
 # EVENT_JOB_ERROR and EVENT_JOB_MISSED are caught by logging.FileHandler
 scheduler.add_listener(my_listener, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_REMOVED)
 
+
+# Loading all the timer tasks from the SQLAlchemyJobStore in every request is expensive,
+# so the result is cached until any timer task is added, modified (paused or resumed) or removed.
+# The events are only fired in the process making the change, so the stamp file is rewritten as well,
+# and the other processes (the gunicorn workers) would drop their cache in sync_scheduler_state().
+# The ttl is only a safeguard in case of any missing event.
+scheduler_cache = SingleFlightCache()
+SCHEDULER_CACHE_TTL = 300
+SCHEDULER_JOBS_STAMP_PATH = os.path.join(DATABASE_PATH, 'scheduler_jobs.stamp')
+# The stamp seen by the current process
+scheduler_jobs_stamp = {}
+
+
+def get_scheduler_jobs_stamp():
+    try:
+        stat = os.stat(SCHEDULER_JOBS_STAMP_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def any_running_apscheduler_jobs():
+    return scheduler_cache.get('any_running_apscheduler_jobs', ttl=SCHEDULER_CACHE_TTL,
+                               func=lambda: any(job.next_run_time for job in scheduler.get_jobs(jobstore='default')))
+
+
+def invalidate_scheduler_cache(event):
+    if getattr(event, 'jobstore', 'default') != 'memory':
+        scheduler_cache.invalidate()
+        with io.open(SCHEDULER_JOBS_STAMP_PATH, 'w', encoding='utf-8') as f:
+            f.write(u'%r %s' % (time.time(), os.getpid()))
+
+
+scheduler.add_listener(invalidate_scheduler_cache,
+                       EVENT_JOB_ADDED | EVENT_JOB_MODIFIED | EVENT_JOB_REMOVED | EVENT_ALL_JOBS_REMOVED)
+
 # if scheduler.state == STATE_STOPPED:
 scheduler.start(paused=True)
+# Worker processes forked by gunicorn inherit the scheduler without its thread, so that they could
+# only modify the jobstores, and the jobs would be executed in the main process, see utils/server.py
+scheduler_pid = os.getpid()
+
+
+def sync_scheduler_state():
+    # The timer tasks may have been modified in another process, e.g. a gunicorn worker
+    stamp = get_scheduler_jobs_stamp()
+    if stamp != scheduler_jobs_stamp.get('stamp'):
+        scheduler_cache.invalidate()
+        scheduler_jobs_stamp['stamp'] = stamp
+    # The state may have been switched in another process as well
+    scheduler_state = handle_metadata().get('scheduler_state', STATE_RUNNING)
+    if scheduler_state == STATE_PAUSED and scheduler.state == STATE_RUNNING:
+        scheduler.pause()
+    elif scheduler_state == STATE_RUNNING and scheduler.state == STATE_PAUSED:
+        scheduler.resume()
 
 
 def shutdown_scheduler():
+    if os.getpid() != scheduler_pid:
+        return
     apscheduler_logger.info("Scheduled tasks: %s", scheduler.get_jobs())
     apscheduler_logger.warning("Shutting down the scheduler for timer tasks gracefully, "
                                "wait until all currently executing tasks are finished")
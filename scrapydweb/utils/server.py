@@ -0,0 +1,100 @@
+# coding: utf-8
+# Run ScrapydWeb with the WSGI server set up by the WSGI_SERVER option
+import logging
+import multiprocessing
+import threading
+import time
+import traceback
+
+from .. import common
+from ..models import db
+from . import service
+from .cache import jobs_cache
+from .push import events_cache
+from .scheduler import jobstores, scheduler, scheduler_cache, sync_scheduler_state
+
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_SYNC_INTERVAL = 5
+
+
+def run_server(app, ssl_context=None):
+    host = app.config['SCRAPYDWEB_BIND']
+    port = app.config['SCRAPYDWEB_PORT']
+    wsgi_server = app.config.get('WSGI_SERVER', 'werkzeug')
+    if wsgi_server == 'gunicorn':
+        run_gunicorn(app, host, port, ssl_context=ssl_context,
+                     workers=app.config.get('WSGI_WORKERS', 0), threads=app.config.get('WSGI_THREADS', 8))
+    elif wsgi_server == 'waitress':
+        from waitress import serve
+        serve(app, host=host, port=port, threads=app.config.get('WSGI_THREADS', 8))
+    else:
+        app.run(host=host, port=port, ssl_context=ssl_context, use_reloader=False)
+
+
+def run_gunicorn(app, host, port, ssl_context=None, workers=0, threads=8):
+    # The main process, which has started the LogParser and poll subprocesses and runs the scheduler,
+    # becomes the gunicorn arbiter, and all requests are served by the forked worker processes.
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        init_worker(app)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    options = dict(
+        bind='%s:%s' % (host, port),
+        workers=workers or multiprocessing.cpu_count(),
+        threads=threads,
+        worker_class='gthread',
+        preload_app=True,
+        post_fork=post_fork,
+    )
+    if ssl_context:
+        options.update(certfile=ssl_context[0], keyfile=ssl_context[1])
+    app.before_request(sync_scheduler_state)
+    start_scheduler_sync()
+    Application().run()
+
+
+def init_worker(app):
+    # Database connections and HTTP connections must not be shared with the main process,
+    # and the locks might be held by the threads of the main process at fork.
+    with app.app_context():
+        for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {}):
+            db.get_engine(app, bind=bind).dispose()
+    jobstores['default'].engine.dispose()
+    # Including the locks of APScheduler since the timer tasks are added and modified in the workers
+    scheduler._jobstores_lock = scheduler._create_lock()
+    scheduler._executors_lock = scheduler._create_lock()
+    scheduler._listeners_lock = scheduler._create_lock()
+    common.metadata_lock = threading.RLock()
+    service.nodes_lock = threading.Lock()
+    service.sessions.clear()
+    service.circuit_breakers.clear()
+    jobs_cache.reset()
+    events_cache.reset()
+    scheduler_cache.reset()
+
+
+def start_scheduler_sync(interval=SCHEDULER_SYNC_INTERVAL):
+    # Pick up the scheduler state and the jobs modified by the workers
+    def sync():
+        while True:
+            time.sleep(interval)
+            try:
+                sync_scheduler_state()
+                scheduler.wakeup()
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    thread = threading.Thread(target=sync)
+    thread.daemon = True
+    thread.start()
@@ -0,0 +1,323 @@
+# coding: utf-8
+# Operations shared by the views and the timer task executor, which used to be done via get_response_from_view()
+import json
+import logging
+from multiprocessing.dummy import Pool as ThreadPool
+import re
+import threading
+import time
+
+from flask import current_app as app
+import requests
+from requests.adapters import HTTPAdapter
+from six.moves.queue import Empty, Queue
+from six.moves.urllib.parse import urlparse
+
+from ..common import get_now_string, json_dumps
+from ..models import Task
+from ..vars import DEFAULT_LATEST_VERSION
+from .cache import jobs_cache
+
+
+OK = 'ok'
+ERROR = 'error'
+NA = 'N/A'
+
+DEFAULT_TIMEOUT = 60
+# In seconds, keyed by the last part of the path of url, e.g. 'stats.json' for '/logs/stats.json'
+ENDPOINT_TIMEOUTS = {
+    'daemonstatus.json': 10,
+    'listprojects.json': 30,
+    'listversions.json': 30,
+    'listjobs.json': 30,
+    'addversion.json': 300,
+}
+# GET requests to these cheap endpoints would be sent again if there is no response in time,
+# and the first response wins. The other endpoints are not hedged since a slow node would only get slower
+# with the load doubled, and the losing request keeps running until it times out, see ENDPOINT_TIMEOUTS.
+HEDGE_DELAYS = {
+    'daemonstatus.json': 1,
+}
+POOL_MAXSIZE = 20
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RECOVERY_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+# {netloc: requests.Session}, so that a slow Scrapyd server could only use up its own connections
+sessions = {}
+# {netloc: CircuitBreaker}
+circuit_breakers = {}
+nodes_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker(object):
+    """Fail fast for a Scrapyd server after CIRCUIT_FAILURE_THRESHOLD consecutive connection errors or timeouts.
+
+    A single trial request is let through every CIRCUIT_RECOVERY_TIMEOUT seconds, and the circuit
+    would be closed once it succeeds.
+    """
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, recovery_timeout=CIRCUIT_RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.recovery_timeout:
+                self.opened_at = time.time()  # The other requests keep failing fast during the trial
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+def get_session(netloc):
+    with nodes_lock:
+        session = sessions.get(netloc)
+        if session is None:
+            session = sessions[netloc] = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+
+def get_circuit_breaker(netloc):
+    with nodes_lock:
+        return circuit_breakers.setdefault(netloc, CircuitBreaker())
+
+
+def send_request(url, data=None, auth=None, headers=None, timeout=None, hedge=True, files=None, stream=False,
+                 logger=logger):
+    """Return the requests.Response, or raise requests.exceptions.RequestException, CircuitOpenError included.
+
+    :param timeout: None to use ENDPOINT_TIMEOUTS
+    :param files: dict of files to post as multipart/form-data, see make_request()
+    :param hedge: whether to hedge the GET request if the endpoint is in HEDGE_DELAYS
+    :param stream: whether to defer downloading the content of the GET response, which is never hedged
+    """
+    netloc = urlparse(url).netloc
+    endpoint = urlparse(url).path.rsplit('/', 1)[-1]
+    timeout = timeout or ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+    session = get_session(netloc)
+    circuit_breaker = get_circuit_breaker(netloc)
+    if not circuit_breaker.allow():
+        raise CircuitOpenError("Fail fast since %s has failed %s times in a row, would retry in %s seconds" % (
+                               netloc, circuit_breaker.failures, circuit_breaker.recovery_timeout))
+    try:
+        if data or files:
+            r = session.post(url, data=data, files=files, auth=auth, headers=headers, timeout=timeout)
+        elif hedge and not stream and endpoint in HEDGE_DELAYS:
+            r = send_hedged_get(session, url, auth, headers, timeout, HEDGE_DELAYS[endpoint], logger)
+        else:
+            r = session.get(url, auth=auth, headers=headers, timeout=timeout, stream=stream)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        circuit_breaker.record_failure()
+        raise
+    circuit_breaker.record_success()
+    return r
+
+
+def send_hedged_get(session, url, auth, headers, timeout, hedge_delay, logger=logger):
+    results = Queue()
+
+    def get():
+        try:
+            results.put((True, session.get(url, auth=auth, headers=headers, timeout=timeout)))
+        except Exception as err:
+            results.put((False, err))
+
+    def start():
+        thread = threading.Thread(target=get)
+        thread.daemon = True
+        thread.start()
+
+    attempts = 1
+    start()
+    try:
+        ok, result = results.get(timeout=hedge_delay)
+    except Empty:
+        logger.debug("Hedge GET %s after %s seconds", url, hedge_delay)
+        attempts += 1
+        start()
+        ok, result = results.get()
+    # Wait for the other attempt only if the first one failed
+    if not ok and attempts > 1:
+        ok, result = results.get()
+    if ok:
+        return result
+    raise result
+
+
+def make_requests(kwargs_list, concurrency=10, logger=logger):
+    """Call make_request() concurrently with each dict in kwargs_list, and return the results in order.
+
+    Usage::
+
+      >>> make_requests([dict(url='http://127.0.0.1:6800/daemonstatus.json'),
+      ...                dict(url='http://127.0.0.1:6801/daemonstatus.json', auth=('admin', '12345'))])
+    """
+    if not kwargs_list:
+        return []
+    pool = ThreadPool(max(1, min(concurrency, len(kwargs_list))))
+    try:
+        return pool.map(lambda kwargs: make_request(logger=logger, **kwargs), kwargs_list)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def imake_requests(kwargs_list, concurrency=10, logger=logger):
+    """Like make_requests(), but yield (index, result) as soon as each request is done."""
+    if not kwargs_list:
+        return
+    pool = ThreadPool(max(1, min(concurrency, len(kwargs_list))))
+    try:
+        for index, result in pool.imap_unordered(
+                lambda args: (args[0], make_request(logger=logger, **args[1])), list(enumerate(kwargs_list))):
+            yield index, result
+    finally:
+        pool.close()
+        pool.join()
+
+
+def make_request(url, data=None, auth=None, as_json=True, dumps_json=True, timeout=None, logger=logger):
+    """
+    :param url: url to make request
+    :param data: None or a dict object to post
+    :param timeout: timeout when making request, in seconds, None to use ENDPOINT_TIMEOUTS
+    :param as_json: return a dict object if set True, else text
+    :param auth: None or (username, password) for basic auth
+    :param dumps_json: whether to dumps the json response when as_json is set to True
+    :param logger: the logger of the caller
+    """
+    files = None
+    try:
+        if 'addversion.json' in url and data:
+            logger.debug(">>>>> POST %s", url)
+            logger.debug(json_dumps(dict(project=data['project'], version=data['version'],
+                                         egg="%s bytes binary egg file" % len(data['egg']))))
+            # Post the egg as a file like scrapyd-deploy, instead of a urlencoded field of triple size
+            data = dict(data)
+            files = dict(egg=('%s.egg' % data['project'], data.pop('egg')))
+        else:
+            logger.debug(">>>>> %s %s", 'POST' if data else 'GET', url)
+            if data:
+                logger.debug("POST data: %s", json_dumps(data))
+
+        r = send_request(url, data=data, auth=auth, timeout=timeout, files=files, logger=logger)
+        r.encoding = 'utf-8'
+    except Exception as err:
+        # logger.error('!!!!! %s %s' % (err.__class__.__name__, err))
+        logger.error("!!!!! error with %s: %s", url, err)
+        if as_json:
+            r_json = dict(url=url, auth=auth, status_code=-1, status=ERROR,
+                          message=str(err), when=get_now_string(True))
+            return -1, r_json
+        else:
+            return -1, str(err)
+    else:
+        if as_json:
+            r_json = {}
+            try:
+                # listprojects would get 502 html when Scrapyd server reboots
+                r_json = r.json()  # PY3: json.decoder.JSONDecodeError  PY2: exceptions.ValueError
+            except ValueError as err:  # issubclass(JSONDecodeError, ValueError)
+                logger.error("Fail to decode json from %s: %s", url, err)
+                r_json = dict(status=ERROR, message=r.text)
+            finally:
+                # Scrapyd in Python2: Traceback (most recent call last):\\n
+                # Scrapyd in Python3: Traceback (most recent call last):\r\n
+                message = r_json.get('message', '')
+                if message:
+                    r_json['message'] = re.sub(r'\\n', '\n', message)
+                r_json.update(dict(url=url, auth=auth, status_code=r.status_code, when=get_now_string(True)))
+                status = r_json.setdefault('status', NA)
+                if r.status_code != 200 or status != OK:
+                    logger.error("!!!!! (%s) %s: %s", r.status_code, status, url)
+                else:
+                    logger.debug("<<<<< (%s) %s: %s", r.status_code, status, url)
+                if dumps_json:
+                    logger.debug("Got json from %s: %s", url, json_dumps(r_json))
+                else:
+                    logger.debug("Got keys from (%s) %s %s: %s",
+                                 r_json.get('status_code'), r_json.get('status'), url, r_json.keys())
+
+                return r.status_code, r_json
+        else:
+            if r.status_code == 200:
+                _text = r.text[:100] + '......' + r.text[-100:] if len(r.text) > 200 else r.text
+                logger.debug("<<<<< (%s) %s\n%s", r.status_code, url, repr(_text))
+            else:
+                logger.error("!!!!! (%s) %s\n%s", r.status_code, url, r.text)
+
+            return r.status_code, r.text
+
+
+def get_scrapyd_server(node):
+    scrapyd_servers = app.config['SCRAPYD_SERVERS']
+    assert 0 < node <= len(scrapyd_servers), \
+        'node index error: %s, which should be between 1 and %s' % (node, len(scrapyd_servers))
+    return scrapyd_servers[node - 1], app.config['SCRAPYD_SERVERS_AUTHS'][node - 1]
+
+
+def schedule_task(node, task_id, jobid, logger=logger):
+    scrapyd_server, auth = get_scrapyd_server(node)
+    url = 'http://%s/schedule.json' % scrapyd_server
+    task = Task.query.get(task_id)
+    if not task:
+        message = "Task #%s not found" % task_id
+        logger.error(message)
+        return dict(url=url, auth=auth, status_code=-1, status=ERROR, message=message)
+    data = dict(project=task.project)
+    if task.version != DEFAULT_LATEST_VERSION:
+        data['_version'] = task.version
+    data['spider'] = task.spider
+    data['jobid'] = jobid
+    data.update(json.loads(task.settings_arguments))
+    status_code, js = make_request(url, data=data, auth=auth, logger=logger)
+    jobs_cache.invalidate(scrapyd_server)
+    return js
+
+
+def cancel_job(node, project, job, force=False, logger=logger):
+    # Force stop would send the cancel request twice
+    scrapyd_server, auth = get_scrapyd_server(node)
+    url = 'http://%s/cancel.json' % scrapyd_server
+    times = 2 if force else 1
+    for __ in range(times):
+        status_code, js = make_request(url, data=dict(project=project, job=job), auth=auth, logger=logger)
+        if force:
+            js['times'] = times
+            time.sleep(2)
+    jobs_cache.invalidate(scrapyd_server)
+    return status_code, js
+
+
+def list_stats(node, logger=logger):
+    # stats.json by LogParser, see the 'liststats' option of ApiView
+    scrapyd_server, auth = get_scrapyd_server(node)
+    url = 'http://%s/logs/stats.json' % scrapyd_server
+    return make_request(url, auth=auth, dumps_json=False, logger=logger)
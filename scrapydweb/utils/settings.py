@@ -0,0 +1,184 @@
+# coding: utf-8
+import logging
+
+from flask import current_app
+from flask.config import Config
+
+from ..vars import ALLOWED_SCRAPYD_LOG_EXTENSIONS, DEMO_PROJECTS_PATH, EMAIL_TRIGGER_KEYS, SCHEDULE_ADDITIONAL
+
+
+# (key, default) of the options in the config file which are exposed to MyView as attributes
+SETTINGS_DEFAULTS = [
+    # System
+    ('DEBUG', False),
+    ('VERBOSE', False),
+    # ScrapydWeb
+    ('SCRAPYDWEB_BIND', '0.0.0.0'),
+    ('SCRAPYDWEB_PORT', 5000),
+    ('ENABLE_AUTH', False),
+    ('USERNAME', ''),
+    ('PASSWORD', ''),
+    ('ENABLE_HTTPS', False),
+    ('CERTIFICATE_FILEPATH', ''),
+    ('PRIVATEKEY_FILEPATH', ''),
+    ('WSGI_SERVER', 'werkzeug'),
+    ('WSGI_WORKERS', 0),
+    ('WSGI_THREADS', 8),
+    ('URL_SCRAPYDWEB', 'http://127.0.0.1:5000'),
+    # Scrapy
+    ('DEPLOY_CONCURRENCY', 10),
+    # Scrapyd
+    ('LOCAL_SCRAPYD_SERVER', ''),
+    ('SCRAPYD_LOGS_DIR', ''),
+    # LogParser
+    ('ENABLE_LOGPARSER', True),
+    ('BACKUP_STATS_JSON_FILE', True),
+    ('BACKUP_STATS_RETENTION_DAYS', 30),
+    # Timer Tasks
+    ('JOBS_SNAPSHOT_INTERVAL', 300),
+    ('JOBS_SNAPSHOT_CONCURRENCY', 10),
+    ('JOBS_SNAPSHOT_TIMEOUT', 60),
+    ('TIMER_TASK_CONCURRENCY', 10),
+    # Run Spider
+    ('SCHEDULE_EXPAND_SETTINGS_ARGUMENTS', False),
+    ('SCHEDULE_CUSTOM_USER_AGENT', 'Mozilla/5.0'),
+    ('SCHEDULE_USER_AGENT', None),
+    ('SCHEDULE_ROBOTSTXT_OBEY', None),
+    ('SCHEDULE_COOKIES_ENABLED', None),
+    ('SCHEDULE_CONCURRENT_REQUESTS', None),
+    ('SCHEDULE_DOWNLOAD_DELAY', None),
+    ('SCHEDULE_ADDITIONAL', SCHEDULE_ADDITIONAL),
+    # Page Display
+    ('SHOW_SCRAPYD_ITEMS', True),
+    ('SHOW_JOBS_JOB_COLUMN', False),
+    ('JOBS_FINISHED_JOBS_LIMIT', 0),
+    ('JOBS_RELOAD_INTERVAL', 300),
+    ('JOBS_CACHE_TTL', 5),
+    ('PUSH_INTERVAL', 10),
+    ('PUSH_MAX_STREAMS', 4),
+    ('LOG_TAIL_BYTES', 1048576),
+    ('DAEMONSTATUS_REFRESH_INTERVAL', 10),
+    # Email Notice
+    ('ENABLE_EMAIL', False),
+    ('POLL_ROUND_INTERVAL', 300),
+    ('POLL_REQUEST_INTERVAL', 10),
+    ('POLL_CONCURRENCY', 1),
+    ('POLL_CONCURRENCY_PER_NODE', 1),
+    ('POLL_RATE_LIMIT', 10),
+    ('SMTP_SERVER', ''),
+    ('SMTP_PORT', 0),
+    ('SMTP_OVER_SSL', False),
+    ('SMTP_CONNECTION_TIMEOUT', 10),
+    ('FROM_ADDR', ''),
+    ('TO_ADDRS', []),
+    ('EMAIL_PASSWORD', ''),
+    ('EMAIL_WORKING_DAYS', []),
+    ('EMAIL_WORKING_HOURS', []),
+    ('ON_JOB_RUNNING_INTERVAL', 0),
+    ('ON_JOB_FINISHED', False),
+]
+# ['CRITICAL', 'ERROR', 'WARNING', 'REDIRECT', 'RETRY', 'IGNORE']
+for _key in EMAIL_TRIGGER_KEYS:
+    SETTINGS_DEFAULTS.extend([('LOG_%s_THRESHOLD' % _key, 0),
+                              ('LOG_%s_TRIGGER_STOP' % _key, False),
+                              ('LOG_%s_TRIGGER_FORCESTOP' % _key, False)])
+
+
+class ScrapydWebConfig(Config):
+    """app.config with a version number, which is bumped on every change so that the Settings would be rebuilt."""
+    version = 0
+
+    def __setitem__(self, key, value):
+        super(ScrapydWebConfig, self).__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super(ScrapydWebConfig, self).__delitem__(key)
+        self.version += 1
+
+    def update(self, *args, **kwargs):
+        super(ScrapydWebConfig, self).update(*args, **kwargs)
+        self.version += 1
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super(ScrapydWebConfig, self).setdefault(key, default)
+
+    def pop(self, *args):
+        self.version += 1
+        return super(ScrapydWebConfig, self).pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super(ScrapydWebConfig, self).popitem()
+
+    def clear(self):
+        super(ScrapydWebConfig, self).clear()
+        self.version += 1
+
+
+class Settings(object):
+    """An immutable snapshot of app.config with the defaults applied, built once for every version of app.config.
+
+    Usage::
+
+      >>> settings = get_settings()
+      >>> settings.SCRAPYD_SERVERS
+    """
+    def __init__(self, config):
+        attrs = dict((key, config.get(key, default)) for (key, default) in SETTINGS_DEFAULTS)
+        # Not in the config file
+        for key in ['DEFAULT_SETTINGS_PY_PATH', 'SCRAPYDWEB_SETTINGS_PY_PATH', 'MAIN_PID', 'LOGPARSER_PID', 'POLL_PID']:
+            attrs[key] = config[key]
+
+        attrs['SCRAPY_PROJECTS_DIR'] = config.get('SCRAPY_PROJECTS_DIR', '') or DEMO_PROJECTS_PATH
+        attrs['SCRAPYD_SERVERS'] = config.get('SCRAPYD_SERVERS', []) or ['127.0.0.1:6800']
+        attrs['SCRAPYD_SERVERS_AMOUNT'] = len(attrs['SCRAPYD_SERVERS'])
+        attrs['SCRAPYD_SERVERS_GROUPS'] = config.get('SCRAPYD_SERVERS_GROUPS', []) or ['']
+        attrs['SCRAPYD_SERVERS_AUTHS'] = config.get('SCRAPYD_SERVERS_AUTHS', []) or [None]
+        attrs['SCRAPYD_LOG_EXTENSIONS'] = config.get('SCRAPYD_LOG_EXTENSIONS', []) or ALLOWED_SCRAPYD_LOG_EXTENSIONS
+        attrs['EMAIL_USERNAME'] = config.get('EMAIL_USERNAME', '') or attrs['FROM_ADDR']
+        # A copy is made for each view in MyView.__init__(), since 'subject' and 'content' would be modified
+        attrs['EMAIL_KWARGS'] = dict(
+            smtp_server=attrs['SMTP_SERVER'],
+            smtp_port=attrs['SMTP_PORT'],
+            smtp_over_ssl=attrs['SMTP_OVER_SSL'],
+            smtp_connection_timeout=attrs['SMTP_CONNECTION_TIMEOUT'],
+            email_username=attrs['EMAIL_USERNAME'],
+            email_password=attrs['EMAIL_PASSWORD'],
+            from_addr=attrs['FROM_ADDR'],
+            to_addrs=attrs['TO_ADDRS'],
+            subject='subject',
+            content='content'
+        )
+        # The part of MyView.FEATURES that does not vary with requests
+        attrs['FEATURES_AUTH'] = 'A' if attrs['ENABLE_AUTH'] else '-'
+        attrs['FEATURES_PROJECTS_DIR'] = 'd' if attrs['SCRAPY_PROJECTS_DIR'] != DEMO_PROJECTS_PATH else '-'
+        attrs['FEATURES_EMAIL'] = 'E' if attrs['ENABLE_EMAIL'] else '-'
+        attrs['FEATURES_LOGPARSER'] = 'L' if attrs['ENABLE_LOGPARSER'] else '-'
+        attrs['FEATURES_HTTPS'] = 'S' if attrs['ENABLE_HTTPS'] else '-'
+        attrs['LOGGING_LEVEL'] = logging.DEBUG if attrs['VERBOSE'] else logging.WARNING
+
+        object.__setattr__(self, 'version', getattr(config, 'version', 0))
+        object.__setattr__(self, 'attrs', attrs)
+
+        logging.getLogger("requests").setLevel(attrs['LOGGING_LEVEL'])
+        logging.getLogger("urllib3").setLevel(attrs['LOGGING_LEVEL'])
+
+    def __getattr__(self, name):
+        try:
+            return self.attrs[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings is immutable, modify app.config instead")
+
+
+def get_settings(app=None):
+    app = app or current_app
+    settings = app.extensions.get('scrapydweb_settings')
+    if settings is None or settings.version != getattr(app.config, 'version', 0):
+        settings = Settings(app.config)
+        app.extensions['scrapydweb_settings'] = settings
+    return settings
@@ -43,7 +43,9 @@ def on_parent_exit(signame):
 
 
 # https://stackoverflow.com/a/19448255/10517783
-def kill_child(proc, title=''):
+def kill_child(proc, title='', parent_pid=None):
+    if parent_pid and os.getpid() != parent_pid:  # In a process forked by gunicorn
+        return
     proc.kill()
     # A None value indicates that the process has not terminated yet.
     # A negative value -N indicates that the child was terminated by signal N (Unix only).
@@ -54,7 +56,7 @@ def init_logparser(config):
     logparser_subprocess = start_logparser(config)
     logparser_pid = logparser_subprocess.pid
     logger.info("Running LogParser in the background with pid: %s", logparser_pid)
-    atexit.register(kill_child, logparser_subprocess, 'LogParser')
+    atexit.register(kill_child, logparser_subprocess, 'LogParser', os.getpid())
     return logparser_pid
 
 
@@ -86,7 +88,7 @@ def init_poll(config):
     poll_subprocess = start_poll(config)
     poll_pid = poll_subprocess.pid
     logger.info("Start polling job stats for email notice in the background with pid: %s", poll_pid)
-    atexit.register(kill_child, poll_subprocess, 'Poll')
+    atexit.register(kill_child, poll_subprocess, 'Poll', os.getpid())
     return poll_pid
 
 
@@ -103,7 +105,11 @@ def start_poll(config):
         str(config.get('POLL_ROUND_INTERVAL', 300)),
         str(config.get('POLL_REQUEST_INTERVAL', 10)),
         str(config['MAIN_PID']),
-        str(config.get('VERBOSE', False))
+        str(config.get('VERBOSE', False)),
+        '0',  # exit_timeout
+        str(config.get('POLL_CONCURRENCY', 1)),
+        str(config.get('POLL_CONCURRENCY_PER_NODE', 1)),
+        str(config.get('POLL_RATE_LIMIT', 10))
     ]
 
     # 'Windows':
@@ -0,0 +1,146 @@
+# coding: utf-8
+# The time series of crawled pages and scraped items of each job, built from the datas of the stats
+# by LogParser (or parse()), so that the crawl rates of the runs of a spider can be compared
+# without parsing the old logs again, see the 'trend' opt of ApiView.
+from array import array
+from datetime import datetime
+import time
+
+from ..models import JobSeries, db
+
+
+# Seconds per point at first, doubled until there are at most MAX_POINTS points
+RESOLUTION = 60
+MAX_POINTS = 720
+# Cumulative counts as unsigned 32-bit integers
+ARRAY_TYPECODE = 'L' if array('I').itemsize < 4 else 'I'
+
+
+def pack(values):
+    values = array(ARRAY_TYPECODE, values)
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def unpack(data):
+    values = array(ARRAY_TYPECODE)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    return list(values)
+
+
+def to_timestamp(string):
+    return time.mktime(datetime.strptime(string, '%Y-%m-%d %H:%M:%S').timetuple())
+
+
+def build_series(datas):
+    """Return (interval, duration, pages_series, items_series) from the datas of stats.
+
+    datas: [['2019-01-01 00:00:01', pages, pages_per_min, items, items_per_min], ...]
+    The series are the cumulative counts at the end of every interval seconds since the first data,
+    so that downsampling is just keeping the last point of every two points.
+    """
+    timestamps = [to_timestamp(str(data[0])) for data in datas]
+    first = timestamps[0]
+    duration = int(timestamps[-1] - first)
+    interval = RESOLUTION
+    while duration // interval + 1 > MAX_POINTS:
+        interval *= 2
+    pages_series = [0] * (duration // interval + 1)
+    items_series = [0] * (duration // interval + 1)
+    for timestamp, data in zip(timestamps, datas):
+        index = int(timestamp - first) // interval
+        pages_series[index] = max(data[1] or 0, 0)
+        items_series[index] = max(data[3] or 0, 0)
+    # Carry forward the counts for the intervals without any data
+    for series in [pages_series, items_series]:
+        for index in range(1, len(series)):
+            series[index] = max(series[index], series[index - 1])
+    return interval, duration, pages_series, items_series
+
+
+def save_job_series(server, project, spider, job, stats):
+    """Save the series of a job, only if there are any new logs since the last time. Return True if saved."""
+    datas = stats.get('datas') or []
+    latest_log_timestamp = int(stats.get('latest_log_timestamp') or 0)
+    if len(datas) < 2:
+        return False
+    record = JobSeries.query.filter_by(server=server, project=project, spider=spider, job=job).first()
+    finished = stats.get('finish_reason', 'N/A') != 'N/A'
+    if record and record.latest_log_timestamp == latest_log_timestamp and record.finished == finished:
+        return False
+    interval, duration, pages_series, items_series = build_series(datas)
+    if not record:
+        record = JobSeries(server=server, project=project, spider=spider, job=job)
+        db.session.add(record)
+    record.start = datetime.fromtimestamp(to_timestamp(str(datas[0][0])))
+    record.latest_log_timestamp = latest_log_timestamp
+    record.finished = finished
+    record.update_time = datetime.now()
+    record.duration = duration
+    record.pages = pages_series[-1]
+    record.items = items_series[-1]
+    record.interval = interval
+    record.pages_series = pack(pages_series)
+    record.items_series = pack(items_series)
+    db.session.commit()
+    return True
+
+
+def per_minute(count, seconds):
+    return round(count * 60.0 / seconds, 2) if seconds > 0 else None
+
+
+def get_rates(record, points=0):
+    """Return [[minutes since start, pages/min, items/min], ...] in at most N points if N > 0."""
+    interval = record.interval
+    pages_series = unpack(record.pages_series)
+    items_series = unpack(record.items_series)
+    step = 1
+    while points > 0 and (len(pages_series) + step - 1) // step > points:
+        step *= 2
+    indexes = list(range(step - 1, len(pages_series), step))
+    if not indexes or indexes[-1] != len(pages_series) - 1:
+        indexes.append(len(pages_series) - 1)
+    rates = []
+    (previous, previous_pages, previous_items) = (-1, 0, 0)
+    for index in indexes:
+        seconds = (index - previous) * interval
+        rates.append([round(index * interval / 60.0, 1),
+                      per_minute(pages_series[index] - previous_pages, seconds),
+                      per_minute(items_series[index] - previous_items, seconds)])
+        (previous, previous_pages, previous_items) = (index, pages_series[index], items_series[index])
+    return rates
+
+
+def get_trend(server, project, spider, limit=20, points=0):
+    """Return the crawl rates of the latest N runs of a spider, the latest first."""
+    records = JobSeries.query.filter_by(server=server, project=project, spider=spider).order_by(
+        JobSeries.start.desc()).limit(limit).all()
+    runs = []
+    for record in records:
+        run = dict(
+            job=record.job,
+            start=str(record.start),
+            finished=record.finished,
+            duration=record.duration,
+            pages=record.pages,
+            items=record.items,
+            pages_per_min=per_minute(record.pages, record.duration),
+            items_per_min=per_minute(record.items, record.duration)
+        )
+        if points > 0:
+            run['rates'] = get_rates(record, points)
+        runs.append(run)
+    trend = dict(runs=runs)
+    # The average rates of the latest finished run compared with those of the previous finished runs
+    finished_runs = [run for run in runs if run['finished']]
+    for key in ['pages_per_min', 'items_per_min']:
+        previous = [run[key] for run in finished_runs[1:] if run[key] is not None]
+        if finished_runs and finished_runs[0][key] is not None and previous and sum(previous) > 0:
+            baseline = sum(previous) / float(len(previous))
+            trend['%s_change' % key] = round(finished_runs[0][key] / baseline - 1, 4)
+        else:
+            trend['%s_change' % key] = None
+    return trend
@@ -15,16 +15,17 @@ DATA_PATH = os.path.join(CWD, 'data')
 DATABASE_PATH = os.path.join(DATA_PATH, 'database')
 DEMO_PROJECTS_PATH = os.path.join(DATA_PATH, 'demo_projects')
 DEPLOY_PATH = os.path.join(DATA_PATH, 'deploy')
+EGG_CACHE_PATH = os.path.join(DEPLOY_PATH, 'egg_cache')
 HISTORY_LOG = os.path.join(DATA_PATH, 'history_log')
 PARSE_PATH = os.path.join(DATA_PATH, 'parse')
 SCHEDULE_PATH = os.path.join(DATA_PATH, 'schedule')
 STATS_PATH = os.path.join(DATA_PATH, 'stats')
 
-for path in [DATA_PATH, DATABASE_PATH, DEMO_PROJECTS_PATH, DEPLOY_PATH,
+for path in [DATA_PATH, DATABASE_PATH, DEMO_PROJECTS_PATH, DEPLOY_PATH, EGG_CACHE_PATH,
              HISTORY_LOG, PARSE_PATH, SCHEDULE_PATH, STATS_PATH]:
     if not os.path.isdir(path):
         os.mkdir(path)
-    elif path in [PARSE_PATH, DEPLOY_PATH, SCHEDULE_PATH]:
+    elif path in [PARSE_PATH, DEPLOY_PATH]:
         for file in glob.glob(os.path.join(path, '*.*')):
             if not os.path.split(file)[-1] in ['ScrapydWeb_demo.log']:
                 os.remove(file)
@@ -35,6 +36,8 @@ TIMER_TASKS_HISTORY_LOG = os.path.join(HISTORY_LOG, 'timer_tasks_history.log')
 
 # For check_app_config.py and MyView
 ALLOWED_SCRAPYD_LOG_EXTENSIONS = ['.log', '.log.gz', '.txt', '.gz', '']
+DEFAULT_LATEST_VERSION = 'default: the latest version'
+WSGI_SERVERS = ['werkzeug', 'waitress', 'gunicorn']
 EMAIL_TRIGGER_KEYS = ['CRITICAL', 'ERROR', 'WARNING', 'REDIRECT', 'RETRY', 'IGNORE']
 
 # Error: Project names must begin with a letter and contain only letters, numbers and underscores
@@ -67,6 +70,21 @@ DIRECTORY_PATTERN = re.compile(r"""
                                 """, re.X)
 DIRECTORY_KEYS = ['odd_even', 'filename', 'size', 'content_type', 'content_encoding']
 HREF_NAME_PATTERN = re.compile(r'href="(.+?)">(.+?)<')
+JOB_PATTERN = re.compile(r"""
+                            <tr>
+                                <td>(?P<Project>.*?)</td>
+                                <td>(?P<Spider>.*?)</td>
+                                <td>(?P<Job>.*?)</td>
+                                (?:<td>(?P<PID>.*?)</td>)?
+                                (?:<td>(?P<Start>.*?)</td>)?
+                                (?:<td>(?P<Runtime>.*?)</td>)?
+                                (?:<td>(?P<Finish>.*?)</td>)?
+                                (?:<td>(?P<Log>.*?)</td>)?
+                                (?:<td>(?P<Items>.*?)</td>)?
+                                [\w\W]*?  # Temp support for Scrapyd v1.3.0 (not released)
+                            </tr>
+                          """, re.X)
+JOB_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'runtime', 'finish', 'href_log', 'href_items']
 
 
 # For timer task
@@ -75,7 +93,8 @@ APSCHEDULER_DATABASE_URI = 'sqlite:///' + os.path.join(DATABASE_PATH, 'apschedul
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(DATABASE_PATH, 'timer_tasks.db')
 SQLALCHEMY_BINDS = {
     'metadata': 'sqlite:///' + os.path.join(DATABASE_PATH, 'metadata.db'),
-    'jobs': 'sqlite:///' + os.path.join(DATABASE_PATH, 'jobs.db')
+    'jobs': 'sqlite:///' + os.path.join(DATABASE_PATH, 'jobs.db'),
+    'stats': 'sqlite:///' + os.path.join(DATABASE_PATH, 'stats.db')
 }
 # STATE_STOPPED = 0, STATE_RUNNING = 1, STATE_PAUSED = 2
 SCHEDULER_STATE_DICT = {
@@ -1,7 +1,10 @@
 # coding: utf-8
 import re
-import time
 
+from flask import request
+
+from ..utils.service import cancel_job, list_stats
+from ..utils.timeseries import get_trend
 from .myview import MyView
 
 
@@ -23,6 +26,10 @@ class ApiView(MyView):
         self.js = {}
 
     def dispatch_request(self, **kwargs):
+        if self.opt == 'jobs':  # Shared with the poll subprocess, see JOBS_CACHE_TTL
+            return self.json_dumps(self.get_jobs(), sort_keys=False)
+        if self.opt == 'trend':  # /1/api/trend/project/spider/?limit=20&points=60
+            return self.json_dumps(self.get_trend(), sort_keys=False)
         self.update_url()
         self.update_data()
         self.get_result()
@@ -54,15 +61,34 @@ class ApiView(MyView):
             self.data = None
 
     def get_result(self):
+        if self.opt in ['stop', 'forcestop']:
+            self.status_code, self.js = cancel_job(self.node, self.project, self.version_spider_job,
+                                                   force=self.opt == 'forcestop', logger=self.logger)
+            return
+        elif self.opt == 'liststats':
+            self.status_code, self.js = list_stats(self.node, logger=self.logger)
+            return
         timeout = 3 if self.opt == 'daemonstatus' else 60
-        dumps_json = self.opt not in ['daemonstatus', 'liststats']
-        times = 2 if self.opt == 'forcestop' else 1
-        for __ in range(times):
-            self.status_code, self.js = self.make_request(self.url, data=self.data, auth=self.AUTH,
-                                                          as_json=True, dumps_json=dumps_json, timeout=timeout)
-            if times != 1:
-                self.js['times'] = times
-                time.sleep(2)
+        dumps_json = self.opt != 'daemonstatus'
+        self.status_code, self.js = self.make_request(self.url, data=self.data, auth=self.AUTH,
+                                                      as_json=True, dumps_json=dumps_json, timeout=timeout)
+        if self.opt == 'start':
+            self.invalidate_jobs_cache()
+
+    def get_jobs(self):
+        status_code, text, jobs = self.fetch_jobs()
+        # The text would be the whole Jobs page or an error page of Scrapyd, which is not returned
+        if status_code != 200 or not re.search(r'<body><h1>Jobs</h1>', text):
+            return dict(status=self.ERROR, status_code=status_code,
+                        tip="Make sure that your Scrapyd server is accessable. ")
+        return dict(status=self.OK, status_code=status_code, jobs=jobs)
+
+    def get_trend(self):
+        limit = request.args.get('limit', default=20, type=int)
+        points = request.args.get('points', default=0, type=int)
+        trend = get_trend(self.SCRAPYD_SERVER, self.project, self.version_spider_job, limit=limit, points=points)
+        trend.update(status=self.OK, project=self.project, spider=self.version_spider_job)
+        return trend
 
     def handle_result(self):
         if self.status_code != 200:
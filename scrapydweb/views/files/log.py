@@ -1,6 +1,8 @@
 # coding: utf-8
 from collections import OrderedDict
-from datetime import date, datetime
+from copy import deepcopy
+from datetime import date, datetime, timedelta
+import hashlib
 import io
 import json
 import os
@@ -9,11 +11,17 @@ import re
 from subprocess import Popen
 import sys
 import tarfile
+import threading
 import time
 
-from flask import flash, render_template, request, url_for
+from flask import flash, get_flashed_messages, render_template, request, url_for
 from logparser import parse
+from logparser.common import PATTERN_LOG_ENDING
 
+from ...models import JobNotice, JobSeries, Stats, db
+from ...utils.push import generate_events, make_event_stream, poll_events
+from ...utils.service import cancel_job, send_request
+from ...utils.timeseries import save_job_series
 from ...vars import CWD as root_dir
 from ..myview import MyView
 
@@ -28,25 +36,125 @@ EMAIL_CONTENT_KEYS = [
     'crawled_pages',
     'scraped_items'
 ]
-job_data_dict = {}
-# job_finished_set would only be updated by poll POST with ?job_finished=True > email_notice(),
+# The defaults of logparser.parse()
+LOG_HEAD_LINES = 100
+LOG_TAIL_LINES = 200
+LINESEP_PATTERN = re.compile(r'\r\n|\n|\r')
+# A new log entry starts with a line like: 2019-01-01 00:00:01 [scrapy.core.engine] INFO: Spider opened
+LOG_ENTRY_PATTERN = re.compile(br'\n(?=\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} )')
+# The state of the email notice of each job is saved in the table job_notice, see email_notice(),
+# in which the finished flag would only be set by poll POST with ?job_finished=True,
 # used for determining whether to show 'click to refresh' button in the Log and Stats page.
-job_finished_set = set()
+# The records not updated for N days would be deleted once any job is finished.
+JOB_NOTICE_RETENTION_DAYS = 7
+# The stats pushed to the Stats page via server-sent events, see LogEventsView
+PUSH_STATS_KEYS = [
+    'first_log_time',
+    'latest_log_time',
+    'runtime',
+    'pages',
+    'items',
+    'shutdown_reason',
+    'finish_reason',
+    'latest_crawl_timestamp',
+    'latest_scrape_timestamp',
+    'latest_log_timestamp',
+    'last_update_timestamp'
+]
+# digests: {(server, project, spider, job): digest of the backup stats}, see backup_stats()
+# Cleared every hour in delete_expired_backup_stats(), since the stats might be deleted by another process.
+backup_stats_metadata = dict(digests={}, delete_timestamp=0)
+# Bound the memory of parse_cache_dict
+PARSE_CACHE_LIMIT = 100  # The number of jobs
+PARSE_CACHE_TTL = 3600  # Dropped if not visited for N seconds, e.g. the job has been killed
+PARSE_CACHE_DETAILS_LIMIT = 100  # The latest lines kept for each log category
+PARSE_CACHE_DATAS_LIMIT = 1000  # The points of the crawl rates chart
+
+
+class ParseCache(object):
+    """The stats parsed so far of the running jobs: {job_key: dict(path, position, stats)}.
+
+    The least recently used entries are dropped once there are more than limit jobs,
+    and so are the entries not visited for ttl seconds.
+    """
+    def __init__(self, limit=PARSE_CACHE_LIMIT, ttl=PARSE_CACHE_TTL):
+        self.limit = limit
+        self.ttl = ttl
+        self._data = OrderedDict()  # {job_key: (timestamp, value)}, ordered by timestamp
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time(), value)
+            self.remove_expired()
+            while len(self._data) > self.limit:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            (timestamp, value) = self._data.pop(key, (0, None))
+            if value is None or time.time() - timestamp > self.ttl:
+                return default
+            self._data[key] = (time.time(), value)  # Most recently used
+            return value
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self._data.pop(key, (0, default))[1]
+
+    def remove_expired(self):
+        while self._data:
+            (timestamp, __) = next(iter(self._data.values()))
+            if time.time() - timestamp <= self.ttl:
+                break
+            self._data.popitem(last=False)
+
+
+# parse_cache_dict would be used in the Stats page when the stats by LogParser is not available,
+# so that only the log appended since the last visit has to be parsed.
+# Note that each gunicorn worker keeps its own cache, which costs only one more parse of the whole log.
+parse_cache_dict = ParseCache()
 
 
 # http://flask.pocoo.org/docs/1.0/api/#flask.views.View
 # http://flask.pocoo.org/docs/1.0/views/
 class LogView(MyView):
-    job_data_dict = job_data_dict
-    job_finished_set = job_finished_set
+    backup_stats_metadata = backup_stats_metadata
+    parse_cache_dict = parse_cache_dict
 
     def __init__(self):
         super(LogView, self).__init__()  # super().__init__()
 
-        self.opt = self.view_args['opt']
-        self.project = self.view_args['project']
-        self.spider = self.view_args['spider']
-        self.job = self.view_args['job']
+        # For Log and Stats buttons in the Logs page: /a.log/?with_ext=True
+        # Request that comes from poll POST for finished job and links of finished job in the Jobs page
+        # would be attached with the query string '?job_finished=True'
+        self.init_job(self.view_args['opt'], self.view_args['project'], self.view_args['spider'],
+                      self.view_args['job'], with_ext=request.args.get('with_ext', None),
+                      job_finished=request.args.get('job_finished', None),
+                      realtime=request.args.get('realtime', None))
+        # For the 'Load more' button in the Log page, see LOG_TAIL_BYTES
+        end = request.args.get('end', None, type=int)
+        self.log_end = end if end and end > 0 else None
+        self.load_more = request.args.get('load_more', None)
+
+    def init_job(self, opt, project, spider, job, with_ext=None, job_finished=None, realtime=None):
+        self.opt = opt
+        self.project = project
+        self.spider = spider
+        self.job = job
 
         self.job_key = '/%s/%s/%s/%s' % (self.node, self.project, self.spider, self.job)
 
@@ -55,8 +163,7 @@ class LogView(MyView):
         self.url = u'http://{}/logs/{}/{}/{}'.format(self.SCRAPYD_SERVER, self.project, self.spider, self.job)
         self.log_path = os.path.join(self.SCRAPYD_LOGS_DIR, self.project, self.spider, self.job)
 
-        # For Log and Stats buttons in the Logs page: /a.log/?with_ext=True
-        self.with_ext = request.args.get('with_ext', None)
+        self.with_ext = with_ext
         if self.with_ext:
             self.SCRAPYD_LOG_EXTENSIONS = ['']
             if self.job.endswith('.tar.gz'):
@@ -73,13 +180,21 @@ class LogView(MyView):
 
         self.status_code = 0
         self.text = ''
+        # Only the last LOG_TAIL_BYTES (before self.log_end if set) of the logfile would be loaded in the Log page
+        self.log_tail = self.opt == 'utf8' and self.LOG_TAIL_BYTES > 0
+        self.log_end = None
+        self.log_start = 0
+        self.log_size = 0
+        self.load_more = None
+        self.log_found = False
+        # The bytes read from the position in self.parse_cache, see parse_appended_log()
+        self.appended_log = None
+        self.parse_cache = None
         self.template = 'scrapydweb/%s%s.html' % (self.opt, '_mobileui' if self.USE_MOBILEUI else '')
         self.kwargs = dict(node=self.node, project=self.project, spider=self.spider,
                            job=job_without_ext, url_refresh='', url_jump='')
 
-        # Request that comes from poll POST for finished job and links of finished job in the Jobs page
-        # would be attached with the query string '?job_finished=True'
-        self.job_finished = request.args.get('job_finished', None)
+        self.job_finished = job_finished
 
         if self.opt == 'utf8':
             flash("It's recommended to check out the latest log via: the Stats page >> View log >> Tail", self.WARN)
@@ -88,15 +203,16 @@ class LogView(MyView):
             self.stats_logparser = False
         else:
             self.utf8_realtime = False
-            self.stats_realtime = True if request.args.get('realtime', None) else False
+            self.stats_realtime = True if realtime else False
             self.stats_logparser = not self.stats_realtime
         self.logparser_valid = False
         self.backup_stats_valid = False
-        spider_path = self.mkdir_spider_path()
-        self.backup_stats_path = os.path.join(spider_path, job_without_ext + '.json')
+        self.backup_stats_key = (self.SCRAPYD_SERVER, self.project, self.spider, job_without_ext)
         self.stats = {}
 
-        # job_data for email notice: ([0] * 8, [False] * 6, False, time.time())
+        # job_data for email notice: ([0] * 8, [False] * 6, False, time.time()), see JobNotice
+        self.job_notice = None
+        self.job_finished_noticed = None
         self.job_stats_previous = []
         self.triggered_list = []
         self.has_been_stopped = False
@@ -107,6 +223,23 @@ class LogView(MyView):
         self.flag = ''
 
     def dispatch_request(self, **kwargs):
+        if not self.load_stats_or_log():
+            kwargs = dict(node=self.node, url=self.url, status_code=self.status_code, text=self.text)
+            return render_template(self.template_fail, **kwargs)
+
+        self.update_kwargs()
+
+        if self.log_tail and self.load_more:  # XMLHttpRequest by the 'Load more' button in the Log page
+            get_flashed_messages()
+            return self.json_dumps(dict(status=self.OK, text=self.text, log_start=self.log_start,
+                                        log_size=self.log_size, url_load_more=self.kwargs['url_load_more']))
+
+        if self.ENABLE_EMAIL and self.POST:  # Only poll.py would make POST request
+            self.email_notice()
+
+        return render_template(self.template, **self.kwargs)
+
+    def load_stats_or_log(self):
         # Try to request stats by LogParser to avoid reading/requesting the whole log
         if self.stats_logparser:
             if self.IS_LOCAL_SCRAPYD_SERVER and self.SCRAPYD_LOGS_DIR:
@@ -119,25 +252,18 @@ class LogView(MyView):
             if self.IS_LOCAL_SCRAPYD_SERVER and self.SCRAPYD_LOGS_DIR:
                 self.read_local_scrapy_log()
             # Has to request scrapy logfile
-            if not self.text:
+            if not self.log_found:
                 self.request_scrapy_log()
                 if self.status_code != 200:
                     if self.stats_logparser:
                         self.load_backup_stats()
                     if not self.backup_stats_valid:
-                        kwargs = dict(node=self.node, url=self.url, status_code=self.status_code, text=self.text)
-                        return render_template(self.template_fail, **kwargs)
+                        return False
             else:
                 self.url += self.SCRAPYD_LOG_EXTENSIONS[0]
         else:
             self.url += self.SCRAPYD_LOG_EXTENSIONS[0]
-
-        self.update_kwargs()
-
-        if self.ENABLE_EMAIL and self.POST:  # Only poll.py would make POST request
-            self.email_notice()
-
-        return render_template(self.template, **self.kwargs)
+        return True
 
     def read_local_stats_by_logparser(self):
         self.logger.debug("Try to read local stats by LogParser: %s", self.json_path)
@@ -195,8 +321,25 @@ class LogView(MyView):
                 if tarfile.is_tarfile(log_path):
                     self.logger.debug("Ignore local tarfile and use requests instead: %s", log_path)
                     break
-                with io.open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    self.text = f.read()
+                if self.log_tail:
+                    with io.open(log_path, 'rb') as f:
+                        f.seek(0, os.SEEK_END)
+                        self.log_size = f.tell()
+                        end = self.log_size if self.log_end is None else min(self.log_end, self.log_size)
+                        start = max(0, end - self.LOG_TAIL_BYTES)
+                        f.seek(start)
+                        self.set_log_range(f.read(end - start), start)
+                elif self.opt == 'stats':
+                    with io.open(log_path, 'rb') as f:
+                        f.seek(0, os.SEEK_END)
+                        self.log_size = f.tell()
+                        self.log_start = self.get_parse_position(log_path, self.log_size)
+                        f.seek(self.log_start)
+                        self.appended_log = f.read()
+                else:
+                    with io.open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
+                        self.text = f.read()
+                self.log_found = True
                 log_path = self.handle_slash(log_path)
                 msg = "Using local logfile: %s" % log_path
                 self.logger.debug(msg)
@@ -206,7 +349,13 @@ class LogView(MyView):
     def request_scrapy_log(self):
         for ext in self.SCRAPYD_LOG_EXTENSIONS:
             url = self.url + ext
-            self.status_code, self.text = self.make_request(url, auth=self.AUTH, as_json=False)
+            # Range requests would not work with the compressed logfile
+            if self.log_tail and not url.endswith('.gz'):
+                self.status_code, self.text = self.request_scrapy_log_range(url)
+            elif self.opt == 'stats' and not url.endswith('.gz'):
+                self.status_code, self.text = self.request_scrapy_log_appended(url)
+            else:
+                self.status_code, self.text = self.make_request(url, auth=self.AUTH, as_json=False)
             if self.status_code == 200:
                 self.url = url
                 self.logger.debug("Got logfile from %s", self.url)
@@ -217,43 +366,180 @@ class LogView(MyView):
             flash(msg, self.WARN)
             self.url += self.SCRAPYD_LOG_EXTENSIONS[0]
 
-    def mkdir_spider_path(self):
-        node_path = os.path.join(self.STATS_PATH,
-                                 re.sub(self.LEGAL_NAME_PATTERN, '-', re.sub(r'[.:]', '_', self.SCRAPYD_SERVER)))
-        project_path = os.path.join(node_path, self.project)
-        spider_path = os.path.join(project_path, self.spider)
-
-        if not os.path.isdir(self.STATS_PATH):
-            os.mkdir(self.STATS_PATH)
-        if not os.path.isdir(node_path):
-            os.mkdir(node_path)
-        if not os.path.isdir(project_path):
-            os.mkdir(project_path)
-        if not os.path.isdir(spider_path):
-            os.mkdir(spider_path)
-        return spider_path
+    def request_scrapy_log_range(self, url):
+        if self.log_end is None:
+            # Scrapyd (twisted static.File) answers 500 if the suffix length is larger than the logfile,
+            # in which case the whole logfile would be requested with the explicit range instead.
+            ranges = ['bytes=-%s' % self.LOG_TAIL_BYTES, 'bytes=0-%s' % (self.LOG_TAIL_BYTES - 1)]
+        else:
+            ranges = ['bytes=%s-%s' % (max(0, self.log_end - self.LOG_TAIL_BYTES), self.log_end - 1)]
+        for range_ in ranges:
+            headers = dict(Range=range_)
+            self.logger.debug(">>>>> GET %s %s", url, headers)
+            try:
+                r = send_request(url, auth=self.AUTH, headers=headers, stream=True, logger=self.logger)
+            except Exception as err:
+                self.logger.error("!!!!! error with %s: %s", url, err)
+                return -1, str(err)
+            if r.status_code not in [416, 500] or range_ == ranges[-1]:
+                break
+            r.close()  # Release the pooled connection before retrying
+        # Content-Range: bytes 1024-2047/2048
+        m = re.search(r'bytes (\d+)-(\d+)/(\d+)', r.headers.get('Content-Range', ''))
+        if r.status_code == 206 and m:
+            self.log_size = int(m.group(3))
+            self.set_log_range(r.content, int(m.group(1)))
+        elif r.status_code == 200:  # Range requests not supported
+            self.log_size, start, content = self.read_log_tail(r)
+            self.set_log_range(content, start)
+        elif r.status_code == 416:  # Range Not Satisfiable for an empty logfile
+            self.log_size = 0
+            self.set_log_range(b'', 0)
+        else:
+            self.logger.error("!!!!! (%s) %s\n%s", r.status_code, url, r.text)
+            return r.status_code, r.text
+        self.logger.debug("<<<<< (%s) %s: bytes %s-%s/%s", r.status_code, url,
+                          self.log_start, self.log_end, self.log_size)
+        return 200, self.text
+
+    def read_log_tail(self, r):
+        """Return (size, start, content) of the streamed logfile, keeping only the last LOG_TAIL_BYTES
+        before self.log_end in memory."""
+        size = 0
+        tail = bytearray()
+        for chunk in r.iter_content(chunk_size=65536):
+            if self.log_end is not None:
+                chunk_in_range = chunk[:max(0, self.log_end - size)]
+            else:
+                chunk_in_range = chunk
+            if chunk_in_range:
+                tail.extend(chunk_in_range)
+                del tail[:-self.LOG_TAIL_BYTES]
+            size += len(chunk)
+        end = size if self.log_end is None else min(self.log_end, size)
+        return size, end - len(tail), bytes(tail)
+
+    def request_scrapy_log_appended(self, url):
+        self.log_start = self.get_parse_position(url)
+        headers = dict(Range='bytes=%s-' % self.log_start) if self.log_start else None
+        self.logger.debug(">>>>> GET %s %s", url, headers)
+        try:
+            r = send_request(url, auth=self.AUTH, headers=headers, logger=self.logger)
+        except Exception as err:
+            self.logger.error("!!!!! error with %s: %s", url, err)
+            return -1, str(err)
+        m = re.search(r'bytes (\d+)-(\d+)/(\d+)', r.headers.get('Content-Range', ''))
+        if r.status_code == 206 and m:
+            self.log_size = int(m.group(3))
+            self.appended_log = r.content
+        elif r.status_code == 200:  # Range requests not supported
+            self.log_size = len(r.content)
+            if self.log_start > self.log_size:
+                self.log_start = self.get_parse_position(url, self.log_size)
+            self.appended_log = r.content[self.log_start:]
+        elif r.status_code == 416:  # Content-Range: bytes */2048
+            m = re.search(r'bytes \*/(\d+)', r.headers.get('Content-Range', ''))
+            if m and int(m.group(1)) == self.log_start:  # Nothing appended
+                self.log_size = self.log_start
+                self.appended_log = b''
+            else:  # The logfile has been shrunk
+                self.parse_cache_dict.pop(self.job_key, None)
+                return self.request_scrapy_log_appended(url)
+        else:
+            self.logger.error("!!!!! (%s) %s\n%s", r.status_code, url, r.text)
+            return r.status_code, r.text
+        self.logger.debug("<<<<< (%s) %s: bytes %s-%s/%s", r.status_code, url,
+                          self.log_start, self.log_start + len(self.appended_log), self.log_size)
+        return 200, ''
+
+    def get_parse_position(self, path, size=None):
+        # Start over if the logfile has been changed or shrunk
+        self.parse_cache = self.parse_cache_dict.get(self.job_key)
+        if (not self.parse_cache or self.parse_cache['path'] != path
+           or (size is not None and self.parse_cache['position'] > size)):
+            self.parse_cache = dict(path=path, position=0, stats=None)
+        return self.parse_cache['position']
+
+    def set_log_range(self, content, start):
+        self.log_end = start + len(content)
+        # Drop the leading partial line, which would be loaded along with the previous range
+        if start > 0:
+            index = content.find(b'\n')
+            if index != -1:
+                content = content[index + 1:]
+                start += index + 1
+        self.log_start = start
+        self.text = content.decode('utf-8', 'ignore')
 
     def backup_stats(self):
-        # TODO: delete backup stats json file when the job is deleted in the Jobs page with database view
+        self.delete_expired_backup_stats()
+        # Only if the stats has been updated since the last backup. Note that the last_update_timestamp
+        # would be the time of parsing if the stats is not provided by LogParser, so it is excluded.
+        digest = hashlib.md5(json.dumps(dict((k, v) for (k, v) in self.stats.items()
+                                             if k not in ['last_update_time', 'last_update_timestamp']),
+                                        sort_keys=True).encode('utf-8')).hexdigest()
+        if self.backup_stats_metadata['digests'].get(self.backup_stats_key) == digest:
+            return
+        (server, project, spider, job) = self.backup_stats_key
         try:
-            with io.open(self.backup_stats_path, 'w', encoding='utf-8', errors='ignore') as f:
-                f.write(self.json_dumps(self.stats))
+            record = Stats.query.filter_by(server=server, project=project, spider=spider, job=job).first()
+            if not record:
+                record = Stats(server=server, project=project, spider=spider, job=job)
+                db.session.add(record)
+            elif record.digest == digest:
+                self.backup_stats_metadata['digests'][self.backup_stats_key] = digest
+                return
+            record.digest = digest
+            record.last_update_timestamp = self.stats.get('last_update_timestamp') or 0
+            record.update_time = datetime.now()
+            record.stats = json.dumps(self.stats, ensure_ascii=False, separators=(',', ':'))
+            db.session.commit()
         except Exception as err:
-            self.logger.error("Fail to backup stats to %s: %s" % (self.backup_stats_path, err))
-            try:
-                os.remove(self.backup_stats_path)
-            except:
-                pass
+            db.session.rollback()
+            self.logger.error("Fail to backup stats of %s: %s", self.job_key, err)
         else:
-            self.logger.info("Saved backup stats to %s", self.backup_stats_path)
+            self.backup_stats_metadata['digests'][self.backup_stats_key] = digest
+            self.logger.info("Saved backup stats of %s", self.job_key)
+
+    def save_job_series(self):
+        # For the trend of crawl rates, see the 'trend' opt of ApiView
+        self.delete_expired_backup_stats()
+        try:
+            if save_job_series(*self.backup_stats_key, stats=self.stats):
+                self.logger.debug("Saved the series of %s", self.job_key)
+        except Exception as err:
+            db.session.rollback()
+            self.logger.error("Fail to save the series of %s: %s", self.job_key, err)
+
+    def delete_expired_backup_stats(self):
+        # At most once an hour, see BACKUP_STATS_RETENTION_DAYS
+        if (self.BACKUP_STATS_RETENTION_DAYS <= 0
+           or time.time() - self.backup_stats_metadata['delete_timestamp'] < 3600):
+            return
+        self.backup_stats_metadata['delete_timestamp'] = time.time()
+        expired = datetime.now() - timedelta(days=self.BACKUP_STATS_RETENTION_DAYS)
+        try:
+            count = Stats.query.filter(Stats.update_time < expired).delete(synchronize_session=False)
+            JobSeries.query.filter(JobSeries.update_time < expired).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as err:
+            db.session.rollback()
+            self.logger.error("Fail to delete the expired backup stats: %s", err)
+        else:
+            # Check the database again, the stats cached in the digests might be deleted by another process
+            self.backup_stats_metadata['digests'].clear()
+            if count:
+                self.logger.warning("Deleted %s backup stats not updated since %s", count, expired)
 
     def load_backup_stats(self):
-        self.logger.debug("Try to load backup stats by LogParser: %s", self.json_path)
+        self.logger.debug("Try to load backup stats: %s", self.job_key)
+        (server, project, spider, job) = self.backup_stats_key
         try:
-            with io.open(self.backup_stats_path, 'r', encoding='utf-8') as f:
-                js = json.loads(f.read())
+            record = Stats.query.filter_by(server=server, project=project, spider=spider, job=job).first()
+            assert record, "not found"
+            js = json.loads(record.stats)
         except Exception as err:
-            self.logger.error("Fail to load backup stats from %s: %s", self.backup_stats_path, err)
+            self.logger.error("Fail to load backup stats of %s: %s", self.job_key, err)
         else:
             if js.get('logparser_version') != self.LOGPARSER_VERSION:
                 msg = "Mismatching logparser_version %s in backup stats" % js.get('logparser_version')
@@ -264,7 +550,7 @@ class LogView(MyView):
             self.backup_stats_valid = True
             self.stats = js
             msg = "Using backup stats: LogParser v%s, last updated at %s, %s" % (
-                js['logparser_version'], js['last_update_time'], self.handle_slash(self.backup_stats_path))
+                js['logparser_version'], js['last_update_time'], record.update_time.strftime('%Y-%m-%d %H:%M:%S'))
             self.logger.info(msg)
             flash(msg, self.WARN)
 
@@ -282,7 +568,15 @@ class LogView(MyView):
         if self.utf8_realtime:
             self.kwargs['text'] = self.text
             self.kwargs['last_update_timestamp'] = time.time()
-            if self.job_finished or self.job_key in self.job_finished_set:
+            self.kwargs['log_start'] = self.log_start
+            self.kwargs['log_size'] = self.log_size
+            if self.log_start > 0:
+                self.kwargs['url_load_more'] = url_for('log', node=self.node, opt='utf8', project=self.project,
+                                                       spider=self.spider, job=self.job, with_ext=self.with_ext,
+                                                       end=self.log_start, load_more='True')
+            else:
+                self.kwargs['url_load_more'] = ''
+            if self.is_job_finished():
                 self.kwargs['url_refresh'] = ''
             else:
                 self.kwargs['url_refresh'] = 'javascript:location.reload(true);'
@@ -292,6 +586,9 @@ class LogView(MyView):
             if self.logparser_valid:
                 for d in self.stats['datas']:
                     d[0] = str(d[0])
+            elif self.appended_log is not None:
+                self.parse_appended_log()
+                self.stats['crawler_engine'] = {}
             else:
                 self.logger.warning('Parse the whole log')
                 self.stats = parse(self.text)
@@ -304,11 +601,11 @@ class LogView(MyView):
 
             if self.BACKUP_STATS_JSON_FILE:
                 self.backup_stats()
+            self.save_job_series()
             self.kwargs.update(self.stats)
 
             if (self.kwargs['finish_reason'] == self.NA
-               and not self.job_finished
-               and self.job_key not in self.job_finished_set):
+               and not self.is_job_finished()):
                 # http://flask.pocoo.org/docs/1.0/api/#flask.Request.url_root
                 # _query_string = '?ui=mobile'
                 # self.url_refresh = request.script_root + request.path + _query_string
@@ -334,12 +631,125 @@ class LogView(MyView):
                                                       project=self.project, spider=self.spider, job=self.job,
                                                       job_finished=self.job_finished, with_ext=self.with_ext,
                                                       ui=self.UI)
+        if self.opt == 'stats' and self.kwargs['url_refresh'] and self.PUSH_INTERVAL > 0:
+            self.kwargs['url_events'] = url_for('log.events', node=self.node, project=self.project,
+                                                spider=self.spider, job=self.job, with_ext=self.with_ext,
+                                                realtime='True' if self.stats_realtime else None)
+        else:
+            self.kwargs['url_events'] = ''
+
+    def parse_appended_log(self):
+        content = self.appended_log
+        text = content.decode('utf-8', 'ignore')
+        job_finished = self.is_job_finished()
+        # Leave the last log entry for the next visit to ensure the integrity of log with multilines,
+        # e.g. error with traceback info, just like find_text_to_ignore() of LogParser
+        if not job_finished and not re.search(PATTERN_LOG_ENDING, text):
+            index = 0
+            for m in re.finditer(LOG_ENTRY_PATTERN, content):
+                index = m.start() + 1
+            if index < len(content):
+                content = content[:index]
+                text = content.decode('utf-8', 'ignore')
+        self.logger.warning("Parse the appended log: bytes %s-%s/%s", self.log_start,
+                            self.log_start + len(content), self.log_size)
+        stats = parse(text, LOG_HEAD_LINES, LOG_TAIL_LINES)
+        if self.parse_cache['stats']:
+            stats = self.merge_stats(deepcopy(self.parse_cache['stats']), stats)
+        self.trim_stats(stats)
+        if job_finished or stats['finish_reason'] != self.NA:
+            self.parse_cache_dict.pop(self.job_key, None)
+            self.stats = stats
+        else:
+            self.parse_cache_dict[self.job_key] = dict(path=self.parse_cache['path'],
+                                                       position=self.log_start + len(content), stats=stats)
+            self.stats = deepcopy(stats)
+
+    @staticmethod
+    def trim_stats(stats):
+        # Note that the counts of the log categories are kept, see 'last N of M' in the Stats page
+        for v in stats['log_categories'].values():
+            del v['details'][:-PARSE_CACHE_DETAILS_LIMIT]
+        if len(stats['datas']) > PARSE_CACHE_DATAS_LIMIT:
+            # Halve the resolution of the crawl rates chart, with the latest point kept
+            stats['datas'] = stats['datas'][::-2][::-1]
+
+    # REF: parse_appended_log() of LogParser
+    def merge_stats(self, stats, stats_appended):
+        for k in ['head', 'tail']:
+            lines = re.split(LINESEP_PATTERN, '\n'.join([i for i in [stats[k], stats_appended[k]] if i]))
+            stats[k] = '\n'.join(lines[:LOG_HEAD_LINES] if k == 'head' else lines[-LOG_TAIL_LINES:])
+
+        if stats['first_log_time'] == self.NA:
+            stats['first_log_time'] = stats_appended['first_log_time']
+            stats['first_log_timestamp'] = stats_appended['first_log_timestamp']
+        if stats_appended['latest_log_time'] != self.NA:
+            stats['latest_log_time'] = stats_appended['latest_log_time']
+            stats['latest_log_timestamp'] = stats_appended['latest_log_timestamp']
+        try:
+            stats['runtime'] = str(datetime.strptime(stats['latest_log_time'], '%Y-%m-%d %H:%M:%S')
+                                   - datetime.strptime(stats['first_log_time'], '%Y-%m-%d %H:%M:%S'))
+        except (TypeError, ValueError):
+            stats['runtime'] = self.NA
+
+        stats['datas'].extend(stats_appended['datas'])
+        for k in ['pages', 'items']:
+            if stats[k] is None:
+                stats[k] = stats_appended[k]
+            elif stats_appended[k] is not None:
+                stats[k] = max(stats[k], stats_appended[k])
+
+        for k, v in stats_appended['latest_matches'].items():
+            stats['latest_matches'][k] = v or stats['latest_matches'][k]
+        for k in ['latest_crawl', 'latest_scrape']:
+            if stats_appended['latest_matches'][k]:
+                stats['%s_timestamp' % k] = stats_appended['%s_timestamp' % k]
+
+        # The counts would be extracted from the dumped Scrapy stats once the job is finished
+        for k, v in stats_appended['log_categories'].items():
+            if v['count'] > 0:
+                if stats_appended['finish_reason'] != self.NA:
+                    stats['log_categories'][k]['count'] = v['count']
+                else:
+                    stats['log_categories'][k]['count'] += v['count']
+            stats['log_categories'][k]['details'].extend(v['details'])
+
+        for k in ['shutdown_reason', 'finish_reason']:
+            if stats_appended[k] != self.NA:
+                stats[k] = stats_appended[k]
+        stats['crawler_stats'] = stats_appended['crawler_stats'] or stats['crawler_stats']
+        stats['last_update_time'] = stats_appended['last_update_time']
+        stats['last_update_timestamp'] = stats_appended['last_update_timestamp']
+        return stats
+
+    def get_job_notice(self):
+        try:
+            return JobNotice.query.filter_by(server=self.SCRAPYD_SERVER, project=self.project,
+                                             spider=self.spider, job=self.job).first()
+        except Exception as err:
+            db.session.rollback()
+            self.logger.error("Fail to load the email notice state of %s: %s", self.job_key, err)
+            return None
+
+    def is_job_finished(self):
+        if self.job_finished:
+            return True
+        if self.job_finished_noticed is None:
+            job_notice = self.get_job_notice()
+            self.job_finished_noticed = bool(job_notice and job_notice.finished)
+        return self.job_finished_noticed
 
     def email_notice(self):
-        job_data_default = ([0] * 8, [False] * 6, False, time.time())
-        job_data = self.job_data_dict.setdefault(self.job_key, job_data_default)
+        self.job_notice = self.get_job_notice()
+        if not self.job_notice:
+            self.job_notice = JobNotice(server=self.SCRAPYD_SERVER, project=self.project, spider=self.spider,
+                                        job=self.job, job_stats=json.dumps([0] * 8),
+                                        triggered=json.dumps([False] * 6), has_been_stopped=False,
+                                        last_send_timestamp=time.time())
+        job_data = (json.loads(self.job_notice.job_stats), json.loads(self.job_notice.triggered),
+                    self.job_notice.has_been_stopped, self.job_notice.last_send_timestamp)
         (self.job_stats_previous, self.triggered_list, self.has_been_stopped, self.last_send_timestamp) = job_data
-        self.logger.info(self.job_data_dict)
+        self.logger.info("job_data['%s'] %s", self.job_key, job_data)
         self.job_stats = [self.kwargs['log_categories'][k.lower() + '_logs']['count']
                           for k in self.EMAIL_TRIGGER_KEYS]
         self.job_stats.extend([self.kwargs['pages'] or 0, self.kwargs['items'] or 0])  # May be None by LogParser
@@ -362,7 +772,9 @@ class LogView(MyView):
         self.email_content_kwargs['runtime'] = self.kwargs['runtime']
         self.email_content_kwargs['shutdown_reason'] = self.kwargs['shutdown_reason']
         self.email_content_kwargs['finish_reason'] = self.kwargs['finish_reason']
-        self.email_content_kwargs['url_stats'] = request.url + '%sui=mobile' % '&' if request.args else '?'
+        _url_stats = url_for('log', node=self.node, opt='stats', project=self.project, spider=self.spider,
+                             job=self.job, job_finished=self.job_finished or None, ui='mobile')
+        self.email_content_kwargs['url_stats'] = self.URL_SCRAPYDWEB + _url_stats
 
         for idx, key in enumerate(EMAIL_CONTENT_KEYS):
             if self.job_stats_diff[idx]:
@@ -413,16 +825,10 @@ class LogView(MyView):
                         self.flag = '%s_Trigger' % key if not self.flag else self.flag
             if to_forcestop:
                 self.logger.debug("%s: %s", self.flag, self.job_key)
-                # api(self.node, 'forcestop', self.project, self.job)
-                _url = url_for('api', node=self.node, opt='forcestop',
-                               project=self.project, version_spider_job=self.job)
-                self.get_response_from_view(_url)
+                cancel_job(self.node, self.project, self.job, force=True, logger=self.logger)
             elif to_stop:
                 self.logger.debug("%s: %s", self.flag, self.job_key)
-                # api(self.node, 'stop', self.project, self.job)
-                _url = url_for('api', node=self.node, opt='stop',
-                               project=self.project, version_spider_job=self.job)
-                self.get_response_from_view(_url)
+                cancel_job(self.node, self.project, self.job, force=False, logger=self.logger)
 
         if not self.flag and 0 < self.ON_JOB_RUNNING_INTERVAL <= time.time() - self.last_send_timestamp:
             self.flag = 'Running'
@@ -453,14 +859,93 @@ class LogView(MyView):
                 self.logger.info("Sending email: %s", self.EMAIL_KWARGS['subject'])
                 Popen(args)
 
-            # Update self.job_data_dict (last_send_timestamp would be updated only when flag is non-empty)
-            self.logger.info("Previous job_data['%s'] %s", self.job_key, self.job_data_dict[self.job_key])
-            self.job_data_dict[self.job_key] = (self.job_stats, self.triggered_list, self.has_been_stopped, time.time())
-            self.logger.info("Updated  job_data['%s'] %s", self.job_key, self.job_data_dict[self.job_key])
-
+            # Update job_data (last_send_timestamp would be updated only when flag is non-empty)
+            self.job_notice.job_stats = json.dumps(self.job_stats)
+            self.job_notice.has_been_stopped = self.has_been_stopped
+            self.job_notice.last_send_timestamp = time.time()
+            self.logger.info("Updated job_data['%s'] %s", self.job_key,
+                             (self.job_stats, self.triggered_list, self.has_been_stopped))
+        # The triggers fired would not be fired again, even if no email is sent
+        self.job_notice.triggered = json.dumps(self.triggered_list)
+        self.job_notice.update_time = datetime.now()
         if self.job_finished:
-            self.job_data_dict.pop(self.job_key)
-            if len(self.job_finished_set) > 1000:
-                self.job_finished_set.clear()
-            self.job_finished_set.add(self.job_key)
+            self.job_notice.finished = True
             self.logger.info('job_finished: %s', self.job_key)
+        try:
+            db.session.add(self.job_notice)
+            if self.job_finished:
+                expired = datetime.now() - timedelta(days=JOB_NOTICE_RETENTION_DAYS)
+                JobNotice.query.filter(JobNotice.update_time < expired).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as err:
+            db.session.rollback()
+            self.logger.error("Fail to save the email notice state of %s: %s", self.job_key, err)
+
+
+class LogPollView(LogView):
+    # Evaluate stats and email triggers of jobs in batches for poll.py, without rendering any template.
+    # POST jobs='[["project", "spider", "job", "True"], ...]', the last element is job_finished ('' or 'True').
+    methods = ['POST']
+
+    def __init__(self):
+        super(LogView, self).__init__()  # Skip LogView.__init__() which requires view_args of a job
+
+        self.jobs = json.loads(request.form.get('jobs', '[]'))
+        self.results = []
+
+    def dispatch_request(self, **kwargs):
+        for (project, spider, job, job_finished) in self.jobs:
+            self.init_job('stats', project, spider, job, job_finished=job_finished or None)
+            result = dict(project=project, spider=spider, job=job)
+            try:
+                if not self.load_stats_or_log():
+                    result.update(status=self.ERROR, status_code=self.status_code, url=self.url)
+                else:
+                    self.update_kwargs()
+                    if self.ENABLE_EMAIL:
+                        self.email_notice()
+                    result.update(status=self.OK, flag=self.flag, finish_reason=self.kwargs['finish_reason'],
+                                  pages=self.kwargs['pages'], items=self.kwargs['items'])
+            except Exception as err:
+                self.logger.error("Fail to evaluate stats of %s: %s", self.job_key, err)
+                result.update(status=self.ERROR, message=str(err))
+            self.results.append(result)
+        get_flashed_messages()  # Discard the messages flashed for the Stats page
+        return self.json_dumps(dict(status=self.OK, results=self.results))
+
+
+class LogEventsView(LogView):
+    # Push the stats of a running job to the Stats page via server-sent events, see PUSH_INTERVAL.
+    # The poll is shared by all the subscribers of the same job via poll_events().
+
+    def __init__(self):
+        super(LogEventsView, self).__init__()
+
+        self.interval = max(self.PUSH_INTERVAL, 1)
+        self.duration = request.args.get('duration', None, type=int)  # For test only
+        self.realtime = request.args.get('realtime', None)
+
+    def dispatch_request(self, **kwargs):
+        kws = dict(duration=self.duration) if self.duration else {}
+        return make_event_stream(generate_events('stats', self.poll, self.interval,
+                                                 until=lambda stats: stats['finish_reason'] != self.NA, **kws),
+                                 max_streams=self.PUSH_MAX_STREAMS)
+
+    def poll(self):
+        return poll_events(('stats', self.job_key, self.realtime), self.get_stats, self.interval)
+
+    def get_stats(self):
+        self.init_job('stats', self.project, self.spider, self.job, with_ext=self.with_ext, realtime=self.realtime)
+        try:
+            if not self.load_stats_or_log():
+                return None
+            self.update_kwargs()
+        except Exception as err:
+            self.logger.error("Fail to push stats of %s: %s", self.job_key, err)
+            return None
+        finally:
+            get_flashed_messages()  # The session would not be saved anymore for a streamed response
+        stats = dict((k, self.kwargs[k]) for k in PUSH_STATS_KEYS)
+        for k, v in self.kwargs['log_categories'].items():
+            stats['log_%s_count' % k[:-len('_logs')]] = v['count']
+        return stats
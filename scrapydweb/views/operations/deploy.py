@@ -12,14 +12,15 @@ import tempfile
 import time
 import zipfile
 
-from flask import flash, redirect, render_template, request, url_for
+from flask import Response, flash, redirect, render_template, request, stream_with_context, url_for
 from six.moves.configparser import Error as ScrapyCfgParseError
 from werkzeug.utils import secure_filename
 
+from ...utils.service import imake_requests
 from ...vars import PY2
 from ..myview import MyView
 from .scrapyd_deploy import _build_egg, get_config
-from .utils import mkdir_p, slot
+from .utils import egg_cache, get_tree_digest, get_tree_mtime, mkdir_p, slot, tree_indexes
 
 
 SCRAPY_CFG = """
@@ -105,7 +106,14 @@ class DeployView(MyView):
         self.scrapy_cfg_list.sort(key=lambda x: x.lower())
 
     def get_modification_times(self):
-        timestamps = [self.get_modification_time(path) for path in self.project_paths]
+        timestamps = []
+        for path in self.project_paths:
+            try:
+                timestamps.append(get_tree_mtime(path))
+            except UnicodeDecodeError:
+                timestamps.append(self.get_modification_time(path))
+        for path in set(tree_indexes.keys()).difference(self.project_paths):
+            tree_indexes.pop(path, None)
         self.modification_times = [datetime.fromtimestamp(ts).strftime('%Y-%m-%dT%H_%M_%S') for ts in timestamps]
 
         if timestamps:
@@ -201,6 +209,7 @@ class DeployUploadView(MyView):
         self.js = {}
 
         self.slot = slot
+        self.egg_cache = egg_cache
 
     def dispatch_request(self, **kwargs):
         self.handle_form()
@@ -407,6 +416,20 @@ class DeployUploadView(MyView):
             self.scrapy_cfg_path = ''
 
     def build_egg(self):
+        scrapy_cfg_dir = os.path.dirname(self.scrapy_cfg_path)
+        try:
+            digest = get_tree_digest(scrapy_cfg_dir)
+        except (UnicodeDecodeError, IOError, OSError) as err:
+            self.logger.warning("Fail to get the digest of %s, the egg would not be cached: %s", scrapy_cfg_dir, err)
+            digest = None
+        egg = self.egg_cache.get(digest) if digest else None
+        if egg:
+            self.logger.debug("Reuse the egg built from the same project tree: %s", egg)
+            copyfile(egg, os.path.join(scrapy_cfg_dir, self.eggname))
+            copyfile(egg, self.eggpath)
+            self.logger.debug("Egg file saved to: %s", self.eggpath)
+            return
+
         try:
             egg, tmpdir = _build_egg(self.scrapy_cfg_path)
         except ScrapyCfgParseError as err:
@@ -418,9 +441,10 @@ class DeployUploadView(MyView):
             self.build_egg_subprocess_error = err
             return
 
-        scrapy_cfg_dir = os.path.dirname(self.scrapy_cfg_path)
         copyfile(egg, os.path.join(scrapy_cfg_dir, self.eggname))
         copyfile(egg, self.eggpath)
+        if digest:
+            self.egg_cache.add(digest, egg)
         rmtree(tmpdir)
         self.logger.debug("Egg file saved to: %s", self.eggpath)
 
@@ -450,17 +474,36 @@ class DeployXhrView(MyView):
         self.slot = slot
 
     def dispatch_request(self, **kwargs):
+        # Multinode deployment: POST nodes=2,3 to deploy the same egg to all the nodes in a single request
+        nodes = [int(n) for n in request.form.get('nodes', '').split(',')
+                 if n.isdigit() and 0 < int(n) <= self.SCRAPYD_SERVERS_AMOUNT]
+        # Loaded from DEPLOY_PATH if not in memory
         content = self.slot.egg.get(self.eggname)
-        # content = None  # For test only
-        if not content:
-            eggpath = os.path.join(self.DEPLOY_PATH, self.eggname)
-            with io.open(eggpath, 'rb') as f:
-                content = f.read()
-
+        if content is None:
+            js = dict(status=self.ERROR, message="The egg %s is not found, please deploy again" % self.eggname)
+            self.logger.error(js['message'])
+            if nodes:
+                return Response(''.join(self.json_dumps(dict(js, node=node), indent=None) + '\n' for node in nodes),
+                                mimetype='application/x-ndjson')
+            return self.json_dumps(js)
         data = {
             'project': self.project,
             'version': self.version,
             'egg': content
         }
+        if nodes:
+            return Response(stream_with_context(self.deploy_to_nodes(nodes, data)), mimetype='application/x-ndjson',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
         status_code, js = self.make_request(self.url, data=data, auth=self.AUTH)
         return self.json_dumps(js)
+
+    def deploy_to_nodes(self, nodes, data):
+        """Yield a line of JSON for each node as soon as its deployment is done, with at most
+        DEPLOY_CONCURRENCY uploads at a time. The egg in data is shared by all the requests."""
+        kwargs_list = [dict(url='http://%s/addversion.json' % self.SCRAPYD_SERVERS[node - 1], data=data,
+                            auth=self.SCRAPYD_SERVERS_AUTHS[node - 1], dumps_json=False)
+                       for node in nodes]
+        for index, (status_code, js) in imake_requests(kwargs_list, concurrency=self.DEPLOY_CONCURRENCY,
+                                                       logger=self.logger):
+            js['node'] = nodes[index]
+            yield self.json_dumps(js, indent=None) + '\n'
@@ -1,6 +1,7 @@
 # coding: utf-8
 import json
 import logging
+from multiprocessing.dummy import Pool as ThreadPool
 import re
 import time
 import traceback
@@ -8,22 +9,21 @@ import traceback
 from ...common import get_now_string, get_response_from_view, handle_metadata
 from ...models import Task, TaskResult, TaskJobResult, db
 from ...utils.scheduler import scheduler
+from ...utils.service import schedule_task
 
 
 apscheduler_logger = logging.getLogger('apscheduler')
 
-REPLACE_URL_NODE_PATTERN = re.compile(r'^/(\d+)/')
 EXTRACT_URL_SERVER_PATTERN = re.compile(r'//(.+?:\d+)')
 
 
 class TaskExecuter(object):
 
-    def __init__(self, task_id, task_name, url_scrapydweb, url_schedule_task, url_delete_task_result,
-                 auth, selected_nodes):
+    def __init__(self, task_id, task_name, url_scrapydweb, url_delete_task_result, auth, selected_nodes,
+                 concurrency=1):
         self.task_id = task_id
         self.task_name = task_name
         self.url_scrapydweb = url_scrapydweb
-        self.url_schedule_task = url_schedule_task
         self.url_delete_task_result = url_delete_task_result
         self.auth = auth
         self.data = dict(
@@ -31,33 +31,28 @@ class TaskExecuter(object):
             jobid='task_%s_%s' % (task_id, get_now_string(allow_space=False))
         )
         self.selected_nodes = selected_nodes
+        self.concurrency = concurrency
         self.task_result_id = None  # Be set in get_task_result_id()
         self.pass_count = 0
         self.fail_count = 0
 
-        self.sleep_seconds_before_retry = 3
-        self.nodes_to_retry = []
+        self.retry_times = 2
+        self.sleep_seconds_before_retry = 3  # Doubled for every retry
         self.logger = logging.getLogger(self.__class__.__name__)
 
     def main(self):
         self.get_task_result_id()
-        for index, nodes in enumerate([self.selected_nodes, self.nodes_to_retry]):
-            if not nodes:
-                continue
-            if index == 1:
-                # https://apscheduler.readthedocs.io/en/latest/userguide.html#shutting-down-the-scheduler
-                self.logger.info("Retry task #%s (%s) on nodes %s in %s seconds",
-                                 self.task_id, self.task_name, nodes, self.sleep_seconds_before_retry)
-                time.sleep(self.sleep_seconds_before_retry)
-                self.logger.warning("Retrying task #%s (%s) on nodes %s", self.task_id, self.task_name, nodes)
-            for node in nodes:
-                result = self.schedule_task(node)
-                if result:
-                    if result['status'] == 'ok':
-                        self.pass_count += 1
-                    else:
-                        self.fail_count += 1
-                    self.db_insert_task_job_result(result)
+        # Fan out to the selected nodes concurrently so that the jobs would start at almost the same time
+        pool = ThreadPool(max(1, min(self.concurrency, len(self.selected_nodes))))
+        results = pool.map(self.schedule_task_with_retry, self.selected_nodes)
+        pool.close()
+        pool.join()
+        for result in results:
+            if result['status'] == 'ok':
+                self.pass_count += 1
+            else:
+                self.fail_count += 1
+        self.db_insert_task_job_results(results)
         self.db_update_task_result()
 
     def get_task_result_id(self):
@@ -72,26 +67,32 @@ class TaskExecuter(object):
             self.task_result_id = task_result.id
             self.logger.debug("Get new task_result_id %s for task #%s", self.task_result_id, self.task_id)
 
-    def schedule_task(self, node):
-        # TODO: Application was not able to create a URL adapter for request independent URL generation.
-        # You might be able to fix this by setting the SERVER_NAME config variable.
-        # with app.app_context():
-        #     url_schedule_task = url_for('schedule.task', node=node)
-        # http://127.0.0.1:5000/1/schedule/task/
-        # /1/schedule/task/
-        url_schedule_task = re.sub(REPLACE_URL_NODE_PATTERN, r'/%s/' % node, self.url_schedule_task)
+    def schedule_task_with_retry(self, node):
+        # Task.query in schedule_task() requires the app context in each thread
+        with db.app.app_context():
+            for count in range(self.retry_times + 1):
+                if count:
+                    # https://apscheduler.readthedocs.io/en/latest/userguide.html#shutting-down-the-scheduler
+                    sleep_seconds = self.sleep_seconds_before_retry * 2 ** (count - 1)
+                    self.logger.info("Retry task #%s (%s) on node %s in %s seconds",
+                                     self.task_id, self.task_name, node, sleep_seconds)
+                    time.sleep(sleep_seconds)
+                    self.logger.warning("Retrying task #%s (%s) on node %s", self.task_id, self.task_name, node)
+                result = self.schedule_task(node, last_try=count == self.retry_times)
+                if result:
+                    return result
+
+    def schedule_task(self, node, last_try=True):
         js = {}
         try:
-            # assert '/1/' not in url_schedule_task, u"'故意出错'\r\n\"出错\"'故意出错'\r\n\"出错\""
             # assert False
             # time.sleep(10)
-            js = get_response_from_view(url_schedule_task, auth=self.auth, data=self.data, as_json=True)
+            js = schedule_task(node, self.task_id, self.data['jobid'], logger=apscheduler_logger)
             assert js['status_code'] == 200 and js['status'] == 'ok', "Request got %s" % js
         except Exception as err:
-            if node not in self.nodes_to_retry:
+            if not last_try:
                 apscheduler_logger.warning("Fail to execute task #%s (%s) on node %s, would retry later: %s",
                                            self.task_id, self.task_name, node, err)
-                self.nodes_to_retry.append(node)
                 return {}
             else:
                 apscheduler_logger.error("Fail to execute task #%s (%s) on node %s, no more retries: %s",
@@ -103,23 +104,26 @@ class TaskExecuter(object):
         js.update(node=node)
         return js
 
-    def db_insert_task_job_result(self, js):
+    # Insert the results of all nodes in one transaction
+    def db_insert_task_job_results(self, results):
         with db.app.app_context():
             if not TaskResult.query.get(self.task_result_id):
                 apscheduler_logger.error("task_result #%s of task #%s not found", self.task_result_id, self.task_id)
-                apscheduler_logger.warning("Discard task_job_result of task_result #%s of task #%s: %s",
-                                           self.task_result_id, self.task_id, js)
+                apscheduler_logger.warning("Discard task_job_results of task_result #%s of task #%s: %s",
+                                           self.task_result_id, self.task_id, results)
                 return
-            task_job_result = TaskJobResult()
-            task_job_result.task_result_id = self.task_result_id
-            task_job_result.node = js['node']
-            task_job_result.server = re.search(EXTRACT_URL_SERVER_PATTERN, js['url']).group(1)  # '127.0.0.1:6800'
-            task_job_result.status_code = js['status_code']
-            task_job_result.status = js['status']
-            task_job_result.result = js.get('jobid', '') or js.get('message', '') or js.get('exception', '')
-            db.session.add(task_job_result)
+            for js in results:
+                task_job_result = TaskJobResult()
+                task_job_result.task_result_id = self.task_result_id
+                task_job_result.node = js['node']
+                task_job_result.server = re.search(EXTRACT_URL_SERVER_PATTERN, js['url']).group(1)  # '127.0.0.1:6800'
+                task_job_result.status_code = js['status_code']
+                task_job_result.status = js['status']
+                task_job_result.result = js.get('jobid', '') or js.get('message', '') or js.get('exception', '')
+                db.session.add(task_job_result)
             db.session.commit()
-            self.logger.warning("Inserted %s", task_job_result)
+            self.logger.warning("Inserted %s task_job_results of task_result #%s",
+                                len(results), self.task_result_id)
 
     # https://stackoverflow.com/questions/13895176/sqlalchemy-and-sqlite-database-is-locked
     def db_update_task_result(self):
@@ -162,10 +166,10 @@ def execute_task(task_id):
             task_executer = TaskExecuter(task_id=task_id,
                                          task_name=task.name,
                                          url_scrapydweb=metadata.get('url_scrapydweb', 'http://127.0.0.1:5000'),
-                                         url_schedule_task=metadata.get('url_schedule_task', '/1/schedule/task/'),
                                          url_delete_task_result=url_delete_task_result,
                                          auth=(username, password) if username and password else None,
-                                         selected_nodes=json.loads(task.selected_nodes))
+                                         selected_nodes=json.loads(task.selected_nodes),
+                                         concurrency=db.app.config.get('TIMER_TASK_CONCURRENCY', 10))
             try:
                 task_executer.main()
             except Exception:
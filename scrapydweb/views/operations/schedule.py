@@ -6,13 +6,13 @@ import json
 import logging
 from math import ceil
 import os
-import pickle
 import re
 import traceback
 
 from flask import Blueprint, redirect, render_template, request, send_file, url_for
 
 from ...models import Task, db
+from ...utils.service import schedule_task
 from ...vars import RUN_SPIDER_HISTORY_LOG, UA_DICT
 from ..myview import MyView
 from .execute_task import execute_task
@@ -225,6 +225,8 @@ class ScheduleCheckView(MyView):
         self.logger.warning('request.form from %s\n%s', request.url, self.json_dumps(request.form))
         self.prepare_data()
         self.update_data_for_timer_task()
+        # Saved in SCHEDULE_PATH as a draft, so that the other worker processes could load it
+        self.slot.add_data(self.filename, self.data)
         # self.logger.warning(self.json_dumps(self.data))  # TypeError: Object of type datetime is not JSON serializable
         cmd = generate_cmd(self.AUTH, self.url, self.data)
         # '-d' may be in project name, like 'ScrapydWeb-demo'
@@ -273,12 +275,7 @@ class ScheduleCheckView(MyView):
         _filename = '{project}_{version}_{spider}'.format(project=self.data['project'],
                                                           version=_version,
                                                           spider=self.data['spider'])
-        self.filename = '%s.pickle' % re.sub(self.LEGAL_NAME_PATTERN, '-', _filename)
-        filepath = os.path.join(self.SCHEDULE_PATH, self.filename)
-        with io.open(filepath, 'wb') as f:
-            f.write(pickle.dumps(self.data))
-
-        self.slot.add_data(self.filename, self.data)
+        self.filename = '%s.json' % re.sub(self.LEGAL_NAME_PATTERN, '-', _filename)
 
     def get_int_from_form(self, key, default, minimum):
         value = request.form.get(key) or default
@@ -374,11 +371,6 @@ class ScheduleRunView(MyView):
 
         # in handle_action():   self.data.pop('__task_data', {})    self.task_data.pop
         self.data = self.slot.data.get(self.filename, {})
-        # self.data = None  # For test only
-        if not self.data:
-            filepath = os.path.join(self.SCHEDULE_PATH, self.filename)
-            with io.open(filepath, 'rb') as f:
-                self.data = pickle.loads(f.read())
 
     def handle_action(self):
         self.logger.warning(self.json_dumps(self.data))
@@ -393,6 +385,7 @@ class ScheduleRunView(MyView):
         else:
             self._action = 'run'
             status_code, self.js = self.make_request(self.url, data=self.data, auth=self.AUTH)
+            self.invalidate_jobs_cache(self.selected_nodes[0])
 
     # https://apscheduler.readthedocs.io/en/latest/userguide.html
     # https://apscheduler.readthedocs.io/en/latest/modules/triggers/cron.html#module-apscheduler.triggers.cron
@@ -604,13 +597,14 @@ class ScheduleXhrView(MyView):
 
     def dispatch_request(self, **kwargs):
         self.data = self.slot.data.get(self.filename)
-        # self.data = None  # For test only
-        if not self.data:
-            filepath = os.path.join(self.SCHEDULE_PATH, self.filename)
-            with io.open(filepath, 'rb') as f:
-                self.data = pickle.loads(f.read())
+        if self.data is None:
+            js = dict(status=self.ERROR, message="The data to schedule %s is not found or has expired, "
+                                                 "please check again" % self.filename)
+            self.logger.error(js['message'])
+            return self.json_dumps(js)
 
         status_code, js = self.make_request(self.url, data=self.data, auth=self.AUTH)
+        self.invalidate_jobs_cache()
         return self.json_dumps(js)
 
 
@@ -619,24 +613,9 @@ class ScheduleTaskView(MyView):
     def __init__(self):
         super(ScheduleTaskView, self).__init__()
 
-        self.url = 'http://%s/schedule.json' % self.SCRAPYD_SERVER
         self.task_id = request.form['task_id']
         self.jobid = request.form['jobid']
-        self.data = {}
 
     def dispatch_request(self, **kwargs):
-        task = Task.query.get(self.task_id)
-        if not task:
-            message = "Task #%s not found" % self.task_id
-            self.logger.error(message)
-            js = dict(url=self.url, auth=self.AUTH, status_code=-1, status=self.ERROR, message=message)
-        else:
-            self.data['project'] = task.project
-            if task.version != self.DEFAULT_LATEST_VERSION:
-                self.data['_version'] = task.version
-            self.data['spider'] = task.spider
-            self.data['jobid'] = self.jobid
-            self.data.update(json.loads(task.settings_arguments))
-            status_code, js = self.make_request(self.url, data=self.data, auth=self.AUTH)
-
+        js = schedule_task(self.node, self.task_id, self.jobid, logger=self.logger)
         return self.json_dumps(js)
@@ -1,15 +1,125 @@
 # coding: utf-8
 from collections import OrderedDict
 import errno
+import glob
+import hashlib
+import io
+import json
 import os
+from shutil import copyfile
+import sys
+import threading
+import time
 
+from ...vars import DEPLOY_PATH, EGG_CACHE_PATH, PY2, SCHEDULE_PATH
 
-class Slot:
-    def __init__(self, limit_egg=10, limit_data=10):
-        self.limit_egg = limit_egg
-        self.limit_data = limit_data
-        self._egg = OrderedDict()
-        self._data = OrderedDict()
+
+class SlotStore(object):
+    """Values saved as files in path, with the recently used ones kept in memory up to limit bytes in total.
+
+    Since every value is saved as a file, the least recently used ones could simply be dropped from memory,
+    and a value added by another worker process would be loaded from its file on the first get().
+    The mtime of the file is kept along with the value in memory, and the file would be loaded again
+    once its mtime changes, e.g. the value has been replaced by another worker process.
+    The serialized values are kept in memory, so that every get() returns a new copy.
+    If ttl > 0, the values would expire ttl seconds after added, and the expired files are removed in add().
+    """
+    def __init__(self, path, limit, dumps=None, loads=None, ttl=0):
+        self.path = path
+        self.limit = limit
+        self.dumps = dumps or (lambda value: value)
+        self.loads = loads or (lambda data: data)
+        self.ttl = ttl
+        self.size = 0
+        self._data = OrderedDict()  # {key: (mtime of the file, serialized value)}
+        self.lock = threading.Lock()
+
+    def get_filepath(self, key):
+        return os.path.join(self.path, os.path.basename(key))
+
+    def is_expired(self, timestamp):
+        return self.ttl > 0 and time.time() - timestamp > self.ttl
+
+    def get_mtime(self, key):
+        try:
+            return os.path.getmtime(self.get_filepath(key))
+        except OSError:
+            return None
+
+    def get(self, key, default=None):
+        with self.lock:
+            (timestamp, data) = self._data.pop(key, (0, None))
+            if data is not None:
+                self._data[key] = (timestamp, data)  # Most recently used
+        mtime = self.get_mtime(key)
+        if data is None or (mtime is not None and mtime != timestamp):
+            try:
+                with io.open(self.get_filepath(key), 'rb') as f:
+                    data = f.read()
+            except (IOError, OSError):
+                return default
+            timestamp = mtime
+            self.keep(key, timestamp, data)
+        if self.is_expired(timestamp):
+            return default
+        return self.loads(data)
+
+    def add(self, key, value, save=True):
+        """Pass in save=False if the file of the value has been saved by the caller."""
+        data = self.dumps(value)
+        if save:
+            self.remove_expired()
+            filepath = self.get_filepath(key)
+            temp_path = '%s.%s.%s.tmp' % (filepath, os.getpid(), threading.current_thread().ident)
+            with io.open(temp_path, 'wb') as f:
+                f.write(data)
+            if PY2:
+                if os.path.exists(filepath):  # os.rename() would fail in Windows
+                    os.remove(filepath)
+                os.rename(temp_path, filepath)
+            else:  # Atomic, so that get() in another worker process never finds the file missing
+                os.replace(temp_path, filepath)
+        mtime = self.get_mtime(key)
+        self.keep(key, time.time() if mtime is None else mtime, data)
+
+    def keep(self, key, timestamp, data):
+        with self.lock:
+            self.size -= len(self._data.pop(key, (0, b''))[1])
+            if len(data) > self.limit:
+                return
+            self._data[key] = (timestamp, data)
+            self.size += len(data)
+            while self.size > self.limit:
+                self.size -= len(self._data.popitem(last=False)[1][1])
+
+    def remove_expired(self):
+        if self.ttl <= 0:
+            return
+        for filepath in glob.glob(os.path.join(self.path, '*')):
+            try:
+                if self.is_expired(os.path.getmtime(filepath)):
+                    os.remove(filepath)
+            except OSError:  # Removed by another worker process
+                pass
+
+
+# The data to schedule, generated by ScheduleCheckView, would expire after N seconds
+SCHEDULE_DRAFT_TTL = 24 * 3600
+
+
+def dumps_draft(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def loads_draft(data):
+    return json.loads(data.decode('utf-8'))
+
+
+class Slot(object):
+    """The eggs to deploy and the data to schedule, shared by the views of the first node and the XHRs of the others."""
+    def __init__(self, limit_egg=100 * 1024 * 1024, limit_data=1024 * 1024):
+        self._egg = SlotStore(DEPLOY_PATH, limit_egg)
+        self._data = SlotStore(SCHEDULE_PATH, limit_data, dumps=dumps_draft, loads=loads_draft, ttl=SCHEDULE_DRAFT_TTL)
 
     @property
     def egg(self):
@@ -20,19 +130,147 @@ class Slot:
         return self._data
 
     def add_egg(self, key, value):
-        self._egg[key] = value
-        if len(self._egg) > self.limit_egg:
-            self._egg.popitem(last=False)
+        # Saved in DEPLOY_PATH by DeployUploadView already
+        self._egg.add(key, value, save=False)
 
     def add_data(self, key, value):
-        self._data[key] = value
-        if len(self._data) > self.limit_data:
-            self._data.popitem(last=False)
+        self._data.add(key, value)
 
 
 slot = Slot()
 
 
+class EggCache(object):
+    """The eggs built by DeployUploadView, keyed by the digest of the project tree, see get_tree_digest().
+
+    The eggs are kept as files named <digest>.egg in the cache dir, so that the cache survives restarts
+    and is shared by the gunicorn workers. The mtime of an egg is bumped on every hit,
+    and the least recently used eggs are removed once there are more than limit eggs.
+    """
+    def __init__(self, path, limit=20):
+        self.path = path
+        self.limit = limit
+
+    def get(self, digest):
+        """Return the path of the cached egg, or None if not found."""
+        eggpath = os.path.join(self.path, '%s.egg' % digest)
+        try:
+            os.utime(eggpath, None)
+        except OSError:
+            return None
+        return eggpath
+
+    def add(self, digest, egg):
+        eggpath = os.path.join(self.path, '%s.egg' % digest)
+        # Copy to a temp file first, so that a partial egg would never be read by others
+        temp_path = '%s.%s.tmp' % (eggpath, os.getpid())
+        copyfile(egg, temp_path)
+        try:
+            os.rename(temp_path, eggpath)
+        except OSError:  # Already added by another worker, in Windows
+            os.remove(temp_path)
+        eggpaths = sorted(glob.glob(os.path.join(self.path, '*.egg')), key=os.path.getmtime)
+        for path in eggpaths[:max(0, len(eggpaths) - self.limit)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return eggpath
+
+
+egg_cache = EggCache(EGG_CACHE_PATH)
+
+
+def get_tree_digest(path, func_walk=os.walk):
+    """Return the md5 of the paths and contents of the files in the project dir, which is the dir of scrapy.cfg,
+    excluding the files generated by _build_egg(), as in DeployView.get_modification_time()."""
+    md5 = hashlib.md5(sys.version.encode('utf-8'))  # The egg contains the .pyc files
+    in_top_dir = True
+    for dirpath, dirnames, filenames in func_walk(path):
+        if in_top_dir:
+            in_top_dir = False
+            dirnames[:] = [d for d in dirnames if not (d == 'build' or d.endswith('.egg-info'))]
+            filenames = [f for f in filenames if not (f.endswith('.egg') or f in ['setup.py', 'setup_backup.py'])]
+        dirnames[:] = sorted(d for d in dirnames if not (d.startswith('.') or d == '__pycache__'))
+        for filename in sorted(f for f in filenames if not f.endswith('.pyc')):
+            filepath = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(filepath, path).replace(os.sep, '/')
+            md5.update(relpath if isinstance(relpath, bytes) else relpath.encode('utf-8', 'replace'))
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    md5.update(chunk)
+            md5.update(b'\0')
+    return md5.hexdigest()
+
+
+class TreeIndex(object):
+    """The latest mtime of the files in a project dir, excluding those generated by _build_egg().
+
+    The names in each dir are kept along with the mtime of the dir, and would be listed again in refresh()
+    only if the mtime of the dir has changed, so that refreshing an unchanged tree costs a stat per file.
+    The files are checked on every refresh since a file modified in place would not change the mtime of its dir.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.dirs = {}  # {dirpath: (mtime, filenames, dirnames)}
+        self.lock = threading.Lock()
+
+    def list_dir(self, dirpath):
+        filenames, dirnames = [], []
+        for name in os.listdir(dirpath):
+            path = os.path.join(dirpath, name)
+            # Symlinks to dirs are not followed, as in os.walk()
+            if os.path.isdir(path):
+                if not os.path.islink(path):
+                    dirnames.append(name)
+            else:
+                filenames.append(name)
+        if dirpath == self.path:
+            dirnames = [d for d in dirnames if d not in ['build', 'project.egg-info']]
+            filenames = [f for f in filenames if not (f.endswith('.egg') or f in ['setup.py', 'setup_backup.py'])]
+        return filenames, dirnames
+
+    def refresh(self):
+        """Return the latest mtime of the files, or the current time if there is none."""
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self):
+        dirs = {}
+        timestamps = []
+        dirpaths = [self.path]
+        while dirpaths:
+            dirpath = dirpaths.pop()
+            try:
+                mtime = os.path.getmtime(dirpath)
+                (cached_mtime, filenames, dirnames) = self.dirs.get(dirpath, (None, None, None))
+                if mtime != cached_mtime:
+                    filenames, dirnames = self.list_dir(dirpath)
+            except OSError:  # Removed in the meantime
+                continue
+            dirs[dirpath] = (mtime, filenames, dirnames)
+            for filename in filenames:
+                try:
+                    timestamps.append(os.path.getmtime(os.path.join(dirpath, filename)))
+                except OSError:
+                    pass
+            dirpaths.extend(os.path.join(dirpath, d) for d in dirnames)
+        self.dirs = dirs
+        return max(timestamps or [time.time()])
+
+
+# {project_path: TreeIndex}
+tree_indexes = {}
+
+
+def get_tree_mtime(path):
+    """Return the latest mtime of the files in the project dir, see TreeIndex."""
+    index = tree_indexes.get(path)
+    if index is None:
+        index = tree_indexes.setdefault(path, TreeIndex(path))
+    return index.refresh()
+
+
 # https://stackoverflow.com/a/600612/10517783
 def mkdir_p(path):
     try:
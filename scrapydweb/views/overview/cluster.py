@@ -0,0 +1,120 @@
+# coding: utf-8
+from multiprocessing.dummy import Pool as ThreadPool
+import re
+import time
+
+from flask import render_template, request, url_for
+from six.moves.urllib.parse import urljoin
+
+from ..myview import MyView
+
+
+HREF_PATTERN = re.compile(r"""href=['"](.+?)['"]""")
+STATUSES = ['pending', 'running', 'finished']
+# Fetching the Jobs page of Scrapyd is IO bound, and a dead node would fail fast, see utils/service.py
+CONCURRENCY = 50
+
+
+class ClusterView(MyView):
+    # methods = ['GET']
+
+    def __init__(self):
+        super(ClusterView, self).__init__()
+
+        self.opt = self.view_args['opt']
+        self.project = request.args.get('project', '')
+        self.spider = request.args.get('spider', '')
+        self.status = request.args.get('status', '')
+        self.statuses = [s for s in self.status.split(',') if s in STATUSES] or STATUSES
+        self.template = 'scrapydweb/cluster.html'
+
+        self.jobs = []
+        self.errors = []
+        self.counts = dict((status, 0) for status in STATUSES)
+
+    def dispatch_request(self, **kwargs):
+        start_time = time.time()
+        self.fetch_all_jobs()
+        self.filter_and_sort_jobs()
+        duration = round(time.time() - start_time, 3)
+        self.logger.debug("Got %s jobs of %s nodes in %s seconds", len(self.jobs), self.SCRAPYD_SERVERS_AMOUNT,
+                          duration)
+        if self.opt == 'json':
+            return self.json_dumps(dict(status=self.OK, nodes=self.SCRAPYD_SERVERS_AMOUNT, counts=self.counts,
+                                        errors=self.errors, jobs=self.jobs, duration=duration))
+        kwargs = dict(
+            node=self.node,
+            project=self.project,
+            spider=self.spider,
+            status=self.status,
+            statuses=STATUSES,
+            jobs=self.jobs,
+            errors=self.errors,
+            counts=self.counts,
+            duration=duration,
+            url_json=url_for('cluster', node=self.node, opt='json', project=self.project or None,
+                             spider=self.spider or None, status=self.status or None),
+            JOBS_RELOAD_INTERVAL=self.JOBS_RELOAD_INTERVAL,
+        )
+        return render_template(self.template, **kwargs)
+
+    def fetch_all_jobs(self):
+        nodes = list(range(1, self.SCRAPYD_SERVERS_AMOUNT + 1))
+        # self.fetch_jobs() is backed by jobs_cache, see JOBS_CACHE_TTL
+        pool = ThreadPool(max(1, min(CONCURRENCY, len(nodes))))
+        results = pool.map(self.fetch_jobs, nodes)
+        pool.close()
+        pool.join()
+        for node, (status_code, text, jobs) in zip(nodes, results):
+            scrapyd_server = self.SCRAPYD_SERVERS[node - 1]
+            if status_code != 200 or not re.search(r'<body><h1>Jobs</h1>', text):
+                self.errors.append(dict(node=node, server=scrapyd_server, status_code=status_code,
+                                        message=text if status_code == -1 else text[:200]))
+                continue
+            for job in jobs:
+                self.jobs.append(self.make_job(node, scrapyd_server, job))
+
+    def make_job(self, node, scrapyd_server, job):
+        if not job['start']:
+            status = 'pending'
+        elif not job['finish']:
+            status = 'running'
+        else:
+            status = 'finished'
+        url_jobs = 'http://%s/jobs' % scrapyd_server
+        # <a href='/items/demo/test/2018-10-12_205507.jl'>Items</a>
+        urls = {}
+        for key in ['href_log', 'href_items']:
+            m = re.search(HREF_PATTERN, job[key])
+            urls[key] = urljoin(url_jobs, m.group(1)) if m else ''
+        job_finished = 'True' if status == 'finished' else None
+        kws = dict(project=job['project'], spider=job['spider'], job=job['job'], job_finished=job_finished)
+        return dict(
+            node=node,
+            server=scrapyd_server,
+            status=status,
+            project=job['project'],
+            spider=job['spider'],
+            job=job['job'],
+            pid=job['pid'],
+            start=job['start'],
+            runtime=job['runtime'],
+            finish=job['finish'],
+            url_log=urls['href_log'],
+            url_items=urls['href_items'],
+            url_stats=url_for('log', node=node, opt='stats', **kws) if status != 'pending' else '',
+            url_utf8=url_for('log', node=node, opt='utf8', **kws) if status != 'pending' else '',
+        )
+
+    def filter_and_sort_jobs(self):
+        self.jobs = [job for job in self.jobs if job['status'] in self.statuses
+                     and (not self.project or job['project'] == self.project)
+                     and (not self.spider or job['spider'] == self.spider)]
+        # In the order of JOBS_ORDER in jobs.py: status ASC, finish DESC, start ASC, then by node
+        self.jobs.sort(key=lambda job: (job['start'], job['node']))
+        self.jobs.sort(key=lambda job: job['finish'], reverse=True)
+        self.jobs.sort(key=lambda job: STATUSES.index(job['status']))
+        for job in self.jobs:
+            self.counts[job['status']] += 1
+        if self.JOBS_FINISHED_JOBS_LIMIT > 0 and self.counts['finished'] > self.JOBS_FINISHED_JOBS_LIMIT:
+            self.jobs = self.jobs[:len(self.jobs) - self.counts['finished'] + self.JOBS_FINISHED_JOBS_LIMIT]
@@ -1,24 +1,38 @@
 # coding: utf-8
 from collections import OrderedDict
 from datetime import datetime
+import io
+import os
 import re
+import time
 import traceback
 
 from flask import flash, get_flashed_messages, render_template, request, url_for
+from flask_sqlalchemy import Pagination
 from six.moves.urllib.parse import urljoin
-
-from ...common import handle_metadata
-from ...models import create_jobs_table, db
+from sqlalchemy import and_, or_
+
+from ...common import handle_metadata, increase_metadata
+from ...models import Job, db
+from ...utils.push import generate_events, make_event_stream, poll_events
+from ...utils.service import list_stats
+from ...utils.timeseries import save_job_series
+from ...vars import DATABASE_PATH
 from ..myview import MyView
 
 
 _metadata = handle_metadata()
 metadata = dict(
-    pageview=_metadata.get('pageview', 1),
     per_page=_metadata.get('jobs_per_page', 100),
     style=_metadata.get('jobs_style', 'database'),
-    unique_key_strings={}
+    unique_key_strings={},
+    jobs_total={}  # {server: (stamp, total)}, see invalidate_jobs_total()
 )
+# Touched once any job is inserted or deleted, so that the other processes (e.g. the gunicorn workers)
+# would COUNT(*) again in query_jobs()
+JOBS_TOTAL_STAMP_PATH = os.path.join(DATABASE_PATH, 'jobs_total.stamp')
+# {(server, project, spider, job): last_update_time of the stats by LogParser}, see save_jobs_series()
+series_update_times = {}
 
 STATUS_PENDING = '0'
 STATUS_RUNNING = '1'
@@ -26,21 +40,37 @@ STATUS_FINISHED = '2'
 NOT_DELETED = '0'
 DELETED = '1'
 HREF_PATTERN = re.compile(r"""href=['"](.+?)['"]""")  # Temp support for Scrapyd v1.3.0 (not released)
-JOB_PATTERN = re.compile(r"""
-                            <tr>
-                                <td>(?P<Project>.*?)</td>
-                                <td>(?P<Spider>.*?)</td>
-                                <td>(?P<Job>.*?)</td>
-                                (?:<td>(?P<PID>.*?)</td>)?
-                                (?:<td>(?P<Start>.*?)</td>)?
-                                (?:<td>(?P<Runtime>.*?)</td>)?
-                                (?:<td>(?P<Finish>.*?)</td>)?
-                                (?:<td>(?P<Log>.*?)</td>)?
-                                (?:<td>(?P<Items>.*?)</td>)?
-                                [\w\W]*?  # Temp support for Scrapyd v1.3.0 (not released)
-                            </tr>
-                          """, re.X)
-JOB_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'runtime', 'finish', 'href_log', 'href_items']
+JOBS_ORDER = (Job.status.asc(), Job.finish.desc(), Job.start.asc(), Job.id.asc())
+JOBS_ORDER_REVERSED = (Job.status.desc(), Job.finish.asc(), Job.start.desc(), Job.id.desc())
+
+
+def get_jobs_total_stamp():
+    try:
+        stat = os.stat(JOBS_TOTAL_STAMP_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def invalidate_jobs_total(server):
+    metadata['jobs_total'].pop(server, None)
+    with io.open(JOBS_TOTAL_STAMP_PATH, 'w', encoding='utf-8') as f:
+        f.write(u'%r %s' % (time.time(), os.getpid()))
+
+
+def keyset_filter(cursor, reverse=False):
+    # Jobs after the cursor job in the order of JOBS_ORDER, or before it if reverse is True.
+    # Note that finish is NULL for all the pending and running jobs, so is start for all the pending jobs.
+    def after(column, value, descending=False):
+        return column < value if descending != reverse else column > value
+
+    condition = after(Job.id, cursor.id)
+    if cursor.start is not None:
+        condition = or_(after(Job.start, cursor.start), and_(Job.start == cursor.start, condition))
+    if cursor.finish is not None:
+        condition = or_(after(Job.finish, cursor.finish, descending=True),
+                        and_(Job.finish == cursor.finish, condition))
+    return or_(after(Job.status, cursor.status), and_(Job.status == cursor.status, condition))
 
 
 class JobsView(MyView):
@@ -63,6 +93,9 @@ class JobsView(MyView):
             handle_metadata('jobs_per_page', self.per_page)
             self.logger.debug("Change per_page to %s", self.metadata['per_page'])
         self.page = request.args.get('page', default=1, type=int)
+        # The id of the last job in the previous page, or the first job in the next page, see query_jobs()
+        self.after = request.args.get('after', default=0, type=int)
+        self.before = request.args.get('before', default=0, type=int)
 
         self.url = 'http://%s/jobs' % self.SCRAPYD_SERVER
         self.text = ''
@@ -77,6 +110,7 @@ class JobsView(MyView):
 
         self.liststats_datas = {}
         self.jobs_dict = {}
+        self.series_jobs = []
 
         self.jobs = []
         self.jobs_backup = []
@@ -84,10 +118,8 @@ class JobsView(MyView):
         self.running_jobs = []
         self.finished_jobs = []
 
-        self.Job = None  # database class Job
-
     def dispatch_request(self, **kwargs):
-        status_code, self.text = self.make_request(self.url, auth=self.AUTH, as_json=False)
+        status_code, self.text, self.jobs = self.fetch_jobs()
         if status_code != 200 or not re.search(r'<body><h1>Jobs</h1>', self.text):
             kwargs = dict(
                 node=self.node,
@@ -97,20 +129,18 @@ class JobsView(MyView):
                 tip="Click the above link to make sure your Scrapyd server is accessable. "
             )
             return render_template(self.template_fail, **kwargs)
-        # Temp support for Scrapyd v1.3.0 (not released)
-        self.text = re.sub(r'<thead>.*?</thead>', '', self.text, flags=re.S)
-        self.jobs = [dict(zip(JOB_KEYS, job)) for job in re.findall(JOB_PATTERN, self.text)]
         self.jobs_backup = list(self.jobs)
 
         if self.POST:  # To update self.liststats_datas
             self.get_liststats_datas()
         else:
-            self.metadata['pageview'] += 1
-            self.logger.debug('metadata: %s', self.metadata)
+            self.pageview = increase_metadata('pageview')
+            self.logger.debug('pageview: %s, metadata: %s', self.pageview, self.metadata)
             self.set_flash()
         if self.style == 'database' or self.POST:
             self.handle_jobs_with_db()
         if self.POST:
+            self.save_jobs_series()
             try:
                 self.set_jobs_dict()
             except:
@@ -125,7 +155,7 @@ class JobsView(MyView):
         return render_template(self.template, **self.kwargs)
 
     def set_flash(self):
-        if self.metadata['pageview'] > 2 and self.metadata['pageview'] % 100:
+        if self.pageview > 2 and self.pageview % 100:
             return
         if not self.ENABLE_AUTH and self.SCRAPYD_SERVERS_AMOUNT == 1:
             flash("Set 'ENABLE_AUTH = True' to enable basic auth for web UI", self.INFO)
@@ -149,35 +179,19 @@ class JobsView(MyView):
 #                     "pages": 3,
 #                     "items": 2,
     def get_liststats_datas(self):
-        # NOTE: get_response_from_view() would update g.url_jobs_list, unexpected for mobileui
-        # request.url: http://localhost/1/api/liststats/
-        # TODO: test https
-        url_liststats = url_for('api', node=self.node, opt='liststats')
-        js = self.get_response_from_view(url_liststats, as_json=True)
-        if js['status'] == self.OK:
+        status_code, js = list_stats(self.node, logger=self.logger)
+        if status_code == 200 and js['status'] == self.OK and js.get('logparser_version') == self.LOGPARSER_VERSION:
             self.liststats_datas = js.pop('datas', {})
             self.logger.debug("Got datas with %s entries from liststats: %s", len(self.liststats_datas), js)
         else:
-            self.logger.warning("Fail to get datas from liststats: (%s) %s %s",
-                                js['status_code'], js['status'], js.get('tip', ''))
-
-    def create_table(self):
-        self.Job = self.metadata.get(self.node)
-        if self.Job:
-            self.logger.debug("Got table: %s", self.Job.__tablename__)
-        else:
-            self.Job = create_jobs_table(re.sub(r'[^A-Za-z0-9_]', '_', self.SCRAPYD_SERVER))
-            # sqlite3.OperationalError: table "127_0_0_1_6800" already exists
-            db.create_all(bind='jobs')
-            self.metadata[self.node] = self.Job
-            self.logger.debug("Created table: %s", self.Job.__tablename__)
+            self.logger.warning("Fail to get datas from liststats: (%s) %s, logparser_version: %s",
+                                status_code, js['status'], js.get('logparser_version'))
 
     def handle_jobs_with_db(self):
         try:
             if request.args.get('raise_exception') == 'True':  # For test only
                 assert False, "raise_exception: True"
             self.handle_unique_constraint()
-            self.create_table()
             self.db_insert_jobs()
             self.db_clean_pending_jobs()
             self.query_jobs()
@@ -185,10 +199,6 @@ class JobsView(MyView):
             self.logger.error("Fail to persist jobs in database: %s", traceback.format_exc())
             db.session.rollback()
             flash("Fail to persist jobs in database: %s" % err, self.WARN)
-            # sqlalchemy.exc.InvalidRequestError: Table '127_0_0_1_6800' is already defined for this MetaData instance.
-            # Specify 'extend_existing=True' to redefine options and columns on an existing Table object.
-            if "is already defined for this MetaData instance" in str(err):
-                flash("Please restart ScrapydWeb to work around this occasional bug!", self.WARN)
             if self.style == 'database' and not self.POST:
                 self.style = 'classic'
                 self.template = 'scrapydweb/jobs_classic.html'
@@ -235,24 +245,18 @@ class JobsView(MyView):
         self.jobs = list(seen_jobs.values())
 
     def db_insert_jobs(self):
-        records = []
+        # Load the existing records of the node in one query, instead of one query per job
+        records_dict = {}
+        for (id_, project, spider, job, status, deleted, start) in db.session.query(
+                Job.id, Job.project, Job.spider, Job.job,
+                Job.status, Job.deleted, Job.start).filter(Job.server == self.SCRAPYD_SERVER):
+            records_dict[(project, spider, job)] = (id_, status, deleted, start)
+
+        records_to_insert = []
+        records_to_update = []
+        now = datetime.now()  # SQLite DateTime type only accepts Python datetime and date objects as input
         for job in self.jobs:  # set(self.jobs): unhashable type: 'dict'
-            record = self.Job.query.filter_by(project=job['project'], spider=job['spider'], job=job['job']).first()
-            if record:
-                self.logger.debug("Found job in database: %s", record)
-                if record.deleted == DELETED:
-                    if record.status == STATUS_FINISHED and str(record.start) == job['start']:
-                        self.logger.info("Ignore deleted job: %s", record)
-                        continue
-                    else:
-                        record.deleted = NOT_DELETED
-                        record.pages = None
-                        record.items = None
-                        self.logger.warning("Recover deleted job: %s", record)
-                        flash("Recover deleted job: %s" % job, self.WARN)
-            else:
-                record = self.Job()
-            records.append(record)
+            record = dict(server=self.SCRAPYD_SERVER, update_time=now)
             for k, v in job.items():
                 v = v or None  # Save NULL in database for empty string
                 if k in ['start', 'finish']:
@@ -260,43 +264,121 @@ class JobsView(MyView):
                 elif k in ['href_log', 'href_items']:  # <a href='/logs/demo/test/xxx.log'>Log</a>
                     m = re.search(HREF_PATTERN, v) if v else None
                     v = m.group(1) if m else v
-                setattr(record, k, v)
+                record[k] = v
             if not job['start']:
-                record.status = STATUS_PENDING
+                record['status'] = STATUS_PENDING
             elif not job['finish']:
-                record.status = STATUS_RUNNING
+                record['status'] = STATUS_RUNNING
+            else:
+                record['status'] = STATUS_FINISHED
+
+            unique_key = (job['project'], job['spider'], job['job'])
+            if unique_key in records_dict:
+                (id_, status, deleted, start) = records_dict[unique_key]
+                if deleted == DELETED:
+                    if status == STATUS_FINISHED and str(start) == job['start']:
+                        self.logger.info("Ignore deleted job: %s", '/'.join(unique_key))
+                        continue
+                    else:
+                        record.update(deleted=NOT_DELETED, pages=None, items=None)
+                        invalidate_jobs_total(self.SCRAPYD_SERVER)
+                        self.logger.warning("Recover deleted job #%s: %s", id_, '/'.join(unique_key))
+                        flash("Recover deleted job: %s" % job, self.WARN)
+                record['id'] = id_
+                records_to_update.append(record)
             else:
-                record.status = STATUS_FINISHED
+                records_to_insert.append(record)
+
             if self.liststats_datas and job['start']:
                 try:
                     data = self.liststats_datas[job['project']][job['spider']][job['job']]
-                    record.pages = data['pages']  # Logparser: None or non-negative int
-                    record.items = data['items']  # Logparser: None or non-negative int
+                    record['pages'] = data['pages']  # Logparser: None or non-negative int
+                    record['items'] = data['items']  # Logparser: None or non-negative int
+                    if (record['status'] == STATUS_RUNNING
+                       or (self.SCRAPYD_SERVER,) + unique_key in series_update_times
+                       or unique_key in records_dict and records_dict[unique_key][1] == STATUS_RUNNING):
+                        self.series_jobs.append((unique_key, data.get('last_update_time'), record['status']))
                 except KeyError:
                     pass
                 except Exception as err:
                     self.logger.error(err)
-            # SQLite DateTime type only accepts Python datetime and date objects as input
-            record.update_time = datetime.now()  # datetime.now().replace(microsecond=0)
-        # https://www.reddit.com/r/flask/comments/3tea4k/af_flasksqlalchemy_bulk_updateinsert/
-        db.session.add_all(records)
+        # https://docs.sqlalchemy.org/en/13/orm/persistence_techniques.html#bulk-operations
+        db.session.bulk_insert_mappings(Job, records_to_insert)
+        db.session.bulk_update_mappings(Job, records_to_update)
         db.session.commit()
+        if records_to_insert:
+            invalidate_jobs_total(self.SCRAPYD_SERVER)
+        self.logger.debug("Inserted %s jobs, updated %s jobs", len(records_to_insert), len(records_to_update))
+
+    def save_jobs_series(self):
+        # For the trend of crawl rates, see the 'trend' opt of ApiView. The jobs snapshot is taken regularly,
+        # whereas the Stats page may not be visited and the poll subprocess requires ENABLE_EMAIL.
+        # Only the running jobs and the ones finished since the last snapshot are requested,
+        # and only if LogParser has updated the stats since the last time.
+        for ((project, spider, job), last_update_time, status) in self.series_jobs:
+            key = (self.SCRAPYD_SERVER, project, spider, job)
+            if last_update_time and series_update_times.get(key) == last_update_time:
+                if status == STATUS_FINISHED:  # LogParser would not update the stats any more
+                    series_update_times.pop(key, None)
+                continue
+            url = u'http://{}/logs/{}/{}/{}.json'.format(self.SCRAPYD_SERVER, project, spider, job)
+            status_code, js = self.make_request(url, auth=self.AUTH, as_json=True, dumps_json=False)
+            if status_code != 200 or js.get('logparser_version') != self.LOGPARSER_VERSION:
+                self.logger.warning("Fail to request stats from %s, got status_code: %s", url, status_code)
+                continue
+            try:
+                if save_job_series(*key, stats=js):
+                    self.logger.debug("Saved the series of %s", '/'.join(key))
+            except Exception as err:
+                db.session.rollback()
+                self.logger.error("Fail to save the series of %s: %s", '/'.join(key), err)
+                continue
+            if status == STATUS_FINISHED and js.get('finish_reason', self.NA) != self.NA:
+                series_update_times.pop(key, None)
+            else:
+                series_update_times[key] = last_update_time
 
     def db_clean_pending_jobs(self):
-        current_pending_jobs = [(job['project'], job['spider'], job['job'])
-                                for job in self.jobs_backup if not job['start']]
-        for record in self.Job.query.filter_by(start=None).all():
-            if (record.project, record.spider, record.job) not in current_pending_jobs:
-                db.session.delete(record)
-                db.session.commit()
-                self.logger.warning("Deleted pending jobs %s", record)
+        current_pending_jobs = set([(job['project'], job['spider'], job['job'])
+                                    for job in self.jobs_backup if not job['start']])
+        ids = [id_ for (id_, project, spider, job) in db.session.query(
+               Job.id, Job.project, Job.spider, Job.job).filter(Job.server == self.SCRAPYD_SERVER,
+                                                                Job.start.is_(None))
+               if (project, spider, job) not in current_pending_jobs]
+        if not ids:
+            return
+        # Avoid 'too many SQL variables' in SQLite, see SQLITE_MAX_VARIABLE_NUMBER
+        for i in range(0, len(ids), 500):
+            Job.query.filter(Job.id.in_(ids[i:i+500])).delete(synchronize_session=False)
+        db.session.commit()
+        invalidate_jobs_total(self.SCRAPYD_SERVER)
+        self.logger.warning("Deleted pending jobs: %s", ids)
 
     def query_jobs(self):
         current_running_job_pids = [int(job['pid']) for job in self.jobs_backup if job['pid']]
         self.logger.debug("current_running_job_pids: %s", current_running_job_pids)
-        self.jobs = self.Job.query.filter_by(deleted=NOT_DELETED).order_by(
-            self.Job.status.asc(), self.Job.finish.desc(), self.Job.start.asc(), self.Job.id.asc()).paginate(
-            page=self.page, per_page=self.per_page, error_out=False)
+        # Like paginate(error_out=False)
+        page = self.page if self.page > 0 else 1
+        per_page = self.per_page if self.per_page > 0 else 20
+        query = Job.query.filter_by(server=self.SCRAPYD_SERVER, deleted=NOT_DELETED)
+        # COUNT(*) only if any job has been inserted or deleted since last time, by any process
+        stamp = get_jobs_total_stamp()
+        (total_stamp, total) = self.metadata['jobs_total'].get(self.SCRAPYD_SERVER, (None, None))
+        if total is None or total_stamp != stamp:
+            total = query.count()
+            self.metadata['jobs_total'][self.SCRAPYD_SERVER] = (stamp, total)
+        # Keyset pagination for the adjacent pages instead of OFFSET, which would be slow for deep pages
+        cursor = None
+        if self.after or self.before:
+            cursor = Job.query.filter_by(id=self.after or self.before, server=self.SCRAPYD_SERVER).first()
+        if cursor and self.after:
+            items = query.filter(keyset_filter(cursor)).order_by(*JOBS_ORDER).limit(per_page).all()
+        elif cursor:
+            items = query.filter(keyset_filter(cursor, reverse=True)).order_by(
+                *JOBS_ORDER_REVERSED).limit(per_page).all()[::-1]
+        else:
+            items = query.order_by(*JOBS_ORDER).limit(per_page).offset((page - 1) * per_page).all()
+        self.jobs = Pagination(None, page, per_page, total, items)
         with db.session.no_autoflush:
             for index, job in enumerate(self.jobs.items, (self.jobs.page - 1) * self.jobs.per_page + 1):
                 # print(vars(job))
@@ -391,14 +473,18 @@ class JobsView(MyView):
             SCRAPYD_SERVER=self.SCRAPYD_SERVER.split(':')[0],
             LOGPARSER_VERSION=self.LOGPARSER_VERSION,
             JOBS_RELOAD_INTERVAL=self.JOBS_RELOAD_INTERVAL,
+            PUSH_INTERVAL=self.PUSH_INTERVAL,
+            url_events=url_for('jobs.events', node=self.node),
             IS_IE_EDGE=self.IS_IE_EDGE,
-            pageview=self.metadata['pageview'],
+            pageview=self.pageview,
             FEATURES=self.FEATURES
         )
         if self.style == 'database':
             self.kwargs.update(dict(
                 url_jobs_classic=url_for('jobs', node=self.node, style='classic'),
-                jobs=self.jobs
+                jobs=self.jobs,
+                first_id=self.jobs.items[0].id if self.jobs.items else 0,
+                last_id=self.jobs.items[-1].id if self.jobs.items else 0
             ))
             return
 
@@ -416,8 +502,34 @@ class JobsView(MyView):
         ))
 
 
+class JobsEventsView(MyView):
+    # Push the state of jobs via server-sent events, see PUSH_INTERVAL.
+    # The poll is shared by all the subscribers of the same node via poll_events().
+
+    def __init__(self):
+        super(JobsEventsView, self).__init__()
+
+        self.interval = max(self.PUSH_INTERVAL, 1)
+        self.duration = request.args.get('duration', None, type=int)  # For test only
+
+    def dispatch_request(self, **kwargs):
+        kws = dict(duration=self.duration) if self.duration else {}
+        return make_event_stream(generate_events('jobs', self.poll, self.interval, **kws),
+                                 max_streams=self.PUSH_MAX_STREAMS)
+
+    def poll(self):
+        return poll_events(('jobs', self.SCRAPYD_SERVER), self.get_jobs_state, self.interval)
+
+    def get_jobs_state(self):
+        status_code, text, jobs = self.fetch_jobs()
+        if status_code != 200 or not re.search(r'<body><h1>Jobs</h1>', text):
+            return None
+        # The runtime of running jobs is excluded since it changes every second
+        return dict(('%s/%s/%s' % (job['project'], job['spider'], job['job']),
+                     dict(pid=job['pid'], start=job['start'], finish=job['finish'])) for job in jobs)
+
+
 class JobsXhrView(MyView):
-    metadata = metadata
 
     def __init__(self):
         super(JobsXhrView, self).__init__()
@@ -426,10 +538,9 @@ class JobsXhrView(MyView):
         self.id = self.view_args['id']  # <int:id>
 
         self.js = {}
-        self.Job = self.metadata[self.node]  # database class Job
 
     def dispatch_request(self, **kwargs):
-        job = self.Job.query.get(self.id)
+        job = Job.query.filter_by(id=self.id, server=self.SCRAPYD_SERVER).first()
         if job:
             try:
                 job.deleted = DELETED
@@ -440,6 +551,7 @@ class JobsXhrView(MyView):
                 self.js['status'] = self.ERROR
                 self.js['message'] = str(err)
             else:
+                invalidate_jobs_total(self.SCRAPYD_SERVER)
                 self.js['status'] = self.OK
                 self.logger.warning(self.js.setdefault('tip', "Deleted %s" % job))
         else:
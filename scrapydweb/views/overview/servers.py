@@ -1,16 +1,11 @@
 # coding: utf-8
 from flask import flash, render_template, url_for
 
-from ...common import handle_metadata
+from ...common import increase_metadata
 from ..myview import MyView
 
 
-metadata = dict(pageview=handle_metadata().get('pageview', 1))
-
-
 class ServersView(MyView):
-    metadata = metadata
-
     def __init__(self):
         super(ServersView, self).__init__()
 
@@ -24,10 +19,10 @@ class ServersView(MyView):
         self.selected_nodes = []
 
     def dispatch_request(self, **kwargs):
-        self.metadata['pageview'] += 1
-        self.logger.debug('metadata: %s', self.metadata)
+        self.pageview = increase_metadata('pageview')
+        self.logger.debug('pageview: %s', self.pageview)
 
-        if self.SCRAPYD_SERVERS_AMOUNT > 1 and not (self.metadata['pageview'] > 2 and self.metadata['pageview'] % 100):
+        if self.SCRAPYD_SERVERS_AMOUNT > 1 and not (self.pageview > 2 and self.pageview % 100):
             if not self.ENABLE_AUTH:
                 flash("Set 'ENABLE_AUTH = True' to enable basic auth for web UI", self.INFO)
             if self.IS_LOCAL_SCRAPYD_SERVER and not self.ENABLE_LOGPARSER:
@@ -52,7 +47,7 @@ class ServersView(MyView):
             url=self.url,
             selected_nodes=self.selected_nodes,
             IS_IE_EDGE=self.IS_IE_EDGE,
-            pageview=self.metadata['pageview'],
+            pageview=self.pageview,
             FEATURES=self.FEATURES,
             DEFAULT_LATEST_VERSION=self.DEFAULT_LATEST_VERSION,
             url_daemonstatus=url_for('api', node=self.node, opt='daemonstatus'),
@@ -6,6 +6,7 @@ from flask import render_template
 from logparser import SETTINGS_PY_PATH as LOGPARSER_SETTINGS_PY_PATH
 
 from ...common import json_dumps
+from ...utils.check_app_config import jobs_snapshot_stats
 from ...vars import SCHEDULER_STATE_DICT
 from ..myview import MyView
 
@@ -55,6 +56,9 @@ class SettingsView(MyView):
             SCRAPYDWEB_BIND=self.SCRAPYDWEB_BIND,
             SCRAPYDWEB_PORT=self.SCRAPYDWEB_PORT,
             URL_SCRAPYDWEB=self.URL_SCRAPYDWEB,
+            WSGI_SERVER=self.WSGI_SERVER,
+            WSGI_WORKERS=self.WSGI_WORKERS,
+            WSGI_THREADS=self.WSGI_THREADS,
             ENABLE_AUTH=self.ENABLE_AUTH,
             USERNAME=self.protect(self.USERNAME),
             PASSWORD=self.protect(self.PASSWORD)
@@ -67,6 +71,7 @@ class SettingsView(MyView):
 
         # Scrapy
         self.kwargs['SCRAPY_PROJECTS_DIR'] = self.handle_slash(self.SCRAPY_PROJECTS_DIR) or "''"
+        self.kwargs['DEPLOY_CONCURRENCY'] = self.DEPLOY_CONCURRENCY
 
         # Scrapyd
         servers = defaultdict(list)
@@ -84,10 +89,19 @@ class SettingsView(MyView):
         self.kwargs['logparser_version'] = self.LOGPARSER_VERSION
         self.kwargs['logparser_settings_py_path'] = LOGPARSER_SETTINGS_PY_PATH
         self.kwargs['BACKUP_STATS_JSON_FILE'] = self.BACKUP_STATS_JSON_FILE
+        self.kwargs['BACKUP_STATS_RETENTION_DAYS'] = self.BACKUP_STATS_RETENTION_DAYS
 
         # Timer Tasks
         self.kwargs['scheduler_state'] = SCHEDULER_STATE_DICT[self.scheduler.state]
         self.kwargs['JOBS_SNAPSHOT_INTERVAL'] = self.JOBS_SNAPSHOT_INTERVAL
+        self.kwargs['JOBS_SNAPSHOT_CONCURRENCY'] = self.JOBS_SNAPSHOT_CONCURRENCY
+        self.kwargs['JOBS_SNAPSHOT_TIMEOUT'] = self.JOBS_SNAPSHOT_TIMEOUT
+        self.kwargs['TIMER_TASK_CONCURRENCY'] = self.TIMER_TASK_CONCURRENCY
+        if self.WSGI_SERVER == 'gunicorn':
+            # Only updated in the main process, whereas the workers keep the copy at fork
+            self.kwargs['jobs_snapshot_stats'] = "N/A with WSGI_SERVER 'gunicorn', see the log of the main process"
+        else:
+            self.kwargs['jobs_snapshot_stats'] = self.json_dumps(jobs_snapshot_stats)
 
         # Run Spider
         self.kwargs['run_spider_details'] = self.json_dumps(dict(
@@ -107,6 +121,10 @@ class SettingsView(MyView):
             SHOW_JOBS_JOB_COLUMN=self.SHOW_JOBS_JOB_COLUMN,
             JOBS_FINISHED_JOBS_LIMIT=self.JOBS_FINISHED_JOBS_LIMIT,
             JOBS_RELOAD_INTERVAL=self.JOBS_RELOAD_INTERVAL,
+            JOBS_CACHE_TTL=self.JOBS_CACHE_TTL,
+            PUSH_INTERVAL=self.PUSH_INTERVAL,
+            PUSH_MAX_STREAMS=self.PUSH_MAX_STREAMS,
+            LOG_TAIL_BYTES=self.LOG_TAIL_BYTES,
             DAEMONSTATUS_REFRESH_INTERVAL=self.DAEMONSTATUS_REFRESH_INTERVAL
         ))
 
@@ -141,6 +159,9 @@ class SettingsView(MyView):
         self.kwargs['poll_interval'] = self.json_dumps(dict(
             POLL_ROUND_INTERVAL=self.POLL_ROUND_INTERVAL,
             POLL_REQUEST_INTERVAL=self.POLL_REQUEST_INTERVAL,
+            POLL_CONCURRENCY=self.POLL_CONCURRENCY,
+            POLL_CONCURRENCY_PER_NODE=self.POLL_CONCURRENCY_PER_NODE,
+            POLL_RATE_LIMIT=self.POLL_RATE_LIMIT,
         ))
 
         # email triggers
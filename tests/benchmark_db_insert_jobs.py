@@ -0,0 +1,83 @@
+# coding: utf-8
+# Benchmark of JobsView.db_insert_jobs() and JobsView.db_clean_pending_jobs(),
+# which are executed in every visit of the Jobs page with database view and every round of the jobs snapshot.
+# Usage: python tests/benchmark_db_insert_jobs.py [amount ...]
+# e.g. python tests/benchmark_db_insert_jobs.py 10000 100000
+from datetime import datetime, timedelta
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapydweb import create_app  # noqa: E402
+from scrapydweb.models import Job, db  # noqa: E402
+
+
+SCRAPYD_SERVER = 'benchmark:6800'
+PENDING_AMOUNT = 10
+RUNNING_AMOUNT = 10
+
+
+def make_jobs(amount, new_added=0):
+    jobs = []
+    start = datetime(2019, 1, 1)
+    for i in range(PENDING_AMOUNT):
+        jobs.append(dict(project='demo', spider='test', job='pending_%s' % i, pid='', start='', runtime='',
+                         finish='', href_log='', href_items=''))
+    for i in range(RUNNING_AMOUNT):
+        jobs.append(dict(project='demo', spider='test', job='running_%s' % i, pid=str(10000 + i),
+                         start=str(start), runtime='0:00:01', finish='',
+                         href_log="<a href='/logs/demo/test/running_%s.log'>Log</a>" % i, href_items=''))
+    for i in range(amount + new_added):
+        finish = start + timedelta(seconds=i)
+        jobs.append(dict(project='demo', spider='test', job='finished_%s' % i, pid='', start=str(start),
+                         runtime='0:00:01', finish=str(finish),
+                         href_log="<a href='/logs/demo/test/finished_%s.log'>Log</a>" % i,
+                         href_items="<a href='/items/demo/test/finished_%s.jl'>Items</a>" % i))
+    return jobs
+
+
+def sync(app, jobs):
+    from scrapydweb.views.overview.jobs import JobsView  # handle_metadata() requires db.app set in create_app()
+    with app.test_request_context('/1/jobs/'):
+        jobs_view = JobsView()
+        jobs_view.jobs = jobs
+        jobs_view.jobs_backup = list(jobs)
+        start_time = time.time()
+        jobs_view.db_insert_jobs()
+        jobs_view.db_clean_pending_jobs()
+        return time.time() - start_time
+
+
+def main(amounts):
+    app = create_app(dict(
+        TESTING=True,
+        DEFAULT_SETTINGS_PY_PATH='',
+        SCRAPYDWEB_SETTINGS_PY_PATH='',
+        MAIN_PID=os.getpid(),
+        LOGPARSER_PID=0,
+        POLL_PID=0,
+        SCRAPYD_SERVERS=[SCRAPYD_SERVER],
+        SCRAPYD_SERVERS_AUTHS=[None],
+        SCRAPYD_SERVERS_GROUPS=[''],
+        ENABLE_LOGPARSER=False,
+    ))
+    with app.app_context():
+        db.get_engine(bind='jobs').echo = False
+        for amount in amounts:
+            try:
+                jobs = make_jobs(amount)
+                print("%s jobs, insert all: %.2f seconds" % (amount, sync(app, jobs)))
+                print("%s jobs, update all: %.2f seconds" % (amount, sync(app, jobs)))
+                # The pending jobs are gone and 1% new finished jobs added
+                jobs = make_jobs(amount, new_added=amount // 100)[PENDING_AMOUNT:]
+                print("%s jobs, insert 1%% and clean pending: %.2f seconds" % (amount, sync(app, jobs)))
+            finally:
+                db.session.remove()
+                Job.query.filter_by(server=SCRAPYD_SERVER).delete()
+                db.session.commit()
+
+
+if __name__ == '__main__':
+    main([int(i) for i in sys.argv[1:]] or [10000, 100000])
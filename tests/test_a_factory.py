@@ -1,10 +1,22 @@
 # coding: utf-8
+import io
 import os
+import time
 
-from scrapydweb import create_app
-from scrapydweb.common import find_scrapydweb_settings_py
+import pytest
+
+from scrapydweb import common, create_app
+from scrapydweb.common import find_scrapydweb_settings_py, handle_metadata
+from scrapydweb.models import Job, db, migrate_jobs_tables
 from scrapydweb.run import SCRAPYDWEB_SETTINGS_PY
-from scrapydweb.utils.check_app_config import check_app_config, check_email
+from scrapydweb.utils.check_app_config import (check_app_config, check_email, create_jobs_snapshot,
+                                               jobs_snapshot_stats)
+from scrapydweb.utils import service
+from scrapydweb.utils.cache import jobs_cache
+from scrapydweb.utils.push import events_cache
+from scrapydweb.utils.scheduler import SCHEDULER_JOBS_STAMP_PATH, scheduler, scheduler_cache, sync_scheduler_state
+from scrapydweb.utils.server import init_worker, run_gunicorn
+from scrapydweb.vars import STATE_PAUSED, STATE_RUNNING
 from tests.utils import get_text, req
 from tests.test_z_cleantest import test_cleantest as cleantest
 
@@ -67,6 +79,136 @@ def test_check_app_config(app, client):
     # Test ENABLE_LOGPARSER = True, see test_enable_logparser()
 
 
+def test_wsgi_server(app, client):
+    req(app, client, view='settings', kws=dict(node=1), ins=['WSGI_SERVER', 'WSGI_WORKERS', 'WSGI_THREADS'])
+    app.config['WSGI_SERVER'] = 'flask'
+    try:
+        check_app_config(app.config)
+    except AssertionError as err:
+        assert 'WSGI_SERVER should be one of' in str(err)
+    else:
+        assert False, "WSGI_SERVER should be checked"
+    app.config['WSGI_SERVER'] = 'waitress'
+    try:
+        check_app_config(app.config)
+    except AssertionError as err:
+        assert "pip install waitress" in str(err)
+    finally:
+        app.config['WSGI_SERVER'] = 'werkzeug'
+
+    # The scheduler state switched in another worker process
+    assert scheduler.state == STATE_RUNNING
+    handle_metadata('scheduler_state', STATE_PAUSED)
+    try:
+        sync_scheduler_state()
+        assert scheduler.state == STATE_PAUSED
+    finally:
+        handle_metadata('scheduler_state', STATE_RUNNING)
+        sync_scheduler_state()
+    assert scheduler.state == STATE_RUNNING
+
+    # The timer tasks modified in another worker process
+    sync_scheduler_state()
+    scheduler_cache.invalidate()
+    scheduler_cache.get('any_running_apscheduler_jobs', lambda: 'cached', ttl=60)
+    sync_scheduler_state()
+    assert scheduler_cache.get_fresh('any_running_apscheduler_jobs', 60) == 'cached'
+    with io.open(SCHEDULER_JOBS_STAMP_PATH, 'w', encoding='utf-8') as f:
+        f.write(u'%r %s' % (time.time(), 0))
+    sync_scheduler_state()
+    assert scheduler_cache.get_fresh('any_running_apscheduler_jobs', 60) is None
+
+
+def test_init_worker(app, client):
+    metadata_lock = common.metadata_lock
+    jobs_cache.get('init_worker', lambda: 1, ttl=60)
+    events_cache.get('init_worker', lambda: 1, ttl=60)
+    service.get_session('127.0.0.1:6800')
+    jobstores_lock = scheduler._jobstores_lock
+    init_worker(app)
+    assert common.metadata_lock is not metadata_lock
+    assert scheduler._jobstores_lock is not jobstores_lock
+    assert not jobs_cache.data and not events_cache.data
+    assert not service.sessions and not service.circuit_breakers
+    # Reconnect to the databases and the Scrapyd servers in the worker process
+    req(app, client, view='jobs', kws=dict(node=1, style='database'), ins=":total='")
+
+
+def test_run_gunicorn(app, client, monkeypatch):
+    pytest.importorskip('gunicorn')
+    from gunicorn.app.base import BaseApplication
+    cfg = {}
+
+    def run(self):
+        cfg.update(bind=self.cfg.bind, workers=self.cfg.workers, threads=self.cfg.threads,
+                   preload_app=self.cfg.preload_app, app=self.load())
+        self.cfg.post_fork(None, None)
+
+    monkeypatch.setattr(BaseApplication, 'run', run)
+    monkeypatch.setattr('scrapydweb.utils.server.start_scheduler_sync', lambda: None)
+    metadata_lock = common.metadata_lock
+    try:
+        run_gunicorn(app, '127.0.0.1', 5000, workers=2, threads=4)
+    finally:
+        app.before_request_funcs[None].remove(sync_scheduler_state)
+    assert cfg == dict(bind=['127.0.0.1:5000'], workers=2, threads=4, preload_app=True, app=app)
+    assert common.metadata_lock is not metadata_lock  # init_worker() called in post_fork
+    req(app, client, view='jobs', kws=dict(node=1, style='database'), ins=":total='")
+
+
+def test_create_jobs_snapshot(app, client):
+    jobs_snapshot_stats.clear()
+    kwargs = dict(url_jobs='http://127.0.0.1:1/1/jobs/', auth=None, nodes=[1, 2], concurrency=2, timeout=1)
+    # The failing nodes would be skipped for 0, 1, 3 ... rounds
+    for (failures, skip_rounds) in [(1, 0), (2, 1), (2, 0), (3, 3)]:
+        create_jobs_snapshot(**kwargs)
+        for node in [1, 2]:
+            assert jobs_snapshot_stats[node]['failures'] == failures
+            assert jobs_snapshot_stats[node]['skip_rounds'] == skip_rounds
+    req(app, client, view='settings', kws=dict(node=1), ins=['jobs_snapshot_stats', 'consecutive_failures'])
+    # Only updated in the main process with gunicorn
+    app.config['WSGI_SERVER'] = 'gunicorn'
+    try:
+        req(app, client, view='settings', kws=dict(node=1), ins='N/A with WSGI_SERVER',
+            nos='consecutive_failures')
+    finally:
+        app.config['WSGI_SERVER'] = 'werkzeug'
+    jobs_snapshot_stats.clear()
+
+
+def test_migrate_jobs_tables(app):
+    server = 'migrate-test:6800'
+    with app.app_context():
+        engine = db.get_engine(bind='jobs')
+        # The schema of the per-server table in earlier versions
+        engine.execute('CREATE TABLE migrate_test_6800 (id INTEGER PRIMARY KEY, project VARCHAR(255) NOT NULL, '
+                       'spider VARCHAR(255) NOT NULL, job VARCHAR(255) NOT NULL, status VARCHAR(1) NOT NULL, '
+                       'deleted VARCHAR(1) NOT NULL, create_time DATETIME NOT NULL, update_time DATETIME NOT NULL, '
+                       'pages INTEGER, items INTEGER, pid INTEGER, start DATETIME, runtime VARCHAR(20), '
+                       'finish DATETIME, href_log VARCHAR(1000), href_items VARCHAR(1000), '
+                       'UNIQUE (project, spider, job))')
+        engine.execute("INSERT INTO migrate_test_6800 (project, spider, job, status, deleted, create_time, "
+                       "update_time, start, finish) VALUES ('demo', 'test', 'job1', '2', '0', '2019-01-01 00:00:00', "
+                       "'2019-01-01 00:00:00', '2019-01-01 00:00:00', '2019-01-01 00:00:01')")
+        engine.execute("INSERT INTO migrate_test_6800 (project, spider, job, status, deleted, create_time, "
+                       "update_time) VALUES ('demo', 'test', 'job2', '1', '0', '2019-01-01 00:00:00', "
+                       "'2019-01-01 00:00:00')")
+        try:
+            # Already migrated along with the legacy table left behind
+            db.session.add(Job(server=server, project='demo', spider='test', job='job2', status='2'))
+            db.session.commit()
+            assert migrate_jobs_tables(['127.0.0.1:6800', server]) == {server: 'migrate_test_6800'}
+            assert 'migrate_test_6800' not in engine.table_names()
+            jobs = Job.query.filter_by(server=server).order_by(Job.job).all()
+            assert [(job.project, job.spider, job.job, job.status) for job in jobs] == [
+                ('demo', 'test', 'job1', '2'), ('demo', 'test', 'job2', '2')]
+            assert str(jobs[0].finish) == '2019-01-01 00:00:01'
+            assert migrate_jobs_tables([server]) == {}
+        finally:
+            Job.query.filter_by(server=server).delete()
+            db.session.commit()
+
+
 def test_check_email_with_fake_password(app):
     with app.test_request_context():
         if not app.config.get('ENABLE_EMAIL', False):
@@ -5,7 +5,9 @@ import os
 
 from flask import url_for
 
+from scrapydweb.models import Stats, db
 from scrapydweb.utils.check_app_config import check_app_config
+from scrapydweb.views.files.log import backup_stats_metadata
 from tests.utils import cst, req, replace_file_content, sleep
 
 
@@ -138,18 +140,24 @@ def test_stats_with_file_deleted(app, client):
     kws = dict(node=1, opt='stats', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_JOBID)
     req(app, client, view='log', kws=kws, ins=["Using backup stats: LogParser v%s" % cst.LOGPARSER_VERSION, tab])
 
-    # Mismatching logparser_version in ScrapydWeb_demo.json in data/stats
-    replace_file_content(app.config['BACKUP_DEMO_JSON_PATH'], old, new)
+    # Mismatching logparser_version in the backup stats in data/database/stats.db
+    with app.test_request_context():
+        record = Stats.query.filter_by(project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_JOBID).one()
+        stats = record.stats
+        record.stats = stats.replace(old.replace(' ', '').rstrip(','), new.replace(' ', '').rstrip(','))
+        db.session.commit()
     req(app, client, view='log', kws=kws,
         ins=["fail - ScrapydWeb", "404 - No Such Resource", "Fail to request logfile", "with extensions",
              "Mismatching logparser_version 0.0.0 in backup stats"])
-    replace_file_content(app.config['BACKUP_DEMO_JSON_PATH'], new, old)
 
-    # delete ScrapydWeb_demo.json in data/stats
-    rename(app.config['BACKUP_DEMO_JSON_PATH'])
+    # delete the backup stats
+    with app.test_request_context():
+        Stats.query.filter_by(project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_JOBID).delete()
+        db.session.commit()
+    backup_stats_metadata['digests'].clear()
     kws = dict(node=1, opt='stats', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_JOBID)
     req(app, client, view='log', kws=kws,
         ins=["fail - ScrapydWeb", "404 - No Such Resource", "Fail to request logfile", "with extensions"])
 
-    for filepath in ['DEMO_JSON_PATH', 'DEMO_LOG_PATH', 'BACKUP_DEMO_JSON_PATH']:
+    for filepath in ['DEMO_JSON_PATH', 'DEMO_LOG_PATH']:
         rename(app.config[filepath], restore=True)
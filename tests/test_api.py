@@ -1,4 +1,13 @@
 # coding: utf-8
+import io
+import time
+
+from logparser import __version__ as LOGPARSER_VERSION
+from logparser import parse
+
+from scrapydweb.models import JobSeries, db
+from scrapydweb.utils import service
+from scrapydweb.utils.timeseries import MAX_POINTS, RESOLUTION, build_series
 from tests.utils import cst, req, upload_file_deploy
 
 
@@ -11,6 +20,88 @@ def test_daemonstatus(app, client):
         jskws=dict(status=cst.OK), jskeys=['pending', 'running', 'finished'])
 
 
+def test_trend(app, client):
+    # Saved when visiting the Stats page, as well as by the poll subprocess
+    kws = dict(node=1, opt='stats', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_LOG, with_ext='True')
+    req(app, client, view='log', kws=kws, ins='id="finish_reason">finished<')
+    kws = dict(node=1, opt='trend', project=cst.PROJECT, version_spider_job=cst.SPIDER, points=10)
+    __, js = req(app, client, view='api', kws=kws, jskws=dict(status=cst.OK, spider=cst.SPIDER),
+                 jskeys=['runs', 'pages_per_min_change', 'items_per_min_change'])
+    run = [run for run in js['runs'] if run['job'] == cst.DEMO_LOG.split('.')[0]][0]
+    assert run['finished'] is True and run['duration'] > 0 and run['pages'] > 0
+    assert run['pages_per_min'] == round(run['pages'] * 60.0 / run['duration'], 2)
+    assert 0 < len(run['rates']) <= 10
+    kws['project'] = 'not-exist'
+    req(app, client, view='api', kws=kws, jskws=dict(status=cst.OK, runs=[]))
+
+    # Downsampled for a long run: pages +1 every second in 3 days
+    datas = [[time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(1546300800 + i)), i, 60, 0, 0]
+             for i in range(0, 3 * 24 * 3600, 10)]
+    interval, duration, pages_series, items_series = build_series(datas)
+    assert len(pages_series) <= MAX_POINTS < len(pages_series) * 2 and interval % RESOLUTION == 0
+    assert pages_series[-1] == datas[-1][1] and set(items_series) == set([0])
+    assert pages_series == sorted(pages_series)
+
+
+def test_trend_by_jobs_snapshot(app, client, monkeypatch):
+    from scrapydweb.views.overview.jobs import JobsView, series_update_times
+
+    # Saved by the jobs snapshot with the stats by LogParser, without visiting the Stats page
+    with io.open(app.config['DEMO_LOG_PATH'], encoding='utf-8') as f:
+        stats = parse(f.read())
+    stats['logparser_version'] = LOGPARSER_VERSION
+    job = 'trend_by_jobs_snapshot'
+    urls = []
+
+    def make_request(self, url, **kwargs):
+        urls.append(url)
+        return 200, dict(stats)
+
+    monkeypatch.setattr(JobsView, 'make_request', make_request)
+    try:
+        with app.test_request_context('/1/jobs/', method='POST'):
+            view = JobsView()
+            for status in ['1', '1', '2']:
+                view.series_jobs = [((cst.PROJECT, cst.SPIDER, job), '2019-01-01 00:00:01', status)]
+                view.save_jobs_series()
+        # Requested only once since LogParser has not updated the stats
+        assert urls == ['http://%s/logs/%s/%s/%s.json' % (app.config['SCRAPYD_SERVERS'][0], cst.PROJECT,
+                                                          cst.SPIDER, job)]
+        assert not series_update_times
+        kws = dict(node=1, opt='trend', project=cst.PROJECT, version_spider_job=cst.SPIDER)
+        __, js = req(app, client, view='api', kws=kws, jskws=dict(status=cst.OK))
+        assert [run['finished'] for run in js['runs'] if run['job'] == job] == [True]
+    finally:
+        with app.app_context():
+            JobSeries.query.filter_by(job=job).delete()
+            db.session.commit()
+
+
+def test_scrapyd_client(app, client):
+    url = 'http://%s/daemonstatus.json' % app.config['SCRAPYD_SERVERS'][0]
+    url_dead = 'http://127.0.0.1:1/daemonstatus.json'
+    hedge_delay = service.HEDGE_DELAYS['daemonstatus.json']
+    service.HEDGE_DELAYS['daemonstatus.json'] = 0
+    try:
+        (status_code, js), (status_code_dead, js_dead) = service.make_requests([dict(url=url), dict(url=url_dead)])
+    finally:
+        service.HEDGE_DELAYS['daemonstatus.json'] = hedge_delay
+    assert status_code == 200 and js['status'] == cst.OK
+    assert status_code_dead == -1 and js_dead['status'] == cst.ERROR
+
+    # Fail fast once the circuit is open
+    circuit_breaker = service.get_circuit_breaker('127.0.0.1:1')
+    for __ in range(service.CIRCUIT_FAILURE_THRESHOLD):
+        service.make_request(url_dead)
+    assert circuit_breaker.is_open
+    start = time.time()
+    status_code, js = service.make_request(url_dead)
+    assert status_code == -1 and 'Fail fast' in js['message']
+    assert time.time() - start < 0.1
+    circuit_breaker.record_success()
+    assert not circuit_breaker.is_open
+
+
 # def test_addversion(app, client):
 
 
@@ -58,6 +149,22 @@ def test_listjobs(app, client):
         jskws=dict(status=cst.OK, url='listjobs.json'), jskeys=['pending', 'running', 'finished'])
 
 
+def test_jobs(app, client):
+    app.config['JOBS_CACHE_TTL'] = 300
+    req(app, client, view='api', kws=dict(node=1, opt='jobs'), jskws=dict(status=cst.OK), jskeys='jobs')
+    # The cache would be cleared after starting a job
+    __, js = req(app, client, view='api', kws=dict(node=1, opt='start', project=cst.PROJECT,
+                                                      version_spider_job=cst.SPIDER))
+    __, js_jobs = req(app, client, view='api', kws=dict(node=1, opt='jobs'), jskws=dict(status=cst.OK))
+    assert js['jobid'] in [job['job'] for job in js_jobs['jobs']]
+    req(app, client, view='api', kws=dict(node=1, opt='forcestop', project=cst.PROJECT,
+                                          version_spider_job=js['jobid']))
+    app.config['JOBS_CACHE_TTL'] = 5
+
+    __, js = req(app, client, view='api', kws=dict(node=2, opt='jobs'), jskws=dict(status=cst.ERROR), jskeys='tip')
+    assert 'message' not in js
+
+
 # "message": "[WinError 32] 另一个程序正在使用此文件，进程无法访问。: 'eggs\\\\demo\\\\2018-01-01T01_01_01.egg'",
 def test_delversion(app, client):
     kws = dict(node=1, opt='delversion', project=cst.PROJECT, version_spider_job=cst.VERSION)
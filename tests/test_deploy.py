@@ -1,8 +1,12 @@
 # coding: utf-8
 from functools import partial
 from io import BytesIO
+import json
+import os
 import re
+import time
 
+from scrapydweb.views.operations.utils import SlotStore, TreeIndex, egg_cache, get_tree_digest
 from tests.utils import cst, req, switch_scrapyd, upload_file_deploy
 
 
@@ -61,6 +65,64 @@ def test_auto_packaging(app, client):
         ins=['deploy results - ScrapydWeb', 'onclick="multinodeRunSpider();"', 'id="checkbox_1"', 'id="checkbox_2"'])
 
 
+def test_auto_packaging_egg_cache(app, client, monkeypatch):
+    data = {
+        '1': 'on',
+        'checked_amount': '1',
+        'folder': cst.PROJECT,
+        'project': cst.PROJECT,
+        'version': cst.VERSION
+    }
+    digest = get_tree_digest(os.path.join(app.config['SCRAPY_PROJECTS_DIR'], cst.PROJECT))
+    req(app, client, view='deploy.upload', kws=dict(node=2), data=data, ins='deploy results - ScrapydWeb')
+    assert egg_cache.get(digest)
+
+    # The unchanged project would be deployed without building the egg again
+    def _build_egg(scrapy_cfg_path):
+        raise AssertionError("The egg should be reused")
+    monkeypatch.setattr('scrapydweb.views.operations.deploy._build_egg', _build_egg)
+    req(app, client, view='deploy.upload', kws=dict(node=2), data=data, ins='deploy results - ScrapydWeb')
+
+
+def test_tree_index(tmpdir):
+    project_path = tmpdir.mkdir('demo')
+    project_path.join('scrapy.cfg').write('')
+    project_path.mkdir('demo').join('settings.py').write('')
+    project_path.mkdir('build').join('ignored.py').write('')
+    index = TreeIndex(str(project_path))
+    timestamp = index.refresh()
+    # Files generated by _build_egg() are ignored
+    for path in [project_path.join('build', 'ignored.py'), project_path.join('setup.py')]:
+        path.write('')
+        path.setmtime(timestamp + 100)
+    assert index.refresh() == timestamp
+    # Modified files in unchanged dirs are detected
+    project_path.join('demo', 'settings.py').setmtime(timestamp + 200)
+    assert index.refresh() == timestamp + 200
+    project_path.join('demo', 'new.py').write('')
+    project_path.join('demo', 'new.py').setmtime(timestamp + 300)
+    assert index.refresh() == timestamp + 300
+
+
+def test_slot_store(tmpdir):
+    store = SlotStore(str(tmpdir), limit=10)
+    store.add('a.egg', b'aaaaaa')
+    store.add('b.egg', b'bbbbbb')
+    assert store.size == 6 and list(store._data.keys()) == ['b.egg']
+    # Dropped from memory, but loaded from the file
+    assert store.get('a.egg') == b'aaaaaa' and list(store._data.keys()) == ['a.egg']
+    store.add('c.egg', b'c' * 11)
+    assert store.size == 6 and store.get('c.egg') == b'c' * 11
+    # Shared with another worker process by the files
+    assert SlotStore(str(tmpdir), limit=10).get('b.egg') == b'bbbbbb'
+    assert store.get('not-exist.egg', {}) == {}
+    # Replaced by another worker process
+    assert store.get('a.egg') == b'aaaaaa'
+    SlotStore(str(tmpdir), limit=10).add('a.egg', b'AAAAAA')
+    tmpdir.join('a.egg').setmtime(time.time() + 10)
+    assert store.get('a.egg') == b'AAAAAA'
+
+
 def test_auto_packaging_unicode(app, client):
     if cst.WINDOWS_NOT_CP936:
         return
@@ -154,3 +216,24 @@ def test_deploy_xhr(app, client):
         version=cst.VERSION
     )
     req(app, client, view='deploy.xhr', kws=kws, jskws=dict(status=cst.OK, project=cst.PROJECT))
+    # Fail clearly instead of posting egg=None
+    kws['eggname'] = 'not-exist.egg'
+    req(app, client, view='deploy.xhr', kws=kws, jskws=dict(status=cst.ERROR, message='not-exist.egg is not found'))
+    text, __ = req(app, client, view='deploy.xhr', kws=kws, data=dict(nodes='1,2'))
+    results = [json.loads(line) for line in text.strip().split('\n')]
+    assert [js['node'] for js in results] == [1, 2] and all(js['status'] == cst.ERROR for js in results)
+
+
+def test_deploy_xhr_multinode(app, client):
+    upload_file_deploy(app, client, filename='demo.egg', project=cst.PROJECT, redirect_project=cst.PROJECT, multinode=False)
+    kws = dict(
+        node=1,
+        eggname='%s_%s_from_file_demo.egg' % (cst.PROJECT, cst.VERSION),
+        project=cst.PROJECT,
+        version=cst.VERSION
+    )
+    text, __ = req(app, client, view='deploy.xhr', kws=kws, data=dict(nodes='1,2'))
+    results = dict((js['node'], js) for js in map(json.loads, text.strip().split('\n')))
+    assert sorted(results) == [1, 2]
+    assert results[1]['status'] == cst.OK and results[1]['project'] == cst.PROJECT
+    assert results[2]['status'] == cst.ERROR
@@ -1,5 +1,6 @@
 # coding: utf-8
 from datetime import datetime
+import io
 from io import BytesIO
 import json
 import os
@@ -8,7 +9,11 @@ import time
 
 from flask import url_for
 
+from scrapydweb.models import JobNotice, Stats, db, migrate_backup_stats
 from scrapydweb.utils.poll import main as poll_py_main
+from scrapydweb.utils.push import events_cache
+from scrapydweb.vars import STATS_PATH
+from scrapydweb.views.files.log import LogView, ParseCache, backup_stats_metadata, parse_cache_dict
 from tests.utils import cst, req, sleep, upload_file_deploy
 
 
@@ -169,6 +174,189 @@ def test_demo_log_with_extension(app, client):
             nos=['<h4>Log</h4>', url_utf8_, '<h4>Source</h4>', url_demo_json_source])
 
 
+def test_log_tail(app, client):
+    with io.open(app.config['DEMO_LOG_PATH'], 'r', encoding='utf-8', newline='') as f:
+        content = f.read()
+    kws = dict(node=1, opt='utf8', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_LOG, with_ext='True')
+    app.config['LOG_TAIL_BYTES'] = 4096
+    scrapyd_logs_dir = app.config['SCRAPYD_LOGS_DIR']
+    try:
+        # Reading the local logfile with seek(), then requesting the logfile with the Range header
+        for logs_dir in [scrapyd_logs_dir, '']:
+            app.config['SCRAPYD_LOGS_DIR'] = logs_dir
+            page, __ = req(app, client, view='log', kws=kws, ins=['Load more (', 'bytes unloaded)'])
+            __, js = req(app, client, view='log', kws=dict(kws, load_more='True'), jskws=dict(status=cst.OK))
+            text = js['text']
+            assert len(text) < len(content) and content.endswith(text)
+            # The url in the script of the page should not be HTML-escaped
+            url_load_more = json.loads(re.search(r'var url_load_more = (".*?");', page).group(1))
+            assert url_load_more == js['url_load_more'] and '&amp;' not in url_load_more
+            req(app, client, url=url_load_more, jskws=dict(status=cst.OK))
+            while js['url_load_more']:
+                __, js = req(app, client, url=js['url_load_more'], jskws=dict(status=cst.OK))
+                text = js['text'] + text
+            assert text == content
+    finally:
+        app.config['LOG_TAIL_BYTES'] = 1048576
+        app.config['SCRAPYD_LOGS_DIR'] = scrapyd_logs_dir
+    req(app, client, view='log', kws=kws, nos='Load more (')
+
+
+def test_log_tail_smaller_than_log_tail_bytes(app, client):
+    # Scrapyd would answer 500 to the suffix Range larger than the logfile
+    with io.open(app.config['DEMO_LOG_PATH'], 'r', encoding='utf-8', newline='') as f:
+        content = f.read()
+    assert len(content.encode('utf-8')) < app.config['LOG_TAIL_BYTES']
+    kws = dict(node=1, opt='utf8', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_LOG, with_ext='True')
+    scrapyd_logs_dir = app.config['SCRAPYD_LOGS_DIR']
+    try:
+        app.config['SCRAPYD_LOGS_DIR'] = ''
+        req(app, client, view='log', kws=kws, ins='log - ScrapydWeb', nos=['Load more (', 'Fail to request logfile'])
+        __, js = req(app, client, view='log', kws=dict(kws, load_more='True'), jskws=dict(status=cst.OK))
+        assert js['text'] == content and not js['url_load_more']
+    finally:
+        app.config['SCRAPYD_LOGS_DIR'] = scrapyd_logs_dir
+
+
+def test_stats_parse_appended_log(app, client):
+    with io.open(app.config['DEMO_LOG_PATH'], 'rb') as f:
+        content = f.read()
+    lines = content.split(b'\n')
+    head = b'\n'.join(lines[:len(lines) // 2]) + b'\n'
+    job = 'ScrapydWeb_demo_appended.log'
+    log_path = os.path.join(os.path.dirname(app.config['DEMO_LOG_PATH']), job)
+    job_key = '/1/%s/%s/%s' % (cst.PROJECT, cst.SPIDER, job)
+    kws = dict(node=1, opt='stats', project=cst.PROJECT, spider=cst.SPIDER, job=job, with_ext='True',
+               realtime='True')
+    ins = ['<tr><th>runtime</th><td>0:01:08</td></tr>', 'id="finish_reason">finished<',
+           'id="log_critical_count">5<', 'id="log_error_count">5<', 'id="log_warning_count">3<',
+           'id="log_redirect_count">1<', 'id="log_retry_count">2<', 'id="log_ignore_count">1<']
+    scrapyd_logs_dir = app.config['SCRAPYD_LOGS_DIR']
+    try:
+        # Reading the local logfile from the position, then requesting the logfile with the Range header
+        for logs_dir in [scrapyd_logs_dir, '']:
+            app.config['SCRAPYD_LOGS_DIR'] = logs_dir
+            with io.open(log_path, 'wb') as f:
+                f.write(head)
+            req(app, client, view='log', kws=kws, ins='id="finish_reason">N/A<')
+            # The last log entry is left for the next visit
+            position = parse_cache_dict[job_key]['position']
+            assert 0 < position < len(head)
+            req(app, client, view='log', kws=kws, ins='id="finish_reason">N/A<')
+            assert parse_cache_dict[job_key]['position'] == position
+            with io.open(log_path, 'ab') as f:
+                f.write(content[len(head):])
+            req(app, client, view='log', kws=kws, ins=ins)
+            # Evicted since the job is finished
+            assert job_key not in parse_cache_dict
+    finally:
+        app.config['SCRAPYD_LOGS_DIR'] = scrapyd_logs_dir
+        os.remove(log_path)
+
+
+def test_parse_cache():
+    cache = ParseCache(limit=2, ttl=60)
+    for key in ['a', 'b', 'c']:
+        cache[key] = dict(position=0)
+    # The least recently used one is dropped
+    assert 'a' not in cache and len(cache) == 2
+    assert cache.get('b') == dict(position=0)
+    cache['d'] = dict(position=1)
+    assert 'b' in cache and 'c' not in cache
+    # Dropped if not visited for ttl seconds
+    cache._data['b'] = (cache._data['b'][0] - 61, cache._data['b'][1])
+    assert cache.get('b') is None and 'b' not in cache._data
+    assert cache.pop('d') == dict(position=1) and len(cache) == 0
+
+    stats = dict(log_categories=dict(error_logs=dict(count=1000, details=[str(i) for i in range(1000)])),
+                 datas=[[i] for i in range(1001)])
+    LogView.trim_stats(stats)
+    assert stats['log_categories']['error_logs']['details'] == [str(i) for i in range(900, 1000)]
+    assert stats['log_categories']['error_logs']['count'] == 1000
+    assert len(stats['datas']) == 501 and stats['datas'][0] == [0] and stats['datas'][-1] == [1000]
+
+
+def test_backup_stats(app, client):
+    server = app.config['SCRAPYD_SERVERS'][0]
+    job = cst.DEMO_LOG.split('.')[0]
+    kws = dict(node=1, opt='stats', project=cst.PROJECT, spider=cst.SPIDER, job=cst.DEMO_LOG, with_ext='True')
+
+    def get_records():
+        return Stats.query.filter_by(server=server, project=cst.PROJECT, spider=cst.SPIDER, job=job).all()
+
+    with app.test_request_context():
+        req(app, client, view='log', kws=kws, ins='id="finish_reason">finished<')
+        records = get_records()
+        assert len(records) == 1 and json.loads(records[0].stats)['finish_reason'] == 'finished'
+        update_time = records[0].update_time
+        # Not rewritten since the stats has not been updated
+        req(app, client, view='log', kws=kws, ins='id="finish_reason">finished<')
+        db.session.remove()
+        assert get_records()[0].update_time == update_time
+
+        # Deleted once not updated for BACKUP_STATS_RETENTION_DAYS, and then saved again
+        get_records()[0].update_time = datetime(2000, 1, 1)
+        db.session.commit()
+        backup_stats_metadata['delete_timestamp'] = 0
+        req(app, client, view='log', kws=kws, ins='id="finish_reason">finished<')
+        db.session.remove()
+        records = get_records()
+        assert len(records) == 1 and records[0].update_time > update_time
+
+        # The json files saved by earlier versions
+        node_path = os.path.join(STATS_PATH, re.sub(r'[^0-9A-Za-z_-]', '-', re.sub(r'[.:]', '_', server)))
+        spider_path = os.path.join(node_path, cst.PROJECT, cst.SPIDER)
+        if not os.path.isdir(spider_path):
+            os.makedirs(spider_path)
+        with io.open(os.path.join(spider_path, 'legacy.json'), 'w', encoding='utf-8') as f:
+            f.write(u'{"last_update_timestamp": 1, "finish_reason": "finished"}')
+        with io.open(os.path.join(spider_path, 'invalid.json'), 'w', encoding='utf-8') as f:
+            f.write(u'{"last_update_timestamp": 1, ')
+        with io.open(os.path.join(spider_path, 'list.json'), 'w', encoding='utf-8') as f:
+            f.write(u'[1]')
+        assert migrate_backup_stats([server]) == {server: 1}
+        # The files failing to be parsed as a json object are kept
+        assert sorted(os.listdir(spider_path)) == ['invalid.json', 'list.json']
+        for filename in ['invalid.json', 'list.json']:
+            os.remove(os.path.join(spider_path, filename))
+        assert migrate_backup_stats([server]) == {server: 0}
+        assert not os.path.exists(node_path)
+        record = Stats.query.filter_by(server=server, job='legacy').one()
+        assert json.loads(record.stats)['finish_reason'] == 'finished'
+
+
+def test_log_events(app, client):
+    with io.open(app.config['DEMO_LOG_PATH'], 'rb') as f:
+        content = f.read()
+    lines = content.split(b'\n')
+    head = b'\n'.join(lines[:len(lines) // 2]) + b'\n'
+    job = 'ScrapydWeb_demo_events.log'
+    log_path = os.path.join(os.path.dirname(app.config['DEMO_LOG_PATH']), job)
+    kws = dict(node=1, project=cst.PROJECT, spider=cst.SPIDER, job=job, with_ext='True', realtime='True')
+    try:
+        with io.open(log_path, 'wb') as f:
+            f.write(head)
+        with app.test_request_context():
+            url_events = url_for('log.events', node=1, project=cst.PROJECT, spider=cst.SPIDER, job=job)
+        req(app, client, view='log', kws=dict(kws, opt='stats'), ins=url_events)
+        # The whole stats in the first event, and the stream would be closed after the duration
+        text, __ = req(app, client, view='log.events', kws=dict(kws, duration=1),
+                       ins=['retry: ', 'event: stats', '"finish_reason": "N/A"', '"log_critical_count": '],
+                       nos='event: done')
+        assert text.count('event: stats') == 1
+
+        with io.open(log_path, 'ab') as f:
+            f.write(content[len(head):])
+        # The stats polled would be shared by all the subscribers within PUSH_INTERVAL
+        req(app, client, view='log.events', kws=dict(kws, duration=1), ins='"finish_reason": "N/A"')
+        events_cache.invalidate()
+        req(app, client, view='log.events', kws=dict(kws, duration=1),
+            ins=['event: stats', '"finish_reason": "finished"', 'event: done'])
+        req(app, client, view='log', kws=dict(kws, opt='stats'), nos=url_events)
+    finally:
+        os.remove(log_path)
+
+
 # Location: http://127.0.0.1:5000/log/uploaded/ttt.txt
 def test_parse_upload(app, client):
     req(app, client, view='parse.upload', kws=dict(node=1),
@@ -247,6 +435,48 @@ def test_poll_py(app):
     ignore_finished_bool_list = poll_py_main(args)
     assert ignore_finished_bool_list == [False, True]
 
+    # Concurrent polling: POLL_CONCURRENCY, POLL_CONCURRENCY_PER_NODE, POLL_RATE_LIMIT
+    ignore_finished_bool_list = poll_py_main(args + ['2', '2', '5'])
+    assert ignore_finished_bool_list == [False, True]
+
+
+def test_log_poll(app, client):
+    jobs = [[cst.PROJECT, cst.SPIDER, cst.DEMO_JOBID, ''], [cst.PROJECT, cst.SPIDER, cst.FAKE_JOBID, 'True']]
+    __, js = req(app, client, view='log.poll', kws=dict(node=1), data=dict(jobs=json.dumps(jobs)),
+                 jskws=dict(status=cst.OK))
+    assert [i['job'] for i in js['results']] == [cst.DEMO_JOBID, cst.FAKE_JOBID]
+    assert js['results'][0]['status'] == cst.OK
+    assert js['results'][1]['status'] == cst.ERROR
+
+
+def test_job_notice(app, client):
+    # The state of the email notice is saved in the database so as to be shared by the gunicorn workers
+    def post_for_poll(job_finished=''):
+        jobs = [[cst.PROJECT, cst.SPIDER, cst.DEMO_JOBID, job_finished]]
+        __, js = req(app, client, view='log.poll', kws=dict(node=1), data=dict(jobs=json.dumps(jobs)),
+                     jskws=dict(status=cst.OK))
+        return js['results'][0]
+
+    def get_record():
+        db.session.remove()
+        return JobNotice.query.filter_by(server='127.0.0.1:6800', project=cst.PROJECT, spider=cst.SPIDER,
+                                         job=cst.DEMO_JOBID).first()
+
+    config = dict((k, app.config.get(k)) for k in ['ENABLE_EMAIL', 'EMAIL_WORKING_DAYS', 'LOG_CRITICAL_THRESHOLD'])
+    app.config.update(ENABLE_EMAIL=True, EMAIL_WORKING_DAYS=[], LOG_CRITICAL_THRESHOLD=1)
+    try:
+        assert post_for_poll()['flag'] == 'CRITICAL_Trigger'
+        record = get_record()
+        assert json.loads(record.triggered)[0] and not record.finished
+        # Not triggered again
+        assert post_for_poll()['flag'] == ''
+        assert post_for_poll(job_finished='True')['flag'] == ''
+        assert get_record().finished
+    finally:
+        app.config.update(config)
+        JobNotice.query.filter_by(job=cst.DEMO_JOBID).delete()
+        db.session.commit()
+
 
 def test_email(app, client):
     # with app.test_request_context():
@@ -5,6 +5,10 @@ from flask import url_for
 from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
 
 from scrapydweb import __version__
+from scrapydweb.common import (flush_metadata, handle_metadata, increase_metadata,
+                               metadata_cache, metadata_increments, metadata_pending)
+from scrapydweb.models import Metadata, db
+from scrapydweb.utils.settings import get_settings
 from scrapydweb.vars import SCHEDULER_STATE_DICT
 from tests.utils import req
 
@@ -92,3 +96,69 @@ def test_scheduler_state(app, client):
         req(app, client, view='metadata', kws=dict(node=1), jskws=dict(scheduler_state=state))
         # ENABLED | DISABLED buttons
         req(app, client, view='tasks', kws=dict(node=1), ins=[scheduler_action_button, url_scheduler_action])
+
+
+def test_settings_and_metadata_cache(app, client):
+    settings = get_settings(app)
+    assert get_settings(app) is settings
+    try:
+        settings.JOBS_CACHE_TTL = 0
+    except AttributeError:
+        pass
+    else:
+        assert False, "Settings should be immutable"
+    # Rebuilt once app.config is modified
+    app.config['JOBS_CACHE_TTL'] = 6
+    try:
+        assert get_settings(app) is not settings
+        assert get_settings(app).JOBS_CACHE_TTL == 6
+    finally:
+        app.config['JOBS_CACHE_TTL'] = 5
+
+    # Reloaded once modified by handle_metadata()
+    tasks_per_page = handle_metadata()['tasks_per_page']
+    assert metadata_cache['data']['tasks_per_page'] == tasks_per_page
+    handle_metadata('tasks_per_page', tasks_per_page + 1)
+    try:
+        assert handle_metadata()['tasks_per_page'] == tasks_per_page + 1
+        req(app, client, view='metadata', kws=dict(node=1), jskws=dict(tasks_per_page=tasks_per_page + 1))
+    finally:
+        handle_metadata('tasks_per_page', tasks_per_page)
+
+
+def test_metadata_write_behind(app, client):
+    flush_metadata()
+    with app.app_context():
+        pageview = Metadata.query.filter_by(version=__version__).first().pageview
+    req(app, client, view='servers', kws=dict(node=1))
+    req(app, client, view='jobs', kws=dict(node=1))
+    assert increase_metadata('pageview') == pageview + 3
+    assert metadata_increments == dict(pageview=3)
+    assert not metadata_pending
+    with app.app_context():
+        db.session.remove()
+        assert Metadata.query.filter_by(version=__version__).first().pageview == pageview
+    req(app, client, view='metadata', kws=dict(node=1), jskws=dict(pageview=pageview + 3))
+    flush_metadata()
+    assert not metadata_increments
+    with app.app_context():
+        db.session.remove()
+        assert Metadata.query.filter_by(version=__version__).first().pageview == pageview + 3
+
+    # Reloaded once modified by another process
+    with app.app_context():
+        metadata_row = Metadata.query.filter_by(version=__version__).first()
+        metadata_row.pageview = pageview
+        db.session.commit()
+        db.session.remove()
+    assert handle_metadata()['pageview'] == pageview
+
+    # The increments of another process would be kept on flush, e.g. the gunicorn workers
+    assert increase_metadata('pageview') == pageview + 1
+    with app.app_context():
+        metadata_row = Metadata.query.filter_by(version=__version__).first()
+        metadata_row.pageview = pageview + 10
+        db.session.commit()
+        db.session.remove()
+    flush_metadata()
+    assert handle_metadata()['pageview'] == pageview + 11
@@ -1,6 +1,13 @@
 # coding: utf-8
+from datetime import datetime, timedelta
+import io
+import re
+
 from flask import url_for
 
+from scrapydweb.models import Job, db
+from scrapydweb.utils.cache import SingleFlightCache
+from scrapydweb.utils.push import streams
 from tests.utils import cst, req, switch_scrapyd
 
 
@@ -80,3 +87,138 @@ def test_switch_node_skip(app, client):
         ins=['1 / 2', 'onclick="switchNode(1);', 'id="skip_nodes_checkbox"'])
     req(app, client, view='servers', kws=dict(node=2),
         ins=['2 / 2', 'onclick="switchNode(-1);', 'id="skip_nodes_checkbox"'])
+
+
+def test_jobs_keyset_pagination(app, client):
+    from scrapydweb.views.overview.jobs import metadata
+
+    def get_jobs(**kwargs):
+        text = req(app, client, view='jobs', kws=dict(node=1, style='database', per_page=10, **kwargs))[0]
+        return (re.findall(r"^\s+job: '(.+?)',$", text, re.M), int(re.search(r":total='(\d+)'", text).group(1)),
+                int(re.search(r"&before=(\d+)", text).group(1)), int(re.search(r"&after=(\d+)", text).group(1)))
+
+    server = app.config['SCRAPYD_SERVERS'][0]
+    __, js = req(app, client, view='metadata', kws=dict(node=1))
+    per_page = js['jobs_per_page']
+    with app.app_context():
+        start = datetime(2000, 1, 1)
+        # The finished jobs with the same finish would be ordered by start ASC and then id ASC
+        db.session.bulk_insert_mappings(Job, [dict(server=server, project='demo', spider='test',
+                                                   job='pagination_%02d' % i, status='2', deleted='0',
+                                                   start=start + timedelta(seconds=i // 2),
+                                                   finish=start + timedelta(hours=1, seconds=i // 4))
+                                              for i in range(35)])
+        db.session.commit()
+    metadata['jobs_total'].clear()
+    try:
+        jobs_list = []
+        __, total, __, __ = get_jobs(page=1)
+        pages = (total + 9) // 10
+        assert pages >= 4
+        for page in range(1, pages + 1):
+            jobs_list.append(get_jobs(page=page)[0])
+        assert len(set(sum(jobs_list, []))) == total
+        # Pagination by after=<id of the last job in the previous page>
+        __, __, first_id, last_id = get_jobs(page=1)
+        for page in range(2, pages + 1):
+            jobs, __, first_id, last_id = get_jobs(page=page, after=last_id)
+            assert jobs == jobs_list[page - 1]
+        # Pagination by before=<id of the first job in the next page>
+        for page in range(pages - 1, 0, -1):
+            jobs, __, first_id, __ = get_jobs(page=page, before=first_id)
+            assert jobs == jobs_list[page - 1]
+    finally:
+        with app.app_context():
+            Job.query.filter(Job.job.like('pagination_%')).delete(synchronize_session=False)
+            db.session.commit()
+        metadata['jobs_total'].clear()
+        req(app, client, view='jobs', kws=dict(node=1, style='database', per_page=per_page))
+
+
+def test_jobs_total_stamp(app, client):
+    from scrapydweb.views.overview.jobs import JOBS_TOTAL_STAMP_PATH, get_jobs_total_stamp, metadata
+
+    def get_total():
+        text = req(app, client, view='jobs', kws=dict(node=1, style='database'))[0]
+        return int(re.search(r":total='(\d+)'", text).group(1))
+
+    server = app.config['SCRAPYD_SERVERS'][0]
+    total = get_total()
+    metadata['jobs_total'][server] = (get_jobs_total_stamp(), total + 1000)
+    try:
+        assert get_total() == total + 1000
+        # Any job inserted or deleted by another process, e.g. a gunicorn worker
+        with io.open(JOBS_TOTAL_STAMP_PATH, 'w', encoding='utf-8') as f:
+            f.write(u'another process')
+        assert get_total() == total
+    finally:
+        metadata['jobs_total'].clear()
+
+
+def test_cluster_jobs(app, client):
+    __, js = req(app, client, view='cluster', kws=dict(node=1, opt='json'), jskws=dict(status=cst.OK, nodes=2),
+                 jskeys=['counts', 'errors', 'jobs', 'duration'])
+    assert [error['node'] for error in js['errors']] == [2]
+    assert all(job['node'] == 1 for job in js['jobs'])
+    assert sum(js['counts'].values()) == len(js['jobs'])
+    statuses = [job['status'] for job in js['jobs']]
+    assert statuses == sorted(statuses, key=['pending', 'running', 'finished'].index)
+    finishes = [job['finish'] for job in js['jobs'] if job['status'] == 'finished']
+    assert finishes == sorted(finishes, reverse=True)
+
+    __, js = req(app, client, view='cluster', kws=dict(node=1, opt='json', status='finished'))
+    assert all(job['status'] == 'finished' for job in js['jobs'])
+    __, js = req(app, client, view='cluster', kws=dict(node=1, opt='json', project='not-exist'))
+    assert js['jobs'] == []
+
+    req(app, client, view='cluster', kws=dict(node=1), ins=['cluster jobs', 'id="tbody_jobs"', 'id="tbody_errors"'])
+    req(app, client, view='jobs', kws=dict(node=1), ins='id="menu_cluster"')
+
+
+def test_jobs_events(app, client):
+    with app.test_request_context():
+        url_events = url_for('jobs.events', node=1)
+    for style in ['database', 'classic']:
+        req(app, client, view='jobs', kws=dict(node=1, style=style), ins=[url_events, 'new EventSource('])
+    text, __ = req(app, client, view='jobs.events', kws=dict(node=1, duration=1),
+                   ins=['retry: 10000', 'event: jobs', '"updated": {'])
+    assert text.count('event: jobs') == 1
+    req(app, client, view='jobs.events', kws=dict(node=2, duration=1), ins='event: failure', nos='event: jobs')
+
+    app.config['PUSH_INTERVAL'] = 0
+    try:
+        req(app, client, view='jobs', kws=dict(node=1), nos='new EventSource(')
+    finally:
+        app.config['PUSH_INTERVAL'] = 10
+
+
+def test_events_busy(app, client):
+    app.config['PUSH_MAX_STREAMS'] = 1
+    streams['count'] = 1
+    try:
+        req(app, client, view='jobs.events', kws=dict(node=1, duration=1), ins='event: busy', nos='event: jobs')
+    finally:
+        streams['count'] = 0
+        app.config['PUSH_MAX_STREAMS'] = 4
+    req(app, client, view='jobs.events', kws=dict(node=1, duration=1), ins='event: jobs', nos='event: busy')
+    assert streams['count'] == 0
+
+    app.config['PUSH_MAX_STREAMS'] = 0
+    streams['count'] = 100
+    try:
+        req(app, client, view='jobs.events', kws=dict(node=1, duration=1), ins='event: jobs', nos='event: busy')
+    finally:
+        streams['count'] = 0
+        app.config['PUSH_MAX_STREAMS'] = 4
+
+
+def test_events_cache_purge():
+    cache = SingleFlightCache()
+    cache.get('old', lambda: 1, ttl=10)
+    cache.get('new', lambda: 2, ttl=10)
+    cache.data['old'] = (cache.data['old'][0] - 60, 1)
+    cache.purge(30)
+    assert list(cache.data.keys()) == ['new']
+    assert list(cache.locks.keys()) == ['new']
+    cache.purge(0)
+    assert not cache.data and not cache.locks
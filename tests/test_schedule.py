@@ -1,13 +1,15 @@
 # coding: utf-8
 import re
+import time
 
 from scrapy import __version__ as scrapy_version
 
+from scrapydweb.views.operations.utils import SlotStore, dumps_draft, loads_draft
 from tests.utils import cst, req, sleep, switch_scrapyd, upload_file_deploy
 
 
 NODE = 2
-FILENAME = '%s_%s_%s.pickle' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
+FILENAME = '%s_%s_%s.json' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
 KEY = '/'.join([cst.PROJECT, cst.SPIDER, cst.JOBID])
 run_data = {
     '1': 'on',
@@ -30,7 +32,7 @@ def test_schedule_from_post(app, client):
             and re.search(r'id="checkbox_2".*?checked.*?/>', text, re.S))
 
 
-# CHECK first to generate xx.pickle for RUN
+# CHECK first to generate xx.json for RUN
 def test_check(app, client):
     upload_file_deploy(app, client, filename='ScrapydWeb_demo.egg', project=cst.PROJECT, redirect_project=cst.PROJECT)
     data = dict(
@@ -45,6 +47,18 @@ def test_check(app, client):
         jskws=dict(filename=FILENAME))
 
 
+def test_slot_store_ttl(tmpdir):
+    store = SlotStore(str(tmpdir), limit=100, dumps=dumps_draft, loads=loads_draft, ttl=60)
+    store.add('old.json', dict(spider=u'测试'))
+    assert store.get('old.json') == dict(spider=u'测试')
+    tmpdir.join('old.json').setmtime(time.time() - 120)
+    # Expired for another worker process, and removed on the next add()
+    assert SlotStore(str(tmpdir), limit=100, ttl=60).get('old.json') is None
+    assert store.get('old.json') is None
+    store.add('new.json', dict(spider='test'))
+    assert not tmpdir.join('old.json').exists() and tmpdir.join('new.json').exists()
+
+
 def test_run(app, client):
     node = 1
 
@@ -196,3 +210,7 @@ def test_schedule_xhr(app, client):
     req(app, client, view='schedule.xhr',
         kws=dict(node=NODE, filename=FILENAME),
         jskws=dict(status=cst.ERROR))
+    # Fail clearly instead of posting {} to schedule.json
+    req(app, client, view='schedule.xhr',
+        kws=dict(node=NODE, filename='not-exist.json'),
+        jskws=dict(status=cst.ERROR, message='not-exist.json is not found'))
@@ -6,7 +6,7 @@ from tests.utils import cst, req_single_scrapyd, sleep, upload_file_deploy
 
 
 metadata = dict(value=time.ctime())
-FILENAME = '%s_%s_%s.pickle' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
+FILENAME = '%s_%s_%s.json' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
 
 # http://flask.pocoo.org/docs/1.0/tutorial/tests/#id11
 # def test_author_required(app, client, auth):
@@ -73,13 +73,13 @@ def test_check(app, client):
     req_single_scrapyd(app, client, view='schedule.check', kws=dict(node=1), data=data,
                        jskws=dict(filename=FILENAME))
     req_single_scrapyd(app, client, view='schedule.check', kws=dict(node=1), data=data_,
-                       jskws=dict(filename='%s_%s_%s.pickle' % (cst.PROJECT, 'default-the-latest-version', cst.SPIDER)))
+                       jskws=dict(filename='%s_%s_%s.json' % (cst.PROJECT, 'default-the-latest-version', cst.SPIDER)))
 
 
 # {
 # "1": "on",
 # "checked_amount": "1",
-# "filename": "demo_2018-10-27T16_17_43_test.pickle"
+# "filename": "demo_2018-10-27T16_17_43_test.json"
 # }
 # <!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n<title>Redirecting...</title>\n
 # <h1>Redirecting...</h1>\n<p>You should be redirected automatically to target URL:
@@ -111,7 +111,7 @@ def test_run(app, client):
 
 def test_run_fail(app, client):
     req_single_scrapyd(app, client, view='schedule.run', kws=dict(node=1),
-                       data={'filename': '%s_%s_%s.pickle' % (cst.PROJECT, cst.VERSION, cst.SPIDER)},
+                       data={'filename': '%s_%s_%s.json' % (cst.PROJECT, cst.VERSION, cst.SPIDER)},
                        ins='Fail to schedule', set_to_second=True)
 
 
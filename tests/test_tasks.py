@@ -10,7 +10,7 @@ from tests.utils import cst, req, req_single_scrapyd, sleep, switch_scrapyd, upl
 
 NODE = 2
 metadata = {}
-FILENAME = '%s_%s_%s.pickle' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
+FILENAME = '%s_%s_%s.json' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
 check_data = dict(
     project=cst.PROJECT,
     _version=cst.VERSION,
@@ -335,9 +335,10 @@ def test_delete_task_or_task_result_on_the_fly(app, client):
         __, js = req(app, client, view='tasks.xhr', kws=dict(node=NODE, action='list', task_id=task_id))
         assert len(js['ids']) == 1
         task_result_id = js['ids'][0]
+        # The results of all nodes would be inserted together after the retries on node 2
         __, js = req(app, client, view='tasks.xhr',
                      kws=dict(node=NODE, action='list', task_id=task_id, task_result_id=task_result_id))
-        assert len(js['ids']) == 1
+        assert len(js['ids']) == 0
 
         if kind == 'delete_task':
             req(app, client, view='tasks.xhr',
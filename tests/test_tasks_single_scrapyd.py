@@ -14,8 +14,8 @@ from tests.utils import cst, req_single_scrapyd, sleep, upload_file_deploy
 NODE = 1
 NAME = u"""Chinese' "中文"""
 VALUE = u"""Test' "测试"""
-FILENAME = '%s_%s_%s.pickle' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
-FILENAME_DV = '%s_%s_%s.pickle' % (cst.PROJECT, 'default-the-latest-version', cst.SPIDER)
+FILENAME = '%s_%s_%s.json' % (cst.PROJECT, cst.VERSION, cst.SPIDER)
+FILENAME_DV = '%s_%s_%s.json' % (cst.PROJECT, 'default-the-latest-version', cst.SPIDER)
 TITLE = '/'.join([cst.PROJECT, cst.VERSION, cst.SPIDER, cst.JOBID])
 TITLE_DV = '/'.join([cst.PROJECT, cst.DEFAULT_LATEST_VERSION, cst.SPIDER, cst.JOBID])
 metadata = {}
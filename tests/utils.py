@@ -15,7 +15,7 @@ from flask import url_for
 from six import string_types
 
 from logparser import __version__ as logparser_version
-from scrapydweb.vars import DATABASE_PATH, LEGAL_NAME_PATTERN, STATS_PATH, setup_logfile
+from scrapydweb.vars import DATABASE_PATH, STATS_PATH, setup_logfile
 
 
 class Constant(object):
@@ -275,8 +275,6 @@ def setup_env(custom_settings):
         if os.path.exists(path):
             os.remove(path)
             print("Deleted: %s" % path)
-    node = re.sub(LEGAL_NAME_PATTERN, '-', re.sub(r'[.:]', '_', custom_settings['_SCRAPYD_SERVER']))
-    custom_settings['BACKUP_DEMO_JSON_PATH'] = os.path.join(STATS_PATH, node, cst.PROJECT, cst.SPIDER, cst.DEMO_JSON)
 
 
 def upload_file_deploy(app, client, filename, project, multinode=False,